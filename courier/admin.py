@@ -1,6 +1,23 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .models import CustomUser, Branch, Shipment, CourierStaff, Payment
+from .pagination import EstimatedCountPaginator
+from .search import MAX_RESULTS, search_shipment_ids
+
+# -------------------------------
+# Large-table defaults
+# -------------------------------
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables with millions of rows: estimated counts
+    instead of COUNT(*), no second "show all" count, primary-key ordering
+    that the index can serve, and raw-ID widgets instead of select boxes
+    listing every related row.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    ordering = ('-id',)
 
 # -------------------------------
 # CustomUser Admin
@@ -14,8 +31,12 @@ class CustomUserAdmin(UserAdmin):
     add_fieldsets = UserAdmin.add_fieldsets + (
         (None, {'fields': ('role',)}),
     )
-    search_fields = ('username', 'email')
+    # prefix matches, so partial names still find users (and the
+    # autocomplete widgets can suggest as you type) without a full LIKE scan
+    search_fields = ('username__istartswith', 'email__istartswith')
     ordering = ('username',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 admin.site.register(CustomUser, CustomUserAdmin)
 
@@ -26,17 +47,30 @@ class BranchAdmin(admin.ModelAdmin):
     list_display = ('name', 'location', 'manager', 'contact_number')
     search_fields = ('name', 'location', 'manager__username')
     list_filter = ('manager',)
+    list_select_related = ('manager',)
+    autocomplete_fields = ('manager',)
 
 admin.site.register(Branch, BranchAdmin)
 
 # -------------------------------
 # Shipment Admin
 # -------------------------------
-class ShipmentAdmin(admin.ModelAdmin):
+class ShipmentAdmin(LargeTableAdmin):
     list_display = ('tracking_number', 'sender_name', 'receiver_name', 'status', 'branch', 'created_by')
     search_fields = ('tracking_number', 'sender_name', 'receiver_name')
-    list_filter = ('status', 'branch', 'created_by')
+    # created_by would render one filter link per customer; search covers it
+    list_filter = ('status', 'service_type', 'branch')
+    list_select_related = ('branch', 'created_by')
     readonly_fields = ('tracking_number',)  # optional: auto-generate tracking number in save()
+    raw_id_fields = ('created_by', 'courier')
+    autocomplete_fields = ('branch',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # served by the full-text index instead of icontains scans
+        if not search_term:
+            return queryset, False
+        ids = search_shipment_ids(search_term, limit=MAX_RESULTS)
+        return queryset.filter(id__in=ids), False
 
     # Automatically generate tracking number if not set
     def save_model(self, request, obj, form, change):
@@ -50,19 +84,23 @@ admin.site.register(Shipment, ShipmentAdmin)
 # -------------------------------
 # CourierStaff Admin
 # -------------------------------
-class CourierStaffAdmin(admin.ModelAdmin):
+class CourierStaffAdmin(LargeTableAdmin):
     list_display = ('user', 'branch')
-    search_fields = ('user__username', 'branch__name')
-    filter_horizontal = ('assigned_shipments',)
+    search_fields = ('user__username__istartswith', 'branch__name')
+    list_select_related = ('user', 'branch')
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('branch',)
 
 admin.site.register(CourierStaff, CourierStaffAdmin)
 
 # -------------------------------
 # Payment Admin
 # -------------------------------
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(LargeTableAdmin):
     list_display = ('shipment', 'payment_type', 'amount', 'status', 'payment_date')
     list_filter = ('payment_type', 'status')
-    search_fields = ('shipment__tracking_number',)
+    search_fields = ('shipment__tracking_number__exact',)
+    list_select_related = ('shipment',)
+    raw_id_fields = ('shipment',)
 
 admin.site.register(Payment, PaymentAdmin)
@@ -0,0 +1,259 @@
+# courier/analytics.py
+
+import numpy as np
+from django.db.models import Max, Min, Q
+from . import sharding
+from .models import Branch, Shipment, ShipmentTracking
+
+# ---------------------------
+# Histogram layout
+# ---------------------------
+# Transit times are bucketed in half-hour bins up to 30 days; anything longer
+# lands in the last (overflow) bin. Lateness is bucketed hourly from a week
+# early to a week late, clipped at both ends; each lateness bin holds its
+# upper edge, so an exactly on-time delivery is counted as early, not late.
+TRANSIT_BIN_HOURS = 0.5
+TRANSIT_MAX_HOURS = 24 * 30
+TRANSIT_BINS = int(TRANSIT_MAX_HOURS / TRANSIT_BIN_HOURS) + 1
+
+LATENESS_MIN_HOURS = -24 * 7
+LATENESS_MAX_HOURS = 24 * 7
+LATENESS_BINS = LATENESS_MAX_HOURS - LATENESS_MIN_HOURS + 1
+
+# Coarse lateness buckets reported by the API, as (label, inclusive upper edge in hours)
+LATENESS_BUCKETS = (
+    ('early_24h_plus', -24),
+    ('early_0_24h', 0),
+    ('late_0_6h', 6),
+    ('late_6_24h', 24),
+    ('late_24_72h', 72),
+    ('late_72h_plus', None),
+)
+
+PERCENTILES = (50, 90, 95, 99)
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def to_epoch_hours(values):
+    """
+    Convert a column of (possibly null) datetimes to float hours since epoch.
+    Nulls become NaN so they drop out of the vectorized comparisons.
+    """
+    return np.fromiter(
+        (v.timestamp() / 3600.0 if v is not None else np.nan for v in values),
+        dtype=np.float64,
+        count=len(values),
+    )
+
+
+def transit_bin(hours):
+    """Map transit durations (hours) to histogram bin indexes."""
+    bins = np.floor(hours / TRANSIT_BIN_HOURS).astype(np.int64)
+    return np.clip(bins, 0, TRANSIT_BINS - 1)
+
+
+def lateness_bin(hours):
+    """
+    Map lateness (hours, negative = early) to histogram bin indexes. Bin i
+    covers (LATENESS_MIN_HOURS + i, LATENESS_MIN_HOURS + i + 1].
+    """
+    bins = np.ceil(hours).astype(np.int64) - 1 - LATENESS_MIN_HOURS
+    return np.clip(bins, 0, LATENESS_BINS - 1)
+
+
+def histogram_percentiles(counts, bin_width, percentiles=PERCENTILES):
+    """
+    Compute percentiles for every row of a 2-D histogram at once.
+    Returns an array of shape (groups, len(percentiles)) holding the upper
+    edge of the bin each percentile falls into, NaN for empty groups.
+    """
+    cumulative = np.cumsum(counts, axis=1)
+    totals = cumulative[:, -1]
+    result = np.full((counts.shape[0], len(percentiles)), np.nan)
+    for col, pct in enumerate(percentiles):
+        targets = np.ceil(totals * pct / 100.0)
+        # first bin whose cumulative count reaches the target, per row
+        idx = (cumulative < targets[:, None]).sum(axis=1)
+        edges = (idx + 1) * bin_width
+        result[:, col] = np.where(totals > 0, edges, np.nan)
+    return result
+
+
+# ---------------------------
+# SLA accumulator
+# ---------------------------
+class SLAAccumulator:
+    """
+    Bounded-memory accumulator of per (branch, service_type) SLA statistics.
+    Each chunk is folded into fixed-size count arrays with np.bincount, so
+    memory depends on the number of groups, never on the number of rows.
+    """
+
+    def __init__(self, branch_ids, service_types):
+        # group 0 along the branch axis is reserved for shipments without a branch
+        self.branch_ids = np.array(sorted(branch_ids), dtype=np.int64)
+        self.service_types = np.array(sorted(service_types))
+        self.n_groups = (len(self.branch_ids) + 1) * len(self.service_types)
+
+        self.shipments = np.zeros(self.n_groups, dtype=np.int64)
+        self.delivered = np.zeros(self.n_groups, dtype=np.int64)
+        self.with_eta = np.zeros(self.n_groups, dtype=np.int64)
+        self.on_time = np.zeros(self.n_groups, dtype=np.int64)
+        self.transit = np.zeros((self.n_groups, TRANSIT_BINS), dtype=np.int64)
+        self.lateness = np.zeros((self.n_groups, LATENESS_BINS), dtype=np.int64)
+
+    def group_index(self, branch_ids, service_types):
+        """
+        Vectorized (branch_id, service_type) -> group index. Branch ids not
+        in the accumulator (dangling references) fall into the no-branch group.
+        """
+        branch_ids = np.asarray(branch_ids, dtype=np.int64)
+        branch_idx = np.searchsorted(self.branch_ids, branch_ids) + 1
+        branch_idx = np.where(np.isin(branch_ids, self.branch_ids), branch_idx, 0)
+        service_idx = np.searchsorted(self.service_types, np.asarray(service_types))
+        return branch_idx * len(self.service_types) + service_idx
+
+    def add(self, groups, started, delivered, estimated):
+        """
+        Fold one chunk in. All arguments are equal-length arrays; times are
+        epoch hours with NaN for missing values.
+        """
+        n = self.n_groups
+        self.shipments += np.bincount(groups, minlength=n)
+
+        done = ~np.isnan(delivered)
+        self.delivered += np.bincount(groups[done], minlength=n)
+
+        has_transit = done & ~np.isnan(started)
+        g = groups[has_transit]
+        bins = transit_bin(np.maximum(delivered[has_transit] - started[has_transit], 0.0))
+        self.transit += np.bincount(
+            g * TRANSIT_BINS + bins, minlength=n * TRANSIT_BINS
+        ).reshape(n, TRANSIT_BINS)
+
+        has_eta = done & ~np.isnan(estimated)
+        g = groups[has_eta]
+        late_hours = delivered[has_eta] - estimated[has_eta]
+        self.with_eta += np.bincount(g, minlength=n)
+        self.on_time += np.bincount(g[late_hours <= 0], minlength=n)
+        self.lateness += np.bincount(
+            g * LATENESS_BINS + lateness_bin(late_hours), minlength=n * LATENESS_BINS
+        ).reshape(n, LATENESS_BINS)
+
+    def lateness_buckets(self):
+        """Collapse the hourly lateness histogram into LATENESS_BUCKETS."""
+        starts = [0]
+        for _, upper in LATENESS_BUCKETS[:-1]:
+            starts.append(upper - LATENESS_MIN_HOURS)
+        return np.add.reduceat(self.lateness, starts, axis=1)
+
+    def results(self):
+        transit_pct = histogram_percentiles(self.transit, TRANSIT_BIN_HOURS)
+        buckets = self.lateness_buckets()
+        n_services = len(self.service_types)
+
+        rows = []
+        for group in np.flatnonzero(self.shipments):
+            branch_pos, service_pos = divmod(int(group), n_services)
+            with_eta = int(self.with_eta[group])
+            rows.append({
+                'branch_id': int(self.branch_ids[branch_pos - 1]) if branch_pos else None,
+                'service_type': str(self.service_types[service_pos]),
+                'shipments': int(self.shipments[group]),
+                'delivered': int(self.delivered[group]),
+                'on_time_rate': round(self.on_time[group] / with_eta, 4) if with_eta else None,
+                'transit_hours': {
+                    f'p{pct}': (None if np.isnan(value) else float(value))
+                    for pct, value in zip(PERCENTILES, transit_pct[group])
+                },
+                'lateness': {
+                    label: int(count)
+                    for (label, _), count in zip(LATENESS_BUCKETS, buckets[group])
+                },
+            })
+        return rows
+
+
+# ---------------------------
+# Chunked extraction
+# ---------------------------
+def iter_shipment_chunks(shipments, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield (ids, branch_ids, service_types, estimated, delivery_date) column
+    arrays for a shipment queryset, walking the primary key in keyset order.
+    """
+    last_id = 0
+    while True:
+        rows = list(
+            shipments.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'branch_id', 'service_type', 'estimated_delivery', 'delivery_date'
+            )[:chunk_size]
+        )
+        if not rows:
+            return
+        ids, branch_ids, service_types, estimated, delivery_date = zip(*rows)
+        yield (
+            np.array(ids, dtype=np.int64),
+            np.array([b or 0 for b in branch_ids], dtype=np.int64),
+            np.array(service_types),
+            to_epoch_hours(estimated),
+            to_epoch_hours(delivery_date),
+        )
+        last_id = rows[-1][0]
+
+
+def tracking_timeline(ids, using='default'):
+    """
+    First event and 'delivered' event times (epoch hours) for the given
+    shipment ids on shard `using`, aligned to `ids`. Aggregated in the
+    database so only one row per shipment crosses the wire.
+    """
+    rows = list(
+        ShipmentTracking.objects.using(using)
+        .filter(shipment_id__gte=ids[0], shipment_id__lte=ids[-1])
+        .values('shipment_id')
+        .annotate(first=Min('updated_at'), delivered=Max('updated_at', filter=Q(status='delivered')))
+        .values_list('shipment_id', 'first', 'delivered')
+    )
+    started = np.full(len(ids), np.nan)
+    delivered = np.full(len(ids), np.nan)
+    if rows:
+        shipment_ids, first, last = zip(*rows)
+        shipment_ids = np.array(shipment_ids, dtype=np.int64)
+        pos = np.searchsorted(ids, shipment_ids)
+        found = (pos < len(ids)) & (ids[np.minimum(pos, len(ids) - 1)] == shipment_ids)
+        started[pos[found]] = to_epoch_hours(first)[found]
+        delivered[pos[found]] = to_epoch_hours(last)[found]
+    return started, delivered
+
+
+def compute_sla_report(branch_id=None, service_type=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    On-time rate, lateness distribution and transit-time percentiles per
+    branch and service type.
+
+    Transit time runs from the first tracking event to delivery; the delivery
+    time is `Shipment.delivery_date`, falling back to the 'delivered' tracking
+    event. Lateness is delivery time minus `estimated_delivery`. Every shard
+    is walked in turn into the same accumulator.
+    """
+    shipments = Shipment.objects.all()
+    if branch_id:
+        shipments = shipments.filter(branch_id=branch_id)
+    if service_type:
+        shipments = shipments.filter(service_type=service_type)
+
+    # soft-deleted branches keep their shipments until the delete job runs
+    accumulator = SLAAccumulator(
+        Branch.all_objects.values_list('id', flat=True),
+        [s[0] for s in Shipment.SERVICE_CHOICES],
+    )
+    for shard in sharding.scatter(shipments):
+        for ids, branch_ids, service_types, estimated, delivery_date in iter_shipment_chunks(shard, chunk_size):
+            started, tracked_delivery = tracking_timeline(ids, using=shard.db)
+            delivered = np.where(np.isnan(delivery_date), tracked_delivery, delivery_date)
+            accumulator.add(
+                accumulator.group_index(branch_ids, service_types),
+                started, delivered, estimated,
+            )
+    return accumulator.results()
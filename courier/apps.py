@@ -7,3 +7,10 @@ class CourierConfig(AppConfig):
 
     def ready(self):
         import courier.signals
+        # modules registering background jobs
+        import courier.branches
+        import courier.exports
+        import courier.onboarding
+        from django.db.models.signals import post_migrate
+        from courier.sharding import reserve_id_ranges
+        post_migrate.connect(reserve_id_ranges, sender=self)
@@ -0,0 +1,106 @@
+# courier/archive.py
+
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from . import search, sharding
+from .models import (
+    Shipment, ShipmentTracking, Payment, Notification,
+    ArchivedShipment, ArchivedShipmentTracking, ArchivedPayment, ArchivedNotification,
+)
+
+TERMINAL_STATUSES = ('delivered', 'cancelled')
+DEFAULT_RETENTION_DAYS = 180
+DEFAULT_BATCH_SIZE = 1000
+
+# hot model -> archive model, in insert order (parents first)
+ARCHIVE_MODELS = (
+    (Shipment, ArchivedShipment),
+    (ShipmentTracking, ArchivedShipmentTracking),
+    (Payment, ArchivedPayment),
+    (Notification, ArchivedNotification),
+)
+
+
+def _copied_fields(archive_model):
+    """Column attnames shared by a hot model and its archive copy."""
+    return [f.attname for f in archive_model._meta.concrete_fields if f.name != 'archived_at']
+
+
+# ---------------------------
+# Candidate selection
+# ---------------------------
+def archivable_shipments(older_than_days=DEFAULT_RETENTION_DAYS):
+    """
+    Terminal shipments with no activity in the last `older_than_days` days.
+    A shipment's age is taken from its tracking history, falling back to
+    delivery_date for shipments that have none.
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    tracking = ShipmentTracking.objects.filter(shipment=OuterRef('pk'))
+    return (
+        Shipment.objects
+        .filter(status__in=TERMINAL_STATUSES)
+        .exclude(delivery_date__gte=cutoff)
+        .filter(~Exists(tracking.filter(updated_at__gte=cutoff)))
+        .filter(Q(Exists(tracking)) | Q(delivery_date__lt=cutoff))
+    )
+
+
+# ---------------------------
+# Batch move
+# ---------------------------
+def archive_batch(shipment_ids):
+    """
+    Move the given shipments and their tracking, payment and notification
+    rows into the archive tables in one transaction. Safe to re-run: rows
+    already copied by an interrupted run are skipped on insert.
+    """
+    for shard, ids in sharding.group_by_shard(shipment_ids).items():
+        # the archive and notifications are on 'default', the rest on the shard
+        with transaction.atomic(using=shard), transaction.atomic():
+            for hot_model, archive_model in ARCHIVE_MODELS:
+                fields = _copied_fields(archive_model)
+                hot_rows = hot_model.objects.using('default' if hot_model is Notification else shard)
+                if hot_model is Shipment:
+                    rows = hot_rows.filter(id__in=ids)
+                else:
+                    rows = hot_rows.filter(shipment_id__in=ids)
+                archive_model.objects.bulk_create(
+                    [archive_model(**row) for row in rows.values(*fields)],
+                    ignore_conflicts=True,
+                )
+
+            # children first so the shipment delete has nothing left to cascade
+            Notification.objects.filter(shipment_id__in=ids).delete()
+            for hot_model, _ in reversed(ARCHIVE_MODELS[1:-1]):
+                hot_model.objects.using(shard).filter(shipment_id__in=ids).delete()
+            Shipment.objects.using(shard).filter(id__in=ids).delete()
+            search.unindex_shipments(ids)
+    return len(shipment_ids)
+
+
+def archive_shipments(older_than_days=DEFAULT_RETENTION_DAYS, batch_size=DEFAULT_BATCH_SIZE,
+                      max_batches=None, start_after=0, progress=None):
+    """
+    Archive every eligible shipment in primary-key order, one batch per
+    transaction. Returns (archived count, last shipment id processed); pass
+    the id back as `start_after` to resume an interrupted run without
+    rescanning the rows before it.
+    """
+    last_id = start_after
+    archived = 0
+    batches = 0
+    # shards in id order (see sharding.ID_SPAN), so last_id resumes across them
+    for candidates in sharding.scatter(archivable_shipments(older_than_days).order_by('id')):
+        while max_batches is None or batches < max_batches:
+            ids = list(candidates.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            archived += archive_batch(ids)
+            last_id = ids[-1]
+            batches += 1
+            if progress:
+                progress(archived, last_id)
+    return archived, last_id
@@ -0,0 +1,397 @@
+# courier/benchmarks.py
+
+import json
+import logging
+import time
+import tracemalloc
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve, reverse
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import jobs, urls as courier_urls
+from .middleware import BROTLI_QUALITY, brotli
+from .models import BackgroundJob, CustomUser, Branch, Shipment, CourierStaff, Payment
+from .helpers import with_shipment_relations
+from .renderers import FastJSONRenderer, MessagePackRenderer, orjson
+from .serializers import ShipmentSummaryRows, ShipmentSummarySerializer
+from .throttling import RoleTokenBucketThrottle, take_tokens
+from .seeding import SEED_PASSWORD
+
+DEFAULT_ITERATIONS = 10
+WARMUP_ITERATIONS = 2
+
+
+# ---------------------------
+# Fixtures
+# ---------------------------
+def load_fixtures():
+    """
+    Pick representative users and objects out of a seeded database for the
+    endpoint cases below.
+    """
+    branch = Branch.objects.filter(staff_members__isnull=False).order_by('id').first()
+    courier = CourierStaff.objects.filter(branch=branch).select_related('user').order_by('id').first()
+    customer = (
+        CustomUser.objects.filter(role='customer', shipments__isnull=False).order_by('id').first()
+    )
+    admin = CustomUser.objects.filter(role='admin').order_by('id').first()
+    return {
+        'admin': admin,
+        'super_manager': CustomUser.objects.filter(role='super_manager').order_by('id').first(),
+        'manager': branch.manager,
+        'staff': courier.user,
+        'customer': customer,
+        'branch': branch,
+        'courier': courier,
+        'customer_shipment': Shipment.objects.filter(created_by=customer).order_by('id').first(),
+        'courier_shipment': (
+            Shipment.objects.filter(courier=courier, status='out_for_delivery').order_by('id').first()
+            or Shipment.objects.filter(branch=branch).order_by('id').first()
+        ),
+        'branch_shipment': Shipment.objects.filter(branch=branch).order_by('id').first(),
+        'export_job': _finished_export(admin),
+    }
+
+
+def _finished_export(user):
+    job = BackgroundJob.objects.create(kind='export', params={'format': 'csv', 'status': 'cancelled'}, created_by=user)
+    jobs.run_job(job.pk)
+    return job
+
+
+def _new_shipment():
+    return {
+        'sender_name': 'Bench Sender', 'sender_address': 'House 1, Mall Road, Lahore',
+        'receiver_name': 'Bench Receiver', 'receiver_address': 'House 2, Canal Road, Lahore',
+        'weight': '1.50', 'package_type': 'parcel',
+    }
+
+
+def _reconciliation_file(rows=500):
+    """A cash-in CSV settling up to `rows` pending payments."""
+    pending = Payment.objects.filter(status='pending').values_list('shipment__tracking_number', 'amount')[:rows]
+    lines = ['tracking_number,amount'] + [f'{number},{amount}' for number, amount in pending]
+    return {'file': SimpleUploadedFile('payments.csv', '\n'.join(lines).encode(), content_type='text/csv')}
+
+
+# url name -> (method, acting role, url kwargs, request data)
+# kwargs and data are callables taking the fixtures dict.
+ENDPOINT_CASES = {
+    'token_obtain_pair': ('post', None, None, lambda f: {'email': f['customer'].email, 'password': SEED_PASSWORD}),
+    'token_refresh': ('post', None, None, lambda f: {'refresh': str(RefreshToken.for_user(f['customer']))}),
+    'customer-shipments': ('get', 'customer', None, None),
+    'create-shipment': ('post', 'customer', None, lambda f: _new_shipment()),
+    'track-shipment': ('get', 'customer', None, lambda f: {'tracking_number': f['customer_shipment'].tracking_number}),
+    'cancel-shipment': ('post', 'customer', lambda f: {'shipment_id': f['customer_shipment'].id}, None),
+    'courier-shipments': ('get', 'staff', None, None),
+    'courier-manifest': ('get', 'staff', None, None),
+    'update-shipment-status': ('post', 'staff', lambda f: {'shipment_id': f['courier_shipment'].id}, lambda f: {'status': 'delivered'}),
+    'list-users': ('get', 'admin', None, None),
+    'create-user': ('post', None, None, lambda f: {'username': 'benchuser', 'email': 'bench@example.com', 'password': 'x' * 12}),
+    'user-detail': ('get', 'admin', lambda f: {'user_id': f['customer'].id}, None),
+    'change-password': ('post', 'customer', None, lambda f: {'old_password': SEED_PASSWORD, 'new_password': 'y' * 12}),
+    'notification-inbox': ('get', 'customer', None, None),
+    'notification-mark-read': ('post', 'customer', None, lambda f: {'all': True}),
+    'branch-shipments': ('get', 'manager', lambda f: {'branch_id': f['branch'].id}, None),
+    'assign-courier': ('post', 'manager', lambda f: {'shipment_id': f['branch_shipment'].id}, lambda f: {'courier_id': f['courier'].id}),
+    'list-staff': ('get', 'super_manager', None, None),
+    'list-managers': ('get', 'super_manager', None, None),
+    'import-users': ('post', 'super_manager', None, lambda f: [
+        {'username': 'benchrider', 'email': 'rider@example.com', 'password': 'x' * 12,
+         'role': 'staff', 'branch': str(f['branch'].id)},
+    ]),
+    'list-branches': ('get', 'admin', None, None),
+    'create-branch': ('post', 'admin', None, lambda f: {'name': 'Bench', 'location': 'Lahore', 'contact_number': '0300'}),
+    'update-branch': ('put', 'admin', lambda f: {'branch_id': f['branch'].id}, lambda f: {'opening_hours': '24/7'}),
+    'delete-branch': ('delete', 'admin', lambda f: {'branch_id': f['branch'].id}, None),
+    'all-shipments': ('get', 'admin', None, None),
+    'reconcile-payments': ('post', 'admin', None, lambda f: _reconciliation_file()),
+    'shipment-changes': ('get', 'admin', None, None),
+    'shipment-search': ('get', 'admin', None, lambda f: {'q': f['customer_shipment'].receiver_name.split()[0]}),
+    'create-export': ('post', 'admin', None, lambda f: {'format': 'csv', 'status': 'delivered'}),
+    'export-download': ('get', 'admin', lambda f: {'job_id': f['export_job'].id}, None),
+    'job-detail': ('get', 'admin', lambda f: {'job_id': f['export_job'].id}, None),
+    'sla-report': ('get', 'admin', None, None),
+    'metrics': ('get', None, None, None),
+}
+
+
+def uncovered_endpoints():
+    """Names of courier URLs that have no benchmark case yet."""
+    return sorted(p.name for p in courier_urls.urlpatterns if p.name not in ENDPOINT_CASES)
+
+
+# ---------------------------
+# Measurement
+# ---------------------------
+class QueryCounter:
+    # execute_wrapper instead of CaptureQueriesContext, whose log is capped
+    # at 9000 queries and would under-count the worst endpoints
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _request(client, method, url, data):
+    # every request runs in a rolled-back transaction so mutating endpoints
+    # see the same data on each iteration
+    counter = QueryCounter()
+    uploads = [value for value in (data.values() if isinstance(data, dict) else ()) if hasattr(value, 'seek')]
+    for upload in uploads:
+        upload.seek(0)
+    with transaction.atomic():
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data, format='multipart' if uploads else 'json')
+            if response.streaming:
+                # file downloads: the body is only read as the client consumes it
+                body = b''.join(response.streaming_content)
+                response.close()
+                response = HttpResponse(body, status=response.status_code)
+            elapsed = time.perf_counter() - start
+        transaction.set_rollback(True)
+    return response, elapsed, counter.count
+
+
+def benchmark_endpoint(name, fixtures, iterations=DEFAULT_ITERATIONS):
+    """Latency percentiles (ms), query count and peak allocations for one URL."""
+    method, role, kwargs, data = ENDPOINT_CASES[name]
+    client = APIClient(raise_request_exception=False)
+    if role:
+        client.force_authenticate(fixtures[role])
+    url = reverse(name, kwargs=kwargs(fixtures) if kwargs else None)
+    data = data(fixtures) if data else None
+
+    for _ in range(WARMUP_ITERATIONS):
+        _request(client, method, url, data)
+
+    timings = []
+    for _ in range(iterations):
+        response, elapsed, query_count = _request(client, method, url, data)
+        timings.append(elapsed * 1000)
+
+    tracemalloc.start()
+    try:
+        _request(client, method, url, data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        'status': response.status_code,
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'queries': query_count,
+        'peak_kib': round(peak / 1024, 1),
+        'response_bytes': len(response.content),
+    }
+
+
+def run_api_benchmarks(iterations=DEFAULT_ITERATIONS, names=None, progress=None):
+    """Benchmark every endpoint (or just `names`) against the current data."""
+    fixtures = load_fixtures()
+    results = {}
+    # failing endpoints are recorded by status code; keep their tracebacks out of the report
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.CRITICAL)
+    # every case calls its endpoint as the same user, far past the rate
+    # limits; throttling overhead is measured by benchmark_throttle instead
+    try:
+        with override_settings(THROTTLE_ENABLED=False):
+            for name in names or ENDPOINT_CASES:
+                results[name] = benchmark_endpoint(name, fixtures, iterations)
+                if progress:
+                    progress(name, results[name])
+    finally:
+        request_logger.setLevel(level)
+    return results
+
+
+# ---------------------------
+# Renderers and compression
+# ---------------------------
+RENDER_CASES = ('all-shipments', 'branch-shipments', 'customer-shipments')
+
+
+def renderer_variants():
+    """name -> renderer instance: the stock JSONRenderer and the fast ones that can run here."""
+    variants = {'drf-json': JSONRenderer()}
+    if orjson is not None:
+        variants['orjson'] = FastJSONRenderer()
+    if MessagePackRenderer.available:
+        variants['msgpack'] = MessagePackRenderer()
+    return variants
+
+
+def benchmark_renderers(data, iterations=DEFAULT_ITERATIONS):
+    """
+    Render time (ms) of the same response data through every renderer, with
+    the body size raw and after each content encoding the middleware applies.
+    """
+    results = {}
+    for name, renderer in renderer_variants().items():
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            body = renderer.render(data, renderer.media_type, {})
+            timings.append((time.perf_counter() - start) * 1000)
+        sizes = {'identity': len(body), 'gzip': len(compress_string(body))}
+        if brotli is not None:
+            sizes['br'] = len(brotli.compress(body, quality=BROTLI_QUALITY))
+        results[name] = {
+            'p50_ms': round(float(np.percentile(timings, 50)), 3),
+            'p95_ms': round(float(np.percentile(timings, 95)), 3),
+            'bytes': sizes,
+        }
+    return results
+
+
+def run_renderer_benchmarks(iterations=DEFAULT_ITERATIONS, names=None, progress=None):
+    """Benchmark rendering of the large list responses against the current data."""
+    fixtures = load_fixtures()
+    results = {}
+    for name in names or RENDER_CASES:
+        method, role, kwargs, data = ENDPOINT_CASES[name]
+        client = APIClient()
+        client.force_authenticate(fixtures[role])
+        response = client.get(reverse(name, kwargs=kwargs(fixtures) if kwargs else None))
+        results[name] = benchmark_renderers(response.data, iterations)
+        if progress:
+            progress(name, results[name])
+    return results
+
+
+# ---------------------------
+# List serialization
+# ---------------------------
+def serializer_variants():
+    """name -> function serializing a Shipment queryset as the list endpoints do."""
+    return {
+        'model': lambda shipments: ShipmentSummarySerializer(
+            with_shipment_relations(shipments, history=False), many=True,
+        ).data,
+        'values': lambda shipments: ShipmentSummaryRows(shipments).data,
+    }
+
+
+def benchmark_serializers(iterations=DEFAULT_ITERATIONS):
+    """
+    Rows per second (at the median run, queries included) and peak
+    allocations of serializing every shipment through the model serializer
+    and through the values() rows path.
+    """
+    shipments = Shipment.objects.order_by('-pickup_date')
+    results = {}
+    for name, serialize in serializer_variants().items():
+        for _ in range(WARMUP_ITERATIONS):
+            serialize(shipments)
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            rows = len(serialize(shipments))
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            serialize(shipments)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        p50 = float(np.percentile(timings, 50))
+        results[name] = {
+            'rows': rows,
+            'p50_ms': round(p50 * 1000, 3),
+            'rows_per_s': round(rows / p50) if p50 else None,
+            'peak_kib': round(peak / 1024, 1),
+        }
+    return results
+
+
+# ---------------------------
+# Throttling
+# ---------------------------
+THROTTLE_CALLS = 5000
+
+
+def _percentiles_us(timings):
+    p50, p95 = np.percentile(timings, [50, 95])
+    return {'p50_us': round(float(p50) * 1e6, 2), 'p95_us': round(float(p95) * 1e6, 2)}
+
+
+def benchmark_throttle(user, calls=THROTTLE_CALLS):
+    """
+    Per-request cost (microseconds) of the rate limit check: the normal path
+    (mostly served from the in-process lease), the shared-cache bucket on
+    its own (the cost of every lease refill), and the check with throttling
+    disabled for reference.
+    """
+    url = reverse('track-shipment')
+    request = RequestFactory().get(url, {'tracking_number': 'BENCHMARK'})
+    request.user = user
+    request.resolver_match = resolve(url)
+    throttle = RoleTokenBucketThrottle()
+
+    def run(check):
+        timings = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            check()
+            timings.append(time.perf_counter() - start)
+        return _percentiles_us(timings)
+
+    results = {}
+    # a rate high enough that nothing is refused while measuring
+    with override_settings(THROTTLE_RATES={'default': {user.role: f'{calls * 100}/s'}}):
+        results['leased'] = run(lambda: throttle.allow_request(request, None))
+        results['shared'] = run(lambda: take_tokens('courier:throttle:benchmark', 1, calls * 100, 1.0))
+    with override_settings(THROTTLE_ENABLED=False):
+        results['disabled'] = run(lambda: throttle.allow_request(request, None))
+    return results
+
+
+# ---------------------------
+# Baselines
+# ---------------------------
+def write_baseline(path, results, meta):
+    with open(path, 'w') as fh:
+        json.dump({'meta': meta, 'results': results}, fh, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as fh:
+        return json.load(fh)['results']
+
+
+def compare_results(baseline, results, tolerance=0.25, min_delta_ms=1.0):
+    """
+    Regressions of `results` against `baseline`, both keyed by
+    scale -> endpoint. A regression is a p95 slower by more than `tolerance`
+    (and at least `min_delta_ms`), or any increase in query count.
+    """
+    regressions = []
+    for scale, endpoints in results.items():
+        for name, current in endpoints.items():
+            previous = baseline.get(scale, {}).get(name)
+            if not previous:
+                continue
+            slower = current['p95_ms'] - previous['p95_ms']
+            if slower > min_delta_ms and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f"{scale}/{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms"
+                )
+            if current['queries'] > previous['queries']:
+                regressions.append(
+                    f"{scale}/{name}: queries {previous['queries']} -> {current['queries']}"
+                )
+    return regressions
@@ -0,0 +1,76 @@
+# courier/branches.py
+
+from django.db import transaction
+from django.utils import timezone
+from . import changefeed, jobs, sharding
+from .models import ArchivedShipment, Branch, CourierStaff, Rate, Shipment, TransitProfile
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def delete_branch(branch, user=None):
+    """
+    Hide the branch at once and queue the job that detaches its dependants
+    and deletes the row. Returns the job.
+    """
+    with transaction.atomic():
+        branch.deleted_at = timezone.now()
+        branch.save(update_fields=['deleted_at'])
+        return jobs.enqueue('delete-branch', user=user, branch_id=branch.pk)
+
+
+def _in_batches(queryset, batch_size, apply):
+    """
+    Call apply(ids) on `queryset` batch_size ids at a time, each batch in
+    its own transaction, until no row is left. Yields each batch's size.
+    """
+    while True:
+        with transaction.atomic(using=queryset.db):
+            ids = list(queryset.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return
+            apply(ids)
+        yield len(ids)
+
+
+def _detach_shipments(shipments):
+    def apply(ids):
+        # update() sends no post_save; the branch is not in the search index
+        shipments.filter(id__in=ids).update(branch=None, updated_at=timezone.now())
+        changefeed.record_changes('shipment', ids)
+    return apply
+
+
+@jobs.register('delete-branch')
+def run_branch_delete(job, progress):
+    """
+    Detach or remove what refers to a soft-deleted branch with set-based
+    statements in bounded batches, then delete the branch row, so no
+    single transaction holds locks for long. Rates and transit profiles are
+    deleted; shipments (on every shard), their archived copies and courier
+    staff keep their rows with the branch cleared. Safe to re-run: each
+    pass only finds what is still attached.
+    """
+    branch_id = job.params['branch_id']
+    batch_size = job.params.get('batch_size', DEFAULT_BATCH_SIZE)
+
+    deletes = [Rate.objects.filter(branch_id=branch_id), TransitProfile.objects.filter(branch_id=branch_id)]
+    couriers = CourierStaff.objects.filter(branch_id=branch_id)
+    archived = ArchivedShipment.objects.filter(branch_id=branch_id)
+    shipments = sharding.scatter(Shipment.objects.filter(branch_id=branch_id))
+    progress(0, total=sum(queryset.count() for queryset in [*deletes, couriers, archived, *shipments]))
+
+    steps = [(queryset, lambda ids, queryset=queryset: queryset.filter(id__in=ids).delete()) for queryset in deletes]
+    steps.append((couriers, lambda ids: couriers.filter(id__in=ids).update(branch=None)))
+    steps.append((archived, lambda ids: archived.filter(id__in=ids).update(branch=None)))
+    steps.extend((queryset, _detach_shipments(queryset)) for queryset in shipments)
+
+    processed = 0
+    for queryset, apply in steps:
+        for done in _in_batches(queryset, batch_size, apply):
+            processed += done
+            progress(processed)
+
+    # nothing is left for the deletion collector to cascade
+    Branch.all_objects.filter(pk=branch_id).delete()
+    return {'branch_id': branch_id, 'detached': processed}
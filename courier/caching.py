@@ -0,0 +1,80 @@
+# courier/caching.py
+
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+# Cached responses are keyed by a per-resource version, so they never have
+# to be deleted: bumping the version makes every old entry unreachable and
+# the cache evicts them. Versions live in the default cache, which must be
+# shared between processes (Redis, Memcached) in multi-worker deployments.
+RESPONSE_TIMEOUT = 60 * 60 * 24
+VERSION_TIMEOUT = None  # never expire, or every response would be rebuilt
+
+# resource -> models whose changes invalidate it (wired up in signals.py)
+RESOURCES = {
+    'branches': ('courier.Branch',),
+    'users': ('courier.CustomUser',),
+}
+
+
+def _version_key(resource):
+    return f'courier:version:{resource}'
+
+
+def _new_series(resource):
+    # First use, or the counter was evicted. Start from the clock rather
+    # than 1 so responses cached under an earlier series are never reused.
+    cache.add(_version_key(resource), time.time_ns(), VERSION_TIMEOUT)
+
+
+def resource_version(resource):
+    version = cache.get(_version_key(resource))
+    if version is None:
+        _new_series(resource)
+        version = cache.get(_version_key(resource))
+    return version
+
+
+def bump_version(resource):
+    """
+    Invalidate every cached response for `resource`. Runs after the current
+    transaction commits, so a concurrent reader can never cache rows from
+    before the change under the new version.
+    """
+    def bump():
+        try:
+            cache.incr(_version_key(resource))
+        except ValueError:
+            _new_series(resource)
+    transaction.on_commit(bump)
+
+
+def cached_response(request, resource, build):
+    """
+    Serve a list view from the cache: the rendered bytes are stored under
+    (resource, version, path and query string, response format), so a hit
+    skips the query, the serializer and the renderer. `build` returns the response
+    data on a miss. Call it after the view's permission checks.
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    key = 'courier:response:{}:{}:{}:{}'.format(
+        resource, resource_version(resource),
+        renderer.format if renderer else '', request.get_full_path(),
+    )
+    hit = cache.get(key)
+    if hit is not None:
+        content, content_type = hit
+        return HttpResponse(content, content_type=content_type)
+
+    response = Response(build())
+
+    def store(rendered):
+        if rendered.status_code == 200:
+            cache.set(key, (rendered.content, rendered['Content-Type']), RESPONSE_TIMEOUT)
+        return rendered
+
+    response.add_post_render_callback(store)
+    return response
@@ -0,0 +1,152 @@
+# courier/changefeed.py
+
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from . import sharding
+from .models import ChangeLogEntry, Shipment, ShipmentTracking
+from .pagination import decode_cursor, encode_cursor
+
+DEFAULT_RETENTION_DAYS = 30
+
+# Columns sent for each changed row; foreign keys as plain ids
+SHIPMENT_FIELDS = (
+    'id', 'tracking_number', 'sender_name', 'sender_address', 'receiver_name', 'receiver_address',
+    'weight', 'package_type', 'service_type', 'status', 'pickup_date', 'delivery_date',
+    'estimated_delivery', 'created_by_id', 'branch_id', 'courier_id', 'notes', 'updated_at',
+)
+TRACKING_FIELDS = ('id', 'shipment_id', 'status', 'location', 'updated_at')
+
+ENTITIES = {
+    'shipment': (Shipment, SHIPMENT_FIELDS),
+    'tracking': (ShipmentTracking, TRACKING_FIELDS),
+}
+
+
+class CursorExpired(Exception):
+    """The changes after this cursor were purged; the client has to resync in full."""
+
+
+# ---------------------------
+# Writing
+# ---------------------------
+def record_changes(entity, ids, deleted=False):
+    """
+    Append log entries for the given shipment or tracking ids. Call inside
+    the transaction that makes the change, so the entry commits with it.
+    """
+    # each entry goes to the shard of the row it describes
+    for shard, shard_ids in sharding.group_by_shard(ids).items():
+        ChangeLogEntry.objects.using(shard).bulk_create(
+            [ChangeLogEntry(entity=entity, object_id=object_id, deleted=deleted) for object_id in shard_ids]
+        )
+
+
+# ---------------------------
+# Reading
+# ---------------------------
+def _settled(queryset):
+    # Ids are handed out before commit. SQLite serializes writers so they
+    # become visible in order; with concurrent writers, entries younger than
+    # CHANGE_FEED_SETTLE_SECONDS are held back so a slower transaction with
+    # a lower id is not skipped by a cursor that already moved past it.
+    settle = getattr(settings, 'CHANGE_FEED_SETTLE_SECONDS', 0)
+    if settle:
+        queryset = queryset.filter(created_at__lte=timezone.now() - timedelta(seconds=settle))
+    return queryset
+
+
+def _shard_entries(alias, after, limit):
+    entries = list(
+        _settled(ChangeLogEntry.objects.using(alias).filter(id__gt=after))
+        .order_by('id')
+        .values_list('id', 'entity', 'object_id', 'deleted', 'created_at')[:limit + 1]
+    )
+    if entries and after and entries[0][0] > after + 1:
+        # a gap after the cursor is usually a rolled-back insert, unless
+        # the cursor's own entry is gone too
+        if not ChangeLogEntry.objects.using(alias).filter(id__lte=after).exists():
+            raise CursorExpired()
+    return entries
+
+
+def read_changes(cursor=None, limit=500):
+    """
+    One page of changes after `cursor` (None reads from the oldest entry
+    kept). Returns (changes, next cursor, whether more changes are waiting).
+
+    Entries are collapsed per object within the page, so an object changed
+    ten times appears once, with its current row. Deleted objects, and
+    objects that no longer exist when the page is read, come back as
+    tombstones: {'type', 'id', 'deleted': True}. A shipment tombstone also
+    removes its tracking events. Raises ValueError for a malformed cursor
+    and CursorExpired when the entries after it were purged.
+
+    Each shard keeps its own log, so the cursor holds one position per
+    shard and the page merges the shards' entries by time.
+    """
+    aliases = sharding.shards()
+    positions = [0] * len(aliases)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(aliases) or not all(isinstance(value, int) for value in values):
+            raise ValueError("Invalid cursor")
+        positions = values
+
+    pending = []
+    for index, (alias, after) in enumerate(zip(aliases, positions)):
+        pending.extend((created_at, index, entry_id, entity, object_id, deleted)
+                       for entry_id, entity, object_id, deleted, created_at in _shard_entries(alias, after, limit))
+    if len(aliases) > 1:
+        pending.sort()
+    has_more = len(pending) > limit
+    page = pending[:limit]
+    if not page:
+        return [], cursor, False
+
+    # last entry per object, in the order of those last entries
+    latest = {}
+    for _, index, entry_id, entity, object_id, deleted in page:
+        positions[index] = entry_id
+        latest.pop((entity, object_id), None)
+        latest[(entity, object_id)] = deleted
+
+    rows = {}
+    for entity, (model, fields) in ENTITIES.items():
+        ids = [object_id for (kind, object_id), deleted in latest.items() if kind == entity and not deleted]
+        rows[entity] = {}
+        for alias, shard_ids in sharding.group_by_shard(ids).items():
+            rows[entity].update(
+                (row['id'], row) for row in model.objects.using(alias).filter(id__in=shard_ids).values(*fields)
+            )
+
+    changes = []
+    for (entity, object_id), deleted in latest.items():
+        row = None if deleted else rows[entity].get(object_id)
+        if row is None:
+            changes.append({'type': entity, 'id': object_id, 'deleted': True})
+        else:
+            changes.append({'type': entity, **row})
+    return changes, encode_cursor(positions), has_more
+
+
+# ---------------------------
+# Retention
+# ---------------------------
+def purge_change_log(older_than_days=None, batch_size=5000):
+    """
+    Delete log entries older than CHANGE_FEED_RETENTION_DAYS in primary-key
+    batches. Returns the number deleted. Clients whose cursor is older than
+    that get CursorExpired and must resync in full.
+    """
+    if older_than_days is None:
+        older_than_days = getattr(settings, 'CHANGE_FEED_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted = 0
+    for entries in sharding.scatter(ChangeLogEntry.objects.all()):
+        while True:
+            ids = list(entries.filter(created_at__lt=cutoff).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += entries.filter(id__in=ids).delete()[0]
+    return deleted
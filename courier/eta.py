@@ -0,0 +1,192 @@
+# courier/eta.py
+
+import time
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from . import sharding
+from .analytics import (
+    PERCENTILES, TRANSIT_BIN_HOURS, TRANSIT_BINS, histogram_percentiles, to_epoch_hours, transit_bin,
+)
+from .models import ShipmentTracking, TransitProfile
+
+# Percentile of historical transit time promised to the customer
+ETA_PERCENTILE = 90
+# Fewer deliveries than this and the next coarser profile is used instead
+MIN_SAMPLES = 30
+# Used until enough history exists for a service type
+FALLBACK_HOURS = {'same_day': 6, 'overnight': 24, 'economy': 72, 'international': 168}
+DEFAULT_CHUNK_SIZE = 10000
+# How long a process keeps its copy of the tables before re-reading them
+TABLE_TTL_SECONDS = 300
+# Deliveries younger than this wait for the next refresh (ETA_SETTLE_SECONDS)
+DEFAULT_SETTLE_SECONDS = 60
+
+
+# ---------------------------
+# Lookup (in memory)
+# ---------------------------
+_table = {}
+_loaded_at = None
+
+
+def load_table():
+    """(branch_id, service_type) -> promised transit hours, for every usable profile."""
+    key = f'p{ETA_PERCENTILE}'
+    return {
+        (branch_id, service_type): percentiles[key]
+        for branch_id, service_type, samples, percentiles in TransitProfile.objects.values_list(
+            'branch_id', 'service_type', 'samples', 'percentiles'
+        )
+        if samples >= MIN_SAMPLES and percentiles.get(key) is not None
+    }
+
+
+def transit_hours(branch_id, service_type):
+    """
+    Promised transit time for a new assignment: the branch's own profile,
+    else the network-wide one, else the fixed service offset. Only a dict
+    lookup, except once per TABLE_TTL_SECONDS when the tables are re-read.
+    """
+    global _table, _loaded_at
+    now = time.monotonic()
+    if _loaded_at is None or now - _loaded_at > TABLE_TTL_SECONDS:
+        _table, _loaded_at = load_table(), now
+    hours = _table.get((branch_id, service_type))
+    if hours is None:
+        hours = _table.get((None, service_type), FALLBACK_HOURS.get(service_type, FALLBACK_HOURS['economy']))
+    return hours
+
+
+def reset_table():
+    """Drop this process's copy so the next lookup re-reads the tables."""
+    global _loaded_at
+    _loaded_at = None
+
+
+# ---------------------------
+# Incremental refresh
+# ---------------------------
+def _first_unsettled(alias, after_id, settle):
+    """
+    Lowest delivered event id on shard `alias` after `after_id` recorded in
+    the last `settle` seconds, or None. Reading stops short of it so the
+    watermark never moves past an id a slower transaction may still commit.
+    """
+    if not settle:
+        return None
+    return (
+        ShipmentTracking.objects.using(alias)
+        .filter(status='delivered', id__gt=after_id, updated_at__gte=timezone.now() - timedelta(seconds=settle))
+        .aggregate(first=Min('id'))['first']
+    )
+
+
+def _delivered_chunk(alias, after_id, before_id, chunk_size):
+    """
+    Delivered events on shard `alias` after `after_id` (and below
+    `before_id`, if given) with their shipment's branch, service type and
+    first tracking time, as column arrays.
+    """
+    events = ShipmentTracking.objects.using(alias).filter(status='delivered', id__gt=after_id)
+    if before_id is not None:
+        events = events.filter(id__lt=before_id)
+    rows = list(
+        events.order_by('id')
+        .values_list('id', 'shipment_id', 'updated_at', 'shipment__branch_id', 'shipment__service_type')
+        [:chunk_size]
+    )
+    if not rows:
+        return None
+    ids, shipment_ids, delivered, branch_ids, service_types = zip(*rows)
+    first = dict(
+        ShipmentTracking.objects.using(alias)
+        .filter(shipment_id__in=set(shipment_ids))
+        .values('shipment_id')
+        .annotate(first=Min('updated_at'))
+        .values_list('shipment_id', 'first')
+    )
+    started = to_epoch_hours([first.get(shipment_id) for shipment_id in shipment_ids])
+    return ids[-1], branch_ids, service_types, to_epoch_hours(delivered) - started
+
+
+def refresh_profiles(rebuild=False, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Fold deliveries recorded since the last refresh into the transit-time
+    histograms and recompute their percentiles. Each delivery counts towards
+    its branch profile and the network-wide profile for its service type.
+    Every shard is read from its own watermark, as tracking ids only grow
+    within a shard. Returns the number of deliveries added.
+
+    Ids are handed out before commit, so a slow transaction can commit a
+    delivery below a watermark that already moved past it. Each shard is
+    read only up to its first delivery younger than ETA_SETTLE_SECONDS.
+    """
+    settle = getattr(settings, 'ETA_SETTLE_SECONDS', DEFAULT_SETTLE_SECONDS)
+    with transaction.atomic():
+        if rebuild:
+            TransitProfile.objects.all().delete()
+        profiles = {(p.branch_id, p.service_type): p for p in TransitProfile.objects.select_for_update()}
+        watermarks = {
+            alias: max((p.watermarks.get(alias, 0) for p in profiles.values()), default=0)
+            for alias in sharding.shards()
+        }
+
+        histograms = {}
+        added = 0
+        for alias in watermarks:
+            before_id = _first_unsettled(alias, watermarks[alias], settle)
+            for branch_ids, service_types, hours in _delivered_chunks(alias, watermarks, before_id, chunk_size):
+                valid = ~np.isnan(hours)
+                groups = {}
+                index = np.array([groups.setdefault(key, len(groups)) for key in zip(branch_ids, service_types)])
+                counts = np.bincount(
+                    index[valid] * TRANSIT_BINS + transit_bin(np.maximum(hours[valid], 0.0)),
+                    minlength=len(groups) * TRANSIT_BINS,
+                ).reshape(len(groups), TRANSIT_BINS)
+                for (branch_id, service_type), group in groups.items():
+                    targets = [(None, service_type)] + ([(branch_id, service_type)] if branch_id else [])
+                    for key in targets:
+                        if key not in histograms:
+                            histograms[key] = _dense(profiles.get(key))
+                        histograms[key] += counts[group]
+                added += int(valid.sum())
+                if progress:
+                    progress(added)
+
+        for (branch_id, service_type), counts in histograms.items():
+            profile = profiles.get((branch_id, service_type)) or TransitProfile(
+                branch_id=branch_id, service_type=service_type
+            )
+            profile.histogram = {str(i): int(counts[i]) for i in np.flatnonzero(counts)}
+            profile.samples = int(counts.sum())
+            profile.percentiles = {
+                f'p{pct}': float(value)
+                for pct, value in zip(PERCENTILES, histogram_percentiles(counts[None, :], TRANSIT_BIN_HOURS)[0])
+            }
+            profile.watermarks = watermarks
+            profile.save()
+
+    reset_table()
+    return added
+
+
+def _delivered_chunks(alias, watermarks, before_id, chunk_size):
+    """Chunks from _delivered_chunk, advancing watermarks[alias] past each."""
+    while True:
+        chunk = _delivered_chunk(alias, watermarks[alias], before_id, chunk_size)
+        if chunk is None:
+            return
+        watermarks[alias], *columns = chunk
+        yield columns
+
+
+def _dense(profile):
+    counts = np.zeros(TRANSIT_BINS, dtype=np.int64)
+    if profile is not None:
+        for index, count in profile.histogram.items():
+            counts[int(index)] = count
+    return counts
@@ -0,0 +1,205 @@
+# courier/exports.py
+
+import csv
+import os
+import time
+from itertools import islice
+from django.conf import settings
+from django.utils.dateparse import parse_date
+from . import jobs, sharding
+from .models import Shipment
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Parquet and Arrow exports are unavailable without it
+    pyarrow = None
+
+CHUNK_SIZE = 2000
+DEFAULT_RETENTION_HOURS = 24
+
+# One row per tracking event: the shipment, its payment (if any) and the
+# event. Output column -> values() path
+COLUMNS = (
+    ('tracking_number', 'tracking_number'),
+    ('status', 'status'),
+    ('service_type', 'service_type'),
+    ('weight', 'weight'),
+    ('branch_id', 'branch_id'),
+    ('courier_id', 'courier_id'),
+    ('customer_id', 'created_by_id'),
+    ('sender_name', 'sender_name'),
+    ('receiver_name', 'receiver_name'),
+    ('pickup_date', 'pickup_date'),
+    ('estimated_delivery', 'estimated_delivery'),
+    ('delivery_date', 'delivery_date'),
+    ('payment_type', 'payment__payment_type'),
+    ('payment_amount', 'payment__amount'),
+    ('payment_status', 'payment__status'),
+    ('payment_date', 'payment__payment_date'),
+    ('event_status', 'tracking_updates__status'),
+    ('event_location', 'tracking_updates__location'),
+    ('event_at', 'tracking_updates__updated_at'),
+)
+
+
+def available_formats():
+    return ('csv', 'parquet', 'arrow') if pyarrow is not None else ('csv',)
+
+
+def export_path(job):
+    return os.path.join(settings.EXPORT_ROOT, f"{job.pk}.{job.params['format']}")
+
+
+# ---------------------------
+# Filters
+# ---------------------------
+def clean_params(data):
+    """Validated export parameters from request data. Raises ValueError."""
+    fmt = data.get('format') or 'csv'
+    if fmt not in available_formats():
+        raise ValueError(f"Unsupported format '{fmt}'; available: {', '.join(available_formats())}")
+    params = {'format': fmt}
+    status = data.get('status')
+    if status:
+        if status not in dict(Shipment.STATUS_CHOICES):
+            raise ValueError(f"Invalid status '{status}'")
+        params['status'] = status
+    if data.get('branch_id'):
+        params['branch_id'] = int(data['branch_id'])
+    for key in ('pickup_from', 'pickup_to'):
+        if data.get(key):
+            if parse_date(str(data[key])) is None:
+                raise ValueError(f"{key} must be a date (YYYY-MM-DD)")
+            params[key] = str(data[key])
+    return params
+
+
+def export_rows(params):
+    """
+    Shipment x payment x tracking rows in shipment and event order, as one
+    queryset per shard (shards hold consecutive id ranges).
+    """
+    shipments = Shipment.objects.all()
+    if 'status' in params:
+        shipments = shipments.filter(status=params['status'])
+    if 'branch_id' in params:
+        shipments = shipments.filter(branch_id=params['branch_id'])
+    if 'pickup_from' in params:
+        shipments = shipments.filter(pickup_date__date__gte=params['pickup_from'])
+    if 'pickup_to' in params:
+        shipments = shipments.filter(pickup_date__date__lte=params['pickup_to'])
+    return sharding.scatter(shipments.values_list(*(path for _, path in COLUMNS)).order_by('id', 'tracking_updates__id'))
+
+
+# ---------------------------
+# Writers
+# ---------------------------
+class CSVWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in COLUMNS])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+def _arrow_schema():
+    types = {
+        'weight': pyarrow.decimal128(6, 2), 'payment_amount': pyarrow.decimal128(10, 2),
+        'branch_id': pyarrow.int64(), 'courier_id': pyarrow.int64(), 'customer_id': pyarrow.int64(),
+    }
+    timestamp = pyarrow.timestamp('us', tz='UTC')
+    return pyarrow.schema([
+        (name, types.get(name) or (timestamp if name.endswith(('_date', '_delivery', '_at')) else pyarrow.string()))
+        for name, _ in COLUMNS
+    ])
+
+
+class ArrowWriter:
+    """Parquet or Arrow IPC file, one record batch (row group) per chunk."""
+    def __init__(self, path, fmt):
+        self.schema = _arrow_schema()
+        if fmt == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema,
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+# ---------------------------
+# Job
+# ---------------------------
+@jobs.register('export')
+def run_export(job, progress):
+    """
+    Write the export file chunk by chunk from a server-side cursor, so
+    memory stays flat whatever the size. The file is written under a
+    temporary name and renamed when complete.
+    """
+    params = job.params
+    shards = export_rows(params)
+    progress(0, total=sum(rows.count() for rows in shards))
+
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    path = export_path(job)
+    partial = f"{path}.part"
+    writer = CSVWriter(partial) if params['format'] == 'csv' else ArrowWriter(partial, params['format'])
+    written = 0
+    try:
+        for rows in shards:
+            cursor = rows.iterator(chunk_size=CHUNK_SIZE)
+            while chunk := list(islice(cursor, CHUNK_SIZE)):
+                writer.write(chunk)
+                written += len(chunk)
+                progress(written)
+    except Exception:
+        writer.close()
+        os.remove(partial)
+        raise
+    writer.close()
+    os.replace(partial, path)
+    return {'rows': written, 'bytes': os.path.getsize(path)}
+
+
+# ---------------------------
+# Retention
+# ---------------------------
+@jobs.housekeeping
+def purge_exports(older_than_hours=None):
+    """
+    Delete export files (and partial files of crashed jobs) last written
+    more than EXPORT_RETENTION_HOURS ago; their downloads answer 410 Gone.
+    Returns the number of files deleted.
+    """
+    if older_than_hours is None:
+        older_than_hours = getattr(settings, 'EXPORT_RETENTION_HOURS', DEFAULT_RETENTION_HOURS)
+    cutoff = time.time() - older_than_hours * 3600
+    deleted = 0
+    try:
+        entries = list(os.scandir(settings.EXPORT_ROOT))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                deleted += 1
+        except FileNotFoundError:
+            # removed meanwhile by another process
+            pass
+    return deleted
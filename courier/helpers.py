@@ -1,58 +1,115 @@
 # courier/helpers.py
 
 from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from .models import Shipment, ShipmentTracking, CourierStaff, Notification
+from . import changefeed, eta, sharding
+from .routing import optimize_sequence
+from .serializers import ShipmentSummaryRows
 
 # ---------------------------
-# Assign a shipment to available courier
+# Shipment state machine
 # ---------------------------
-def assign_shipment_to_courier(shipment):
+# status -> statuses it may move to
+TRANSITIONS = {
+    'pending': ('in_warehouse', 'out_for_delivery', 'cancelled'),
+    'in_warehouse': ('out_for_delivery', 'cancelled'),
+    'out_for_delivery': ('delivered', 'in_warehouse'),
+    'delivered': (),
+    'cancelled': (),
+}
+ACTIVE_STATUSES = ('pending', 'in_warehouse', 'out_for_delivery')
+
+def allowed_sources(new_status):
+    """Statuses a shipment may be in for a move to `new_status`."""
+    return tuple(source for source, targets in TRANSITIONS.items() if new_status in targets)
+
+def transition_shipment(shipment, new_status, allowed_from=None, match=None,
+                        location=None, message=None, **changes):
     """
-    Assign a shipment to an available courier in the same branch.
-    If no staff is available, the shipment stays in warehouse.
-    Also creates a ShipmentTracking entry and calculates ETA.
+    Move a shipment to `new_status` with a single conditional
+    UPDATE ... WHERE status IN (allowed_from), writing only the status,
+    updated_at and the extra column `changes`. `match` adds further
+    conditions (e.g. the courier the caller expects to hold the shipment).
+
+    Returns False without side effects when the row was not in an allowed
+    state, typically because a concurrent request moved it first. On
+    success the instance is updated in memory and the tracking entry,
+    courier availability, customer notification and change-feed entry
+    follow in the same transaction.
     """
-    available_staff = shipment.branch.staff_members.filter(is_available=True)
-    
-    if available_staff.exists():
-        courier = available_staff.first()  # pick the first available
-        shipment.courier = courier
-        shipment.status = 'out_for_delivery'
-        shipment.save()
-        
-        courier.assigned_shipments.add(shipment)
-        
-        # Add tracking update
-        ShipmentTracking.objects.create(
-            shipment=shipment,
-            status='out_for_delivery',
-            location=shipment.branch.name
+    if allowed_from is None:
+        allowed_from = allowed_sources(new_status)
+    now = timezone.now()
+    changes.update(status=new_status, updated_at=now)
+    if new_status == 'delivered':
+        changes.setdefault('delivery_date', now)
+
+    shard = shipment._state.db or sharding.shard_for_id(shipment.pk)
+    # the shipment's shard and 'default' (courier, notification) commit together,
+    # though not atomically with each other when they differ
+    with transaction.atomic(using=shard), transaction.atomic():
+        updated = Shipment.objects.using(shard).filter(
+            pk=shipment.pk, status__in=allowed_from, **(match or {})
+        ).update(**changes)
+        if updated != 1:
+            return False
+
+        for field, value in changes.items():
+            setattr(shipment, field, value)
+
+        # update() sends no post_save, so the change feed entry is written here
+        changefeed.record_changes('shipment', [shipment.pk])
+        shipment.tracking_updates.create(
+            status=new_status,
+            location=location if location else (shipment.branch.name if shipment.branch else "N/A")
         )
-        
-        # Calculate estimated delivery
-        calculate_eta(shipment)
-        
-        # Notify customer
+        if shipment.courier_id:
+            # a courier is busy while carrying a shipment and free again once it is closed
+            CourierStaff.objects.filter(pk=shipment.courier_id).update(
+                is_available=new_status not in ACTIVE_STATUSES
+            )
         notify_customer(
             shipment,
-            f"Your shipment {shipment.tracking_number} has been assigned to courier {courier.user.username} and is out for delivery."
+            message or f"Your shipment {shipment.tracking_number} status has been updated to {new_status}."
         )
-        
+    return True
+
+# ---------------------------
+# Assign a shipment to available courier
+# ---------------------------
+def assign_shipment_to_courier(shipment, from_courier=None):
+    """
+    Assign a shipment to an available courier in the same branch.
+    If no staff is available, the shipment stays in warehouse.
+    Also creates a ShipmentTracking entry and calculates ETA.
+    With `from_courier`, the shipment is only moved if that courier still
+    holds it. Returns False if another request changed the shipment first.
+    """
+    if from_courier is not None:
+        allowed_from, match = ACTIVE_STATUSES, {'courier': from_courier}
     else:
-        shipment.status = 'in_warehouse'
-        shipment.save()
-        
-        ShipmentTracking.objects.create(
-            shipment=shipment,
-            status='in_warehouse',
-            location=shipment.branch.name
-        )
-        
-        notify_customer(
-            shipment,
-            f"Your shipment {shipment.tracking_number} is in warehouse. Waiting for available courier."
+        allowed_from, match = ('pending', 'in_warehouse'), None
+
+    courier = None
+    if shipment.branch_id:
+        available_staff = shipment.branch.staff_members.filter(is_available=True)
+        courier = available_staff.select_related('user').first()  # pick the first available
+
+    if courier:
+        return transition_shipment(
+            shipment, 'out_for_delivery', allowed_from=allowed_from, match=match,
+            message=f"Your shipment {shipment.tracking_number} has been assigned to courier {courier.user.username} and is out for delivery.",
+            courier=courier, estimated_delivery=calculate_eta(shipment),
         )
+    return transition_shipment(
+        shipment, 'in_warehouse', allowed_from=allowed_from, match=match,
+        message=f"Your shipment {shipment.tracking_number} is in warehouse. Waiting for available courier.",
+        courier=None, estimated_delivery=calculate_eta(shipment),
+    )
 
 # ---------------------------
 # Update shipment status with tracking
@@ -60,39 +117,22 @@ def assign_shipment_to_courier(shipment):
 def update_shipment_status(shipment, new_status, location=None):
     """
     Update shipment status and automatically create a ShipmentTracking entry.
-    Also notifies the customer.
+    Also notifies the customer. Returns False if the move is not allowed
+    from the shipment's current status.
     """
-    shipment.status = new_status
-    shipment.save()
-    
-    ShipmentTracking.objects.create(
-        shipment=shipment,
-        status=new_status,
-        location=location if location else (shipment.branch.name if shipment.branch else "N/A")
-    )
-    
-    notify_customer(
-        shipment,
-        f"Your shipment {shipment.tracking_number} status has been updated to {new_status}."
-    )
+    return transition_shipment(shipment, new_status, location=location)
 
 # ---------------------------
 # Calculate estimated delivery based on service type
 # ---------------------------
 def calculate_eta(shipment):
     """
-    Estimate delivery date based on service_type.
+    Estimate delivery date from the historical transit times of the
+    shipment's branch and service type (see courier.eta). The caller
+    persists it, normally as part of the status transition that triggered it.
     """
-    now = timezone.now()
-    if shipment.service_type == 'same_day':
-        shipment.estimated_delivery = now + timedelta(hours=6)
-    elif shipment.service_type == 'overnight':
-        shipment.estimated_delivery = now + timedelta(days=1)
-    elif shipment.service_type == 'economy':
-        shipment.estimated_delivery = now + timedelta(days=3)
-    elif shipment.service_type == 'international':
-        shipment.estimated_delivery = now + timedelta(days=7)
-    shipment.save()
+    hours = eta.transit_hours(shipment.branch_id, shipment.service_type)
+    shipment.estimated_delivery = timezone.now() + timedelta(hours=hours)
     return shipment.estimated_delivery
 
 # ---------------------------
@@ -100,15 +140,65 @@ def calculate_eta(shipment):
 # ---------------------------
 def notify_customer(shipment, message, notification_type='email'):
     """
-    Send a notification to the customer and log it.
+    Send a notification to the customer and log it. Shipments whose
+    customer account was deleted have no one to notify.
     """
+    if shipment.created_by_id is None:
+        return
     Notification.objects.create(
-        user=shipment.created_by,
+        user_id=shipment.created_by_id,
         shipment=shipment,
         message=message,
         notification_type=notification_type
     )
 
+def purge_notifications(older_than_days, read_older_than_days=None, batch_size=5000):
+    """
+    Delete old notifications in primary-key batches so no single statement
+    holds a long lock. Read notifications can be given a shorter retention.
+    Returns the number of rows deleted.
+    """
+    now = timezone.now()
+    stale = Q(sent_at__lt=now - timedelta(days=older_than_days))
+    if read_older_than_days is not None:
+        stale |= Q(is_read=True, sent_at__lt=now - timedelta(days=read_older_than_days))
+
+    deleted = 0
+    while True:
+        ids = list(Notification.objects.filter(stale).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Notification.objects.filter(id__in=ids).delete()[0]
+
+def backfill_last_events(batch_size=1000, progress=None):
+    """
+    Recompute every shipment's last_event_* columns and event_count from its
+    tracking history, one set-based UPDATE per `batch_size` shipments (in
+    primary-key order, shard by shard). Returns the number of shipments
+    processed.
+    """
+    events = ShipmentTracking.objects.filter(shipment=OuterRef('pk'))
+    latest = events.order_by('-updated_at', '-id')
+    count = events.order_by().values('shipment').annotate(n=Count('id')).values('n')
+    columns = {
+        'last_event_at': Subquery(latest.values('updated_at')[:1]),
+        'last_event_location': Coalesce(Subquery(latest.values('location')[:1]), Value('')),
+        'event_count': Coalesce(Subquery(count), 0),
+    }
+    done = 0
+    for shipments in sharding.scatter(Shipment.objects.order_by('id')):
+        last_id = 0
+        while True:
+            ids = list(shipments.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            shipments.filter(id__in=ids).update(**columns)
+            done += len(ids)
+            last_id = ids[-1]
+            if progress:
+                progress(done)
+    return done
+
 # ---------------------------
 # Courier duty management
 # ---------------------------
@@ -128,37 +218,118 @@ def mark_courier_off_duty(courier_staff):
     courier_staff.save()
     
     # Reassign all pending shipments assigned to this courier
-    pending_shipments = courier_staff.assigned_shipments.filter(
-        status__in=['pending', 'in_warehouse', 'out_for_delivery']
-    )
+    pending_shipments = courier_staff.shipments.filter(
+        status__in=ACTIVE_STATUSES
+    ).select_related('branch')
     
     for shipment in pending_shipments:
-        # Remove from current courier
-        courier_staff.assigned_shipments.remove(shipment)
-        shipment.courier = None
-        shipment.status = 'in_warehouse'
-        shipment.save()
-        
-        # Reassign automatically
-        assign_shipment_to_courier(shipment)
+        # Hand over to another courier (or the warehouse); skipped if the
+        # shipment was delivered or reassigned in the meantime
+        assign_shipment_to_courier(shipment, from_courier=courier_staff)
+
+# ---------------------------
+# Courier manifest (route sheet)
+# ---------------------------
+MANIFEST_STATUSES = ('out_for_delivery',)
+MANIFEST_FIELDS = (
+    'id', 'tracking_number', 'receiver_name', 'receiver_address',
+    'weight', 'service_type', 'status',
+)
+
+def build_courier_manifest(courier_staff, since=None):
+    """
+    Flat rows for the shipments a courier has to deliver, read with a single
+    values() query (the COD amount comes from a join on Payment).
+    With `since`, only rows changed after it are returned, together with the
+    ids of every active shipment so the client can drop the ones it no
+    longer carries (delivered, cancelled or reassigned).
+    `optimized_sequence` always lists every active shipment id in the
+    suggested delivery order.
+    """
+    active = Shipment.objects.using(sharding.shard_for_branch(courier_staff.branch_id)).filter(
+        courier=courier_staff, status__in=MANIFEST_STATUSES,
+    )
+    changed = active.filter(updated_at__gt=since) if since else active
+    rows = list(
+        changed.order_by('id').values(
+            *MANIFEST_FIELDS,
+            cod_amount=Case(
+                When(payment__payment_type='cod', payment__status='pending', then=F('payment__amount')),
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ),
+        )
+    )
+    for row in rows:
+        # same fixed two-place strings the serializers use for decimals
+        row['weight'] = f"{row['weight']:.2f}"
+        if row['cod_amount'] is not None:
+            row['cod_amount'] = f"{row['cod_amount']:.2f}"
+
+    if since:
+        stops = list(active.order_by('id').values_list('id', 'receiver_address'))
+    else:
+        stops = [(row['id'], row['receiver_address']) for row in rows]
+    depot = courier_staff.branch.location if courier_staff.branch_id else None
+
+    manifest = {'shipments': rows}
+    if since:
+        manifest['active_ids'] = [stop_id for stop_id, _ in stops]
+    # suggested delivery order over every active shipment, starting at the branch
+    manifest['optimized_sequence'] = optimize_sequence(stops, start_address=depot)
+    return manifest
 
 # ---------------------------
 # Query helpers
 # ---------------------------
+def with_shipment_relations(queryset, history=True):
+    """
+    Load everything ShipmentSerializer reads (creator, branch, courier with
+    its user and branch, tracking history) in a fixed number of queries
+    instead of several per row. Works for Shipment and ArchivedShipment.
+    Pass history=False for ShipmentSummarySerializer, which skips the
+    tracking history.
+    """
+    relations = ('created_by', 'branch', 'courier__user', 'courier__branch')
+    history = ('tracking_updates',) if history else ()
+    if sharding.enabled() and sharding.is_sharded(queryset.model):
+        # users, branches and couriers stay on 'default': no joins across databases
+        return queryset.prefetch_related(*relations, *history)
+    return queryset.select_related(*relations).prefetch_related(*history)
+
+def shipment_summaries(queryset, order=None, using=None):
+    """
+    ShipmentSummarySerializer output for an ordered Shipment queryset,
+    rendered from values() rows (ShipmentSummaryRows). On a single database
+    that is one query. With shards, whose rows
+    cannot be joined to users and branches, the `using` shard or every
+    shard is read and merged in `order`, then the related rows are read
+    from 'default' (see ValuesSerializer.merged).
+    """
+    if not sharding.enabled():
+        return ShipmentSummaryRows(queryset).data
+    order = order or 'id'
+    # one shard keeps the queryset's own ordering; nothing to merge
+    shards = [queryset.using(using)] if using else sharding.scatter(queryset.order_by(order))
+    return ShipmentSummaryRows.merged(shards, order)
+
 def get_customer_shipments(customer):
     """
     Return all shipments created by a customer.
     """
-    return Shipment.objects.filter(created_by=customer).order_by('-pickup_date')
+    return with_shipment_relations(Shipment.objects.filter(created_by=customer)).order_by('-pickup_date')
 
 def get_branch_shipments(branch):
     """
     Return all shipments for a branch.
     """
-    return Shipment.objects.filter(branch=branch).order_by('-pickup_date')
+    return with_shipment_relations(
+        Shipment.objects.using(sharding.shard_for_branch(branch.pk)).filter(branch=branch)
+    ).order_by('-pickup_date')
 
 def get_courier_shipments(courier_staff):
     """
     Return all shipments assigned to a courier staff.
     """
-    return courier_staff.assigned_shipments.all().order_by('-pickup_date')
+    return with_shipment_relations(
+        Shipment.objects.using(sharding.shard_for_branch(courier_staff.branch_id)).filter(courier=courier_staff)
+    ).order_by('-pickup_date')
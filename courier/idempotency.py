@@ -0,0 +1,149 @@
+# courier/idempotency.py
+
+import functools
+import hashlib
+import json
+import zlib
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+DEFAULT_TTL_HOURS = 24
+# An in-progress key older than this belongs to a request that died
+# (worker killed, render failed) and may be taken over by a retry
+STALE_AFTER = timedelta(minutes=5)
+
+
+def _ttl():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', DEFAULT_TTL_HOURS))
+
+
+def request_fingerprint(request):
+    """Hash of what makes two requests "the same": method, path and parsed body."""
+    data = request.data
+    if hasattr(data, 'lists'):  # QueryDict from form posts
+        data = dict(data.lists())
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """
+    Insert the key as in-progress. Returns (row, True) if this request owns
+    it now, otherwise (existing row, False). The unique (user, key)
+    constraint decides between concurrent duplicates.
+    """
+    now = timezone.now()
+    while True:
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, expires_at=now + _ttl(),
+                ), True
+        except IntegrityError:
+            existing = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if existing is None:
+                continue  # released by a failed request meanwhile
+            abandoned = existing.status_code is None and existing.created_at < now - STALE_AFTER
+            if existing.expires_at > now and not abandoned:
+                return existing, False
+            # expired but not swept yet, or abandoned: take it over
+            IdempotencyKey.objects.filter(pk=existing.pk).delete()
+
+
+def _replay(record):
+    response = HttpResponse(
+        zlib.decompress(bytes(record.body)) if record.body else b'',
+        status=record.status_code, content_type=record.content_type or None,
+    )
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(*methods):
+    """
+    Class decorator making the given handlers (default: post) safe to retry.
+    A request carrying an Idempotency-Key header runs once per user and key;
+    retries within IDEMPOTENCY_KEY_TTL_HOURS get the stored response without
+    the view running again. Reusing a key for a different request is
+    rejected with 422, and a retry arriving while the first request is still
+    running gets 409. Server errors are not stored, so they can be retried.
+
+        @idempotent()
+        class CreateShipmentAPIView(APIView):
+            ...
+    """
+    methods = methods or ('post',)
+
+    def decorate(view_class):
+        for method in methods:
+            setattr(view_class, method, _wrap(getattr(view_class, method)))
+        return view_class
+    return decorate
+
+
+def _wrap(handler):
+    @functools.wraps(handler)
+    def idempotent_handler(self, request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return handler(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'Idempotency-Key longer than {MAX_KEY_LENGTH} characters'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        record, owned = _claim(request.user, key, fingerprint)
+        if not owned:
+            if record.fingerprint != fingerprint:
+                return Response({'error': 'Idempotency-Key was already used for a different request'},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if record.status_code is None:
+                response = Response({'error': 'A request with this Idempotency-Key is still being processed'},
+                                    status=status.HTTP_409_CONFLICT)
+                response['Retry-After'] = '1'
+                return response
+            return _replay(record)
+
+        claimed = IdempotencyKey.objects.filter(pk=record.pk)
+        try:
+            response = handler(self, request, *args, **kwargs)
+        except Exception:
+            claimed.delete()
+            raise
+
+        def store(rendered):
+            if rendered.status_code >= 500:
+                claimed.delete()
+            else:
+                claimed.update(
+                    status_code=rendered.status_code,
+                    content_type=rendered.get('Content-Type', ''),
+                    body=zlib.compress(rendered.content),
+                )
+            return rendered
+
+        if hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
+    return idempotent_handler
+
+
+def purge_expired_keys(batch_size=5000):
+    """Delete expired keys in primary-key batches. Returns the number deleted."""
+    deleted = 0
+    now = timezone.now()
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
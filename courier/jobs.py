@@ -0,0 +1,158 @@
+# courier/jobs.py
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# A running job whose heartbeat (updated_at) is older than this was lost
+# with its process and is queued again by sweep()
+STALE_AFTER = timedelta(minutes=10)
+# With JOBS_IN_PROCESS, how often a process's job thread sweeps
+SWEEP_INTERVAL = timedelta(minutes=5)
+
+HANDLERS = {}
+HOUSEKEEPING = []
+
+_executor = None
+_executor_lock = threading.Lock()
+_last_sweep = None
+
+
+def register(kind):
+    """
+    Register the function running jobs of `kind`. It is called as
+    handler(job, progress) and returns the job's result (JSON-serializable);
+    progress(processed, total=None) records how far it got.
+    """
+    def decorate(handler):
+        HANDLERS[kind] = handler
+        return handler
+    return decorate
+
+
+def housekeeping(task):
+    """Register task() to run on every sweep, e.g. to delete expired job output."""
+    HOUSEKEEPING.append(task)
+    return task
+
+
+# ---------------------------
+# Queueing
+# ---------------------------
+def enqueue(kind, user=None, **params):
+    """
+    Queue a job and return it. With JOBS_IN_PROCESS (the default) it starts
+    on a background thread of this process once the surrounding transaction
+    commits, after a sweep() if none ran for SWEEP_INTERVAL; otherwise it
+    waits for the run_jobs command.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = BackgroundJob.objects.create(kind=kind, params=params, created_by=user)
+    if getattr(settings, 'JOBS_IN_PROCESS', True):
+        transaction.on_commit(lambda: _submit(job.pk))
+    return job
+
+
+def _submit(job_id):
+    global _executor, _last_sweep
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'JOBS_WORKERS', 1), thread_name_prefix='courier-job',
+            )
+        # first job after start-up (e.g. a restart that lost running jobs), then periodically
+        now = time.monotonic()
+        sweep_due = _last_sweep is None or now - _last_sweep >= SWEEP_INTERVAL.total_seconds()
+        if sweep_due:
+            _last_sweep = now
+    if sweep_due:
+        _executor.submit(_sweep_in_thread)
+    _executor.submit(_run_in_thread, job_id)
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # this thread's own connections; the pool thread may idle for hours
+        connections.close_all()
+
+
+def _sweep_in_thread():
+    try:
+        run_pending()
+    except Exception:
+        logger.exception("Background job sweep failed")
+    finally:
+        connections.close_all()
+
+
+# ---------------------------
+# Running
+# ---------------------------
+def run_job(job_id):
+    """
+    Run a queued job unless another worker claimed it first. Returns
+    True if this call ran it.
+    """
+    now = timezone.now()
+    claimed = BackgroundJob.objects.filter(pk=job_id, status='queued').update(
+        status='running', started_at=now, updated_at=now,
+    )
+    if not claimed:
+        return False
+    job = BackgroundJob.objects.get(pk=job_id)
+    rows = BackgroundJob.objects.filter(pk=job_id)
+
+    def progress(processed, total=None):
+        changes = {'processed': processed, 'updated_at': timezone.now()}
+        if total is not None:
+            changes['total'] = total
+        rows.update(**changes)
+
+    try:
+        result = HANDLERS[job.kind](job, progress)
+    except Exception as exc:
+        logger.exception("Background job %s (%s) failed", job_id, job.kind)
+        rows.update(status='failed', error=str(exc) or exc.__class__.__name__,
+                    finished_at=timezone.now(), updated_at=timezone.now())
+    else:
+        rows.update(status='done', result=result or {}, finished_at=timezone.now(), updated_at=timezone.now())
+    return True
+
+
+def sweep():
+    """
+    Queue again running jobs whose worker died (no heartbeat for
+    STALE_AFTER) and run the housekeeping tasks. Returns the number of jobs
+    requeued.
+    """
+    requeued = BackgroundJob.objects.filter(status='running', updated_at__lt=timezone.now() - STALE_AFTER).update(
+        status='queued', updated_at=timezone.now(),
+    )
+    for task in HOUSEKEEPING:
+        task()
+    return requeued
+
+
+def run_pending(limit=None):
+    """
+    Run queued jobs oldest first, after a sweep(). Returns the number of
+    jobs run.
+    """
+    sweep()
+    ran = 0
+    while limit is None or ran < limit:
+        job_id = BackgroundJob.objects.filter(status='queued').order_by('id').values_list('id', flat=True).first()
+        if job_id is None:
+            return ran
+        ran += run_job(job_id)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from courier.archive import DEFAULT_BATCH_SIZE, DEFAULT_RETENTION_DAYS, archive_shipments
+
+
+class Command(BaseCommand):
+    help = "Move delivered/cancelled shipments older than N days, with their history, into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=DEFAULT_RETENTION_DAYS,
+                            help="Archive shipments with no activity for this many days (default: %(default)s).")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Shipments moved per transaction (default: %(default)s).")
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches.")
+        parser.add_argument('--start-after', type=int, default=0,
+                            help="Resume after this shipment id (printed by a previous run).")
+
+    def handle(self, *args, **options):
+        def progress(archived, last_id):
+            self.stdout.write(f"archived {archived} shipments (last id {last_id})")
+
+        archived, last_id = archive_shipments(
+            older_than_days=options['days'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            start_after=options['start_after'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} shipments; last id {last_id}."))
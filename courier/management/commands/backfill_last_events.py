@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from courier.helpers import backfill_last_events
+
+
+class Command(BaseCommand):
+    help = "Recompute every shipment's latest-event columns and event count from its tracking history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Shipments updated per statement (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        def progress(done):
+            self.stdout.write(f"backfilled {done} shipments")
+
+        done = backfill_last_events(
+            batch_size=options['batch_size'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {done} shipments."))
@@ -0,0 +1,135 @@
+import platform
+import sys
+import tempfile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from courier import benchmarks
+from courier.seeding import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every courier API endpoint at several data scales in a throwaway "
+        "test database, optionally comparing against a saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,10000',
+                            help="Comma-separated shipment counts to seed (default: %(default)s).")
+        parser.add_argument('--iterations', type=int, default=benchmarks.DEFAULT_ITERATIONS)
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help="Only benchmark this URL name (repeatable).")
+        parser.add_argument('--output', help="Write results to this JSON baseline file.")
+        parser.add_argument('--compare', help="Compare against this baseline file; exit non-zero on regression.")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed relative p95 slowdown before flagging (default: %(default)s).")
+        parser.add_argument('--renderers', action='store_true',
+                            help="Instead of whole requests, compare render time and compressed size "
+                                 "of the large list responses across renderers.")
+        parser.add_argument('--throttle', action='store_true',
+                            help="Instead of whole requests, measure the per-request cost of the rate limit check.")
+        parser.add_argument('--serializers', action='store_true',
+                            help="Instead of whole requests, compare rows per second and allocations of the "
+                                 "shipment list serializers (model instances vs values() rows).")
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(s) for s in options['scales'].split(',') if s]
+        except ValueError:
+            raise CommandError("--scales must be a comma-separated list of integers.")
+        known = benchmarks.RENDER_CASES if options['renderers'] else benchmarks.ENDPOINT_CASES
+        unknown = set(options['endpoints'] or []) - set(known)
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}")
+        modes = [mode for mode in ('renderers', 'throttle', 'serializers') if options[mode]]
+        if len(modes) > 1:
+            raise CommandError(f"--{' and --'.join(modes)} are mutually exclusive.")
+        if modes and options['compare']:
+            raise CommandError(f"--compare is not supported with --{modes[0]}.")
+        for name in benchmarks.uncovered_endpoints():
+            self.stderr.write(self.style.WARNING(f"No benchmark case for URL '{name}'"))
+
+        results = {}
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # export fixtures are throwaway like the database
+        export_root = tempfile.TemporaryDirectory()
+        settings_override = override_settings(EXPORT_ROOT=export_root.name)
+        settings_override.enable()
+        try:
+            for scale in scales:
+                call_command('flush', interactive=False, verbosity=0)
+                seed(
+                    branches=10, couriers=max(5, scale // 200),
+                    customers=max(10, scale // 10), shipments=scale,
+                )
+                self.stdout.write(self.style.MIGRATE_HEADING(f"Scale: {scale} shipments"))
+                if options['serializers']:
+                    results[str(scale)] = benchmarks.benchmark_serializers(iterations=options['iterations'])
+                    self._report_serializers(results[str(scale)])
+                elif options['throttle']:
+                    results[str(scale)] = benchmarks.benchmark_throttle(benchmarks.load_fixtures()['customer'])
+                    self._report_throttle(results[str(scale)])
+                elif options['renderers']:
+                    results[str(scale)] = benchmarks.run_renderer_benchmarks(
+                        iterations=options['iterations'], names=options['endpoints'],
+                        progress=self._report_renderers,
+                    )
+                else:
+                    results[str(scale)] = benchmarks.run_api_benchmarks(
+                        iterations=options['iterations'], names=options['endpoints'], progress=self._report,
+                    )
+        finally:
+            settings_override.disable()
+            export_root.cleanup()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            benchmarks.write_baseline(options['output'], results, {
+                'created': timezone.now().isoformat(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+            })
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            regressions = benchmarks.compare_results(
+                benchmarks.load_baseline(options['compare']), results, tolerance=options['tolerance'],
+            )
+            for line in regressions:
+                self.stderr.write(self.style.ERROR(line))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['compare']}")
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
+
+    def _report(self, name, result):
+        self.stdout.write(
+            f"  {name:<26} {result['status']:>3}  p50 {result['p50_ms']:>9.2f}ms  "
+            f"p95 {result['p95_ms']:>9.2f}ms  {result['queries']:>6} queries  "
+            f"{result['peak_kib']:>9.1f} KiB  {result['response_bytes']:>9} B"
+        )
+
+    def _report_renderers(self, name, results):
+        self.stdout.write(f"  {name}")
+        for renderer, result in results.items():
+            sizes = '  '.join(f"{encoding} {size:>9} B" for encoding, size in result['bytes'].items())
+            self.stdout.write(
+                f"    {renderer:<10} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  {sizes}"
+            )
+
+    def _report_serializers(self, results):
+        for name, result in results.items():
+            self.stdout.write(
+                f"  {name:<10} {result['rows']:>7} rows  p50 {result['p50_ms']:>9.2f}ms  "
+                f"{result['rows_per_s']:>9} rows/s  {result['peak_kib']:>9.1f} KiB"
+            )
+
+    def _report_throttle(self, results):
+        for path, result in results.items():
+            self.stdout.write(f"  {path:<10} p50 {result['p50_us']:>9.2f}us  p95 {result['p95_us']:>9.2f}us")
@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from courier.onboarding import DEFAULT_BATCH_SIZE, import_users, parse_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create staff, manager and HR accounts from a CSV or JSON file "
+        "(username, email, password, role, first_name, last_name, branch)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file with a header row, or a JSON list of objects.")
+        parser.add_argument('--format', choices=['csv', 'json'],
+                            help="Input format (default: from the file extension).")
+        parser.add_argument('--partial', action='store_true',
+                            help="Import the valid rows even if some rows have errors.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate only.")
+        parser.add_argument('--workers', type=int,
+                            help="Password hashing processes (default: one per CPU).")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows inserted per statement (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        fmt = options['format'] or ('json' if path.suffix.lower() == '.json' else 'csv')
+        try:
+            rows = parse_rows(path.read_bytes(), fmt)
+        except (OSError, ValueError, UnicodeDecodeError) as exc:
+            raise CommandError(f"Could not read {path}: {exc}")
+
+        report = import_users(
+            rows, partial=options['partial'], dry_run=options['dry_run'],
+            workers=options['workers'], batch_size=options['batch_size'],
+        )
+        for error in report['errors']:
+            self.stderr.write(self.style.ERROR(f"row {error['row']}: {json.dumps(error['errors'])}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['rows']} rows, {report['created']} users created, {len(report['errors'])} rows with errors."
+        ))
+        if report['errors'] and not report['created']:
+            raise CommandError("Nothing imported.")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from courier.routing import DEFAULT_GAZETTEER, load_gazetteer
+
+
+class Command(BaseCommand):
+    help = "Load places used to geocode delivery addresses from a CSV file (name, latitude, longitude)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_GAZETTEER),
+                            help="CSV file to load (default: the bundled city list).")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Rows written per statement (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        loaded = load_gazetteer(options['path'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Loaded {loaded} places."))
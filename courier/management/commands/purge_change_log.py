@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from courier.changefeed import purge_change_log
+
+
+class Command(BaseCommand):
+    help = "Delete change feed entries older than the retention period in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help="Keep this many days of changes (default: CHANGE_FEED_RETENTION_DAYS).")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Rows deleted per statement (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        deleted = purge_change_log(older_than_days=options['days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} change log entries."))
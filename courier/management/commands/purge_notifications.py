@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from courier.helpers import purge_notifications
+
+
+class Command(BaseCommand):
+    help = "Delete old notifications in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=180,
+                            help="Delete every notification older than this (default: %(default)s).")
+        parser.add_argument('--read-days', type=int, default=30,
+                            help="Delete read notifications older than this (default: %(default)s).")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Rows deleted per statement (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        deleted = purge_notifications(
+            older_than_days=options['days'],
+            read_older_than_days=options['read_days'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} notifications."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from courier import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the shipment full-text search index from the shipment table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help="Shipments indexed per statement (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        if search.backend() is None:
+            self.stderr.write(self.style.WARNING("This database backend has no search index."))
+            return
+
+        def progress(indexed):
+            self.stdout.write(f"indexed {indexed} shipments")
+
+        indexed = search.rebuild_index(
+            batch_size=options['batch_size'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} shipments."))
@@ -0,0 +1,52 @@
+import csv
+from django.core.management.base import BaseCommand, CommandError
+from courier.reconciliation import DEFAULT_BATCH_SIZE, iter_csv, reconcile_payments
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark payments paid from a provider or COD cash-in CSV "
+        "(tracking_number, amount, optional paid_at) and report the rows that do not match."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file with a header row.")
+        parser.add_argument('--report', help="Write mismatching rows to this CSV file instead of stderr.")
+        parser.add_argument('--dry-run', action='store_true', help="Match only; change nothing.")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows looked up and updated per statement (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        report_file = open(options['report'], 'w', newline='') if options['report'] else None
+        try:
+            if report_file:
+                writer = csv.DictWriter(report_file, ['row', 'tracking_number', 'kind', 'detail'])
+                writer.writeheader()
+                on_mismatch = writer.writerow
+            else:
+                def on_mismatch(mismatch):
+                    self.stderr.write(self.style.WARNING(
+                        f"row {mismatch['row']}: {mismatch['kind']} "
+                        f"{mismatch.get('tracking_number', '')} {mismatch['detail']}"
+                    ))
+
+            def progress(report):
+                self.stdout.write(f"{report['rows']} rows, {report['paid']} paid")
+
+            try:
+                with open(options['path'], newline='', encoding='utf-8-sig') as fh:
+                    report = reconcile_payments(
+                        iter_csv(fh), dry_run=options['dry_run'], batch_size=options['batch_size'],
+                        on_mismatch=on_mismatch, progress=progress if options['verbosity'] > 1 else None,
+                    )
+            except (OSError, ValueError, UnicodeDecodeError) as exc:
+                raise CommandError(f"Could not read {options['path']}: {exc}")
+        finally:
+            if report_file:
+                report_file.close()
+
+        mismatches = ', '.join(f"{count} {kind}" for kind, count in report['mismatches'].items() if count)
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['rows']} rows, {report['paid']} payments marked paid"
+            + (f", mismatches: {mismatches}." if mismatches else ".")
+        ))
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from courier.eta import DEFAULT_CHUNK_SIZE, refresh_profiles
+
+
+class Command(BaseCommand):
+    help = "Fold new deliveries into the per-branch transit-time tables used for ETAs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Discard the tables and rebuild them from all tracking history.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Delivery events read per query (default: %(default)s).")
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Keep running, refreshing every this many seconds (default: run once).")
+
+    def handle(self, *args, **options):
+        def progress(added):
+            self.stdout.write(f"folded in {added} deliveries")
+
+        rebuild = options['rebuild']
+        while True:
+            added = refresh_profiles(
+                rebuild=rebuild,
+                chunk_size=options['chunk_size'],
+                progress=progress if options['verbosity'] > 1 else None,
+            )
+            self.stdout.write(self.style.SUCCESS(f"Added {added} deliveries to the ETA tables."))
+            if not options['interval']:
+                return
+            rebuild = False
+            time.sleep(options['interval'])
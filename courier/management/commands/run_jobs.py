@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from courier.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (exports, bulk deletes, user imports), "
+        "after requeueing lost jobs and deleting expired export files. Needed "
+        "when JOBS_IN_PROCESS is off."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help="Keep polling for new jobs every N seconds instead of exiting when idle.")
+
+    def handle(self, *args, **options):
+        while True:
+            ran = run_pending()
+            if ran:
+                self.stdout.write(f"Ran {ran} job(s).")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
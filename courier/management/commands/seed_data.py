@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from courier.seeding import DEFAULT_BATCH_SIZE, SEED_PASSWORD, seed
+
+
+class Command(BaseCommand):
+    help = "Insert synthetic branches, couriers, customers, shipments, tracking and payments with bulk_create."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branches', type=int, default=10)
+        parser.add_argument('--couriers', type=int, default=50)
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--shipments', type=int, default=10000)
+        parser.add_argument('--payment-ratio', type=float, default=0.8,
+                            help="Fraction of shipments that get a Payment row (default: %(default)s).")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for reproducible data.")
+
+    def handle(self, *args, **options):
+        if options['branches'] < 1:
+            raise CommandError("At least one branch is required.")
+
+        def progress(counts):
+            self.stdout.write(f"{counts['shipments']} shipments, {counts['tracking']} tracking rows, {counts['payments']} payments")
+
+        counts = seed(
+            branches=options['branches'], couriers=options['couriers'],
+            customers=options['customers'], shipments=options['shipments'],
+            payment_ratio=options['payment_ratio'], batch_size=options['batch_size'],
+            random_seed=options['seed'], progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "Seeded " + ", ".join(f"{value} {name}" for name, value in counts.items())
+            + f". All users have password '{SEED_PASSWORD}'."
+        ))
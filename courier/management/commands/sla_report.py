@@ -0,0 +1,37 @@
+import json
+from django.core.management.base import BaseCommand
+from courier.analytics import DEFAULT_CHUNK_SIZE, compute_sla_report
+
+
+class Command(BaseCommand):
+    help = "Report on-time rate, lateness and transit-time percentiles per branch and service type."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', type=int, help="Only report on this branch id.")
+        parser.add_argument('--service-type', help="Only report on this service type.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Shipments fetched per query (default: %(default)s).")
+        parser.add_argument('--json', action='store_true', help="Print the raw report as JSON.")
+
+    def handle(self, *args, **options):
+        report = compute_sla_report(
+            branch_id=options['branch'],
+            service_type=options['service_type'],
+            chunk_size=options['chunk_size'],
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        header = f"{'branch':>8} {'service':<14} {'shipments':>10} {'delivered':>10} {'on-time':>8} {'p50 h':>7} {'p90 h':>7} {'p99 h':>7}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in report:
+            rate = row['on_time_rate']
+            transit = row['transit_hours']
+            self.stdout.write(
+                f"{row['branch_id'] or '-':>8} {row['service_type']:<14} {row['shipments']:>10} "
+                f"{row['delivered']:>10} {f'{rate:.1%}' if rate is not None else '-':>8} "
+                f"{transit['p50'] or '-':>7} {transit['p90'] or '-':>7} {transit['p99'] or '-':>7}"
+            )
@@ -0,0 +1,165 @@
+# courier/metrics.py
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Upper bounds of the histogram buckets; +Inf is implicit
+DURATION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+PHASES = ('total', 'db', 'serialize', 'render', 'app')
+
+
+# ---------------------------
+# Request timings
+# ---------------------------
+# Timings of the request being handled in the current thread/task, if any
+current_timings = ContextVar('courier_request_timings', default=None)
+
+
+class RequestTimings:
+    __slots__ = ('queries', 'db', 'serialize', 'render', 'render_start', 'depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.render_start = None
+        self.depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook: count and time every query
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Count the enclosed block as serializer time of the current request (see
+    courier.serializers.TimedModelSerializer). Queries run inside it, such
+    as lazy relation loads, are subtracted, so `serialize` is pure Python
+    time; nested blocks count once. Outside a request this costs one
+    ContextVar lookup.
+    """
+    timings = current_timings.get()
+    if timings is None or timings.depth:
+        yield
+        return
+    timings.depth += 1
+    db_before = timings.db
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.depth -= 1
+        timings.serialize += time.perf_counter() - start - (timings.db - db_before)
+
+
+# ---------------------------
+# Histograms
+# ---------------------------
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    In-process per-endpoint histograms of request phase durations and query
+    counts. Each worker process keeps its own registry; Prometheus sums the
+    series across scrape targets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations = {}  # (view, method, phase) -> Histogram
+        self._queries = {}    # (view, method) -> Histogram
+
+    def record(self, view, method, timings):
+        with self._lock:
+            for phase in PHASES:
+                key = (view, method, phase)
+                histogram = self._durations.get(key)
+                if histogram is None:
+                    histogram = self._durations[key] = Histogram(DURATION_BUCKETS_MS)
+                histogram.observe(timings[phase])
+            key = (view, method)
+            histogram = self._queries.get(key)
+            if histogram is None:
+                histogram = self._queries[key] = Histogram(QUERY_BUCKETS)
+            histogram.observe(timings['queries'])
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._queries.clear()
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            lines.append('# HELP courier_request_phase_milliseconds Time spent per request phase.')
+            lines.append('# TYPE courier_request_phase_milliseconds histogram')
+            for (view, method, phase), histogram in sorted(self._durations.items()):
+                labels = f'view="{view}",method="{method}",phase="{phase}"'
+                lines.extend(_histogram_lines('courier_request_phase_milliseconds', labels, histogram))
+
+            lines.append('# HELP courier_request_queries Database queries per request.')
+            lines.append('# TYPE courier_request_queries histogram')
+            for (view, method), histogram in sorted(self._queries.items()):
+                labels = f'view="{view}",method="{method}"'
+                lines.extend(_histogram_lines('courier_request_queries', labels, histogram))
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+    yield f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}'
+    yield f'{name}_sum{{{labels}}} {histogram.total:.3f}'
+    yield f'{name}_count{{{labels}}} {histogram.count}'
+
+
+registry = MetricsRegistry()
+
+
+# ---------------------------
+# Scrape endpoint
+# ---------------------------
+def metrics_view(request):
+    """
+    Expose the registry for Prometheus. When PERF_METRICS_TOKEN is set the
+    scraper must send it as a bearer token; otherwise only INTERNAL_IPS (or
+    any client under DEBUG) may scrape.
+    """
+    token = getattr(settings, 'PERF_METRICS_TOKEN', None)
+    if token:
+        allowed = request.headers.get('Authorization') == f'Bearer {token}'
+    else:
+        allowed = settings.DEBUG or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,183 @@
+# courier/middleware.py
+
+import re
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from .metrics import RequestTimings, current_timings, registry
+from .renderers import MessagePackRenderer
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Brotli's default (11) is meant for static assets; 5 compresses about as
+# well as gzip -6 at a similar speed
+BROTLI_QUALITY = 5
+# Only API data is compressed. HTML pages (admin, browsable API) carry CSRF
+# tokens next to request-controlled text, which compression would expose
+# to BREACH.
+COMPRESSED_RENDERERS = (JSONRenderer, MessagePackRenderer)
+
+# ---------------------------
+# Middleware
+# ---------------------------
+class PerformanceMiddleware:
+    """
+    Record query count, DB time, serializer time and render time for every
+    request and feed the per-endpoint histograms served by
+    courier.metrics.metrics_view. The same timings go out as a Server-Timing
+    header to INTERNAL_IPS and admins only (to everyone with
+    PERF_SERVER_TIMING_PUBLIC). Disable with PERF_METRICS_ENABLED = False.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERF_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        total = time.perf_counter() - start
+
+        phases = {
+            'total': total * 1000,
+            'db': timings.db * 1000,
+            'serialize': timings.serialize * 1000,
+            'render': timings.render * 1000,
+            'queries': timings.queries,
+        }
+        phases['app'] = max(phases['total'] - phases['db'] - phases['serialize'] - phases['render'], 0.0)
+
+        if self.shows_timing(request):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={phases["db"]:.2f};desc="{timings.queries} queries"',
+                f'serialize;dur={phases["serialize"]:.2f}',
+                f'render;dur={phases["render"]:.2f}',
+                f'app;dur={phases["app"]:.2f}',
+                f'total;dur={phases["total"]:.2f}',
+            ])
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        registry.record(view, request.method, phases)
+        return response
+
+    @staticmethod
+    def shows_timing(request):
+        """Whether this client may see how the time was spent (query counts included)."""
+        if getattr(settings, 'PERF_SERVER_TIMING_PUBLIC', False):
+            return True
+        if request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS:
+            return True
+        # DRF copies the user it authenticated onto the Django request
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_authenticated and (user.is_staff or getattr(user, 'role', None) == 'admin'))
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook; time until the
+        # post-render callback fires
+        timings = current_timings.get()
+        if timings is not None:
+            timings.render_start = time.perf_counter()
+            response.add_post_render_callback(self._rendered)
+        return response
+
+    @staticmethod
+    def _rendered(response):
+        timings = current_timings.get()
+        if timings is not None and timings.render_start is not None:
+            timings.render += time.perf_counter() - timings.render_start
+
+
+# ---------------------------
+# Response compression
+# ---------------------------
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header, codings lower-cased."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header, offered):
+    """
+    The coding from `offered` (in order of preference) the client weights
+    highest, or None if it accepts none of them. '*' covers codings the
+    header does not name; q=0 means "not acceptable".
+    """
+    accepted = accepted_encodings(header)
+    default = accepted.get('*', 0.0)
+    best = max(offered, key=lambda coding: accepted.get(coding, default))
+    return best if accepted.get(best, default) > 0 else None
+
+
+class CompressionMiddleware:
+    """
+    Compress API responses (JSON or MessagePack, see COMPRESSED_RENDERERS)
+    of at least RESPONSE_COMPRESSION_MIN_BYTES with brotli (when installed)
+    or gzip, whichever the client's Accept-Encoding prefers. Small responses
+    are sent as they are: below the threshold compression costs more than
+    it saves.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_bytes = getattr(settings, 'RESPONSE_COMPRESSION_MIN_BYTES', 1024)
+        self.offered = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            not isinstance(getattr(response, 'accepted_renderer', None), COMPRESSED_RENDERERS)
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < self.min_bytes
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.offered)
+        if encoding == 'br':
+            compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        elif encoding == 'gzip':
+            compressed = compress_string(response.content)
+        else:
+            return response
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        if response.has_header('ETag'):
+            response['ETag'] = re.sub(r'^(W/)?"', 'W/"', response['ETag'])
+        return response
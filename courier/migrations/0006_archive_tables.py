@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courier', '0005_alter_customuser_email_alter_customuser_role_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedShipment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('tracking_number', models.CharField(max_length=20, unique=True)),
+                ('sender_name', models.CharField(max_length=100)),
+                ('sender_address', models.TextField()),
+                ('receiver_name', models.CharField(max_length=100)),
+                ('receiver_address', models.TextField()),
+                ('weight', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('package_type', models.CharField(blank=True, max_length=50)),
+                ('service_type', models.CharField(choices=[('same_day', 'Same Day'), ('overnight', 'Overnight'), ('economy', 'Economy'), ('international', 'International')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_warehouse', 'In Warehouse'), ('out_for_delivery', 'Out for Delivery'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('pickup_date', models.DateTimeField(blank=True, null=True)),
+                ('delivery_date', models.DateTimeField(blank=True, null=True)),
+                ('estimated_delivery', models.DateTimeField(blank=True, null=True)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('branch', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courier.branch')),
+                ('courier', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courier.courierstaff')),
+                ('created_by', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('payment_type', models.CharField(choices=[('cod', 'Cash on Delivery'), ('online', 'Online')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid')], max_length=10)),
+                ('payment_date', models.DateTimeField(blank=True, null=True)),
+                ('shipment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='payment', to='courier.archivedshipment')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedNotification',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('message', models.TextField()),
+                ('sent_at', models.DateTimeField()),
+                ('notification_type', models.CharField(choices=[('sms', 'SMS'), ('email', 'Email')], max_length=20)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('shipment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='courier.archivedshipment')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedShipmentTracking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_warehouse', 'In Warehouse'), ('out_for_delivery', 'Out for Delivery'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('updated_at', models.DateTimeField()),
+                ('location', models.CharField(blank=True, max_length=100)),
+                ('shipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracking_updates', to='courier.archivedshipment')),
+            ],
+        ),
+    ]
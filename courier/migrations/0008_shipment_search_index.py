@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:23
+
+from django.db import migrations
+
+# Frozen copy of the schema in courier.search as of this migration
+FIELDS = 'tracking_number, sender_name, sender_address, receiver_name, receiver_address'
+PG_VECTOR = (
+    "to_tsvector('simple', coalesce(tracking_number, '') || ' ' || coalesce(sender_name, '') || ' ' || "
+    "coalesce(sender_address, '') || ' ' || coalesce(receiver_name, '') || ' ' || coalesce(receiver_address, ''))"
+)
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS courier_shipment_search USING fts5("
+            f"{FIELDS}, tokenize='unicode61', prefix='2 3')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS courier_shipment_search_idx ON courier_shipment USING GIN ({PG_VECTOR})"
+        )
+
+
+def populate_index(apps, schema_editor):
+    # PostgreSQL builds its expression index on creation
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f"INSERT INTO courier_shipment_search (rowid, {FIELDS}) "
+            "SELECT id, coalesce(tracking_number, ''), coalesce(sender_name, ''), coalesce(sender_address, ''), "
+            "coalesce(receiver_name, ''), coalesce(receiver_address, '') FROM courier_shipment"
+        )
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS courier_shipment_search")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS courier_shipment_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courier', '0007_notification_inbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(populate_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:26
+
+from django.db import migrations
+
+
+def reconcile_assignments(apps, schema_editor):
+    """
+    Shipment.courier becomes the only record of who carries a shipment.
+    Where the FK is empty but the M2M still lists a courier, keep the most
+    recently written M2M row; where both are set the FK already wins.
+    """
+    CourierStaff = apps.get_model('courier', 'CourierStaff')
+    Shipment = apps.get_model('courier', 'Shipment')
+    through = CourierStaff.assigned_shipments.through
+    db_alias = schema_editor.connection.alias
+
+    orphaned = (
+        through.objects.using(db_alias)
+        .filter(shipment__courier__isnull=True)
+        .order_by('shipment_id', 'id')
+        .values_list('shipment_id', 'courierstaff_id')
+    )
+    latest = dict(orphaned.iterator())
+    for shipment_id, courier_id in latest.items():
+        Shipment.objects.using(db_alias).filter(id=shipment_id).update(courier_id=courier_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courier', '0009_shipment_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(reconcile_assignments, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='courierstaff',
+            name='assigned_shipments',
+        ),
+    ]
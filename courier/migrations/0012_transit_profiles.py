@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courier', '0011_gazetteer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransitProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_type', models.CharField(choices=[('same_day', 'Same Day'), ('overnight', 'Overnight'), ('economy', 'Economy'), ('international', 'International')], max_length=20)),
+                ('histogram', models.JSONField(default=dict)),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('percentiles', models.JSONField(default=dict)),
+                ('last_tracking_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='transit_profiles', to='courier.branch')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('branch', 'service_type'), name='transit_profile_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courier', '0015_background_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShipmentDirectory',
+            fields=[
+                ('tracking_number', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('shipment_id', models.BigIntegerField()),
+                ('shard', models.CharField(max_length=50)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='shipment',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='courier.shipment'),
+        ),
+        migrations.AlterField(
+            model_name='shipment',
+            name='branch',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shipments', to='courier.branch'),
+        ),
+        migrations.AlterField(
+            model_name='shipment',
+            name='courier',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shipments', to='courier.courierstaff'),
+        ),
+        migrations.AlterField(
+            model_name='shipment',
+            name='created_by',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shipments', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courier', '0016_shard_directory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='branch',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:10
+
+from django.db import migrations, models
+
+
+def copy_watermarks(apps, schema_editor):
+    """The single watermark counted ids on 'default', the only shard before."""
+    TransitProfile = apps.get_model('courier', 'TransitProfile')
+    db_alias = schema_editor.connection.alias
+    for profile in TransitProfile.objects.using(db_alias).exclude(last_tracking_id=0):
+        profile.watermarks = {'default': profile.last_tracking_id}
+        profile.save(update_fields=['watermarks'])
+
+
+def restore_watermark(apps, schema_editor):
+    TransitProfile = apps.get_model('courier', 'TransitProfile')
+    db_alias = schema_editor.connection.alias
+    for profile in TransitProfile.objects.using(db_alias):
+        profile.last_tracking_id = profile.watermarks.get('default', 0)
+        profile.save(update_fields=['last_tracking_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courier', '0018_shipment_last_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transitprofile',
+            name='watermarks',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(copy_watermarks, restore_watermark),
+        migrations.RemoveField(
+            model_name='transitprofile',
+            name='last_tracking_id',
+        ),
+    ]
@@ -2,8 +2,9 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
 import uuid
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import pre_save
 from django.dispatch import receiver
+from .sharding import ShardedQuerySet
 
 # ---------------------------
 # Custom User
@@ -30,6 +31,13 @@ class CustomUser(AbstractUser):
 # ---------------------------
 # Branch
 # ---------------------------
+class ActiveBranchManager(models.Manager):
+    """Branches not (being) deleted. Related lookups still see every branch."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Branch(models.Model):
     name = models.CharField(max_length=100)
     location = models.TextField()
@@ -42,6 +50,12 @@ class Branch(models.Model):
     )
     contact_number = models.CharField(max_length=15)
     opening_hours = models.CharField(max_length=50, blank=True)
+    # set when the branch is deleted; its dependants are detached by a
+    # background job (courier.branches) before the row itself goes
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ActiveBranchManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.name
@@ -78,10 +92,26 @@ class Shipment(models.Model):
     pickup_date = models.DateTimeField(null=True, blank=True)
     delivery_date = models.DateTimeField(null=True, blank=True)
     estimated_delivery = models.DateTimeField(null=True, blank=True)
-    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='shipments')
-    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, related_name='shipments')
-    courier = models.ForeignKey('CourierStaff', on_delete=models.SET_NULL, null=True, blank=True, related_name='shipments')
+    # no database constraints: shipments may live on a branch shard (courier.sharding)
+    # while users, branches and couriers stay on 'default'
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, db_constraint=False, related_name='shipments')
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, db_constraint=False, related_name='shipments')
+    courier = models.ForeignKey('CourierStaff', on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False, related_name='shipments')
     notes = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # latest tracking event, kept current as events are written (signals.py)
+    # so list views need not load the history
+    last_event_at = models.DateTimeField(null=True, blank=True)
+    last_event_location = models.CharField(max_length=100, blank=True)
+    event_count = models.PositiveIntegerField(default=0)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # a courier's active route sheet
+            models.Index(fields=['courier', 'status'], name='shipment_courier_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.tracking_number} - {self.status}"
@@ -100,22 +130,16 @@ def generate_tracking_number(sender, instance, **kwargs):
 class CourierStaff(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, limit_choices_to={'role': 'staff'})
     branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, related_name='staff_members')
-    assigned_shipments = models.ManyToManyField(Shipment, blank=True, related_name='assigned_staff')
     is_available = models.BooleanField(default=True)
 
     def __str__(self):
         return self.user.username
 
-
-# Auto-update courier availability based on shipment status
-@receiver(post_save, sender=Shipment)
-def update_courier_availability(sender, instance, **kwargs):
-    if instance.courier:
-        if instance.status in ['out_for_delivery', 'pending', 'in_warehouse']:
-            instance.courier.is_available = False
-        else:  # delivered or cancelled
-            instance.courier.is_available = True
-        instance.courier.save()
+    @property
+    def assigned_shipments(self):
+        # Compatibility accessor: assignment lives only in Shipment.courier now.
+        # Returns the reverse FK manager, so .all()/.filter()/.add()/.remove() keep working.
+        return self.shipments
 
 
 # ---------------------------
@@ -127,6 +151,8 @@ class ShipmentTracking(models.Model):
     updated_at = models.DateTimeField(auto_now_add=True)
     location = models.CharField(max_length=100, blank=True)
 
+    objects = ShardedQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.shipment.tracking_number} - {self.status} at {self.updated_at}"
 
@@ -151,6 +177,8 @@ class Payment(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     payment_date = models.DateTimeField(null=True, blank=True)
 
+    objects = ShardedQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if self.status == 'paid' and not self.payment_date:
             self.payment_date = timezone.now()
@@ -180,10 +208,209 @@ class Rate(models.Model):
 class Notification(models.Model):
     NOTIFICATION_CHOICES = (('sms','SMS'),('email','Email'))
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notifications')
-    shipment = models.ForeignKey(Shipment, on_delete=models.CASCADE, null=True, blank=True)
+    shipment = models.ForeignKey(Shipment, on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
     message = models.TextField()
     sent_at = models.DateTimeField(auto_now_add=True)
     notification_type = models.CharField(max_length=20, choices=NOTIFICATION_CHOICES)
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # inbox listing: a user's (unread) notifications, newest first
+            models.Index(fields=['user', 'is_read', '-sent_at'], name='notification_inbox_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.notification_type} at {self.sent_at}"
+
+
+# ---------------------------
+# Archive (cold storage)
+# ---------------------------
+# Terminal shipments older than the retention window are moved here by
+# courier.archive together with their tracking, payment and notification rows.
+# Primary keys are kept from the hot tables so archived rows stay addressable.
+class ArchivedShipment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    tracking_number = models.CharField(max_length=20, unique=True)
+    sender_name = models.CharField(max_length=100)
+    sender_address = models.TextField()
+    receiver_name = models.CharField(max_length=100)
+    receiver_address = models.TextField()
+    weight = models.DecimalField(max_digits=6, decimal_places=2)
+    package_type = models.CharField(max_length=50, blank=True)
+    service_type = models.CharField(max_length=20, choices=Shipment.SERVICE_CHOICES)
+    status = models.CharField(max_length=20, choices=Shipment.STATUS_CHOICES)
+    pickup_date = models.DateTimeField(null=True, blank=True)
+    delivery_date = models.DateTimeField(null=True, blank=True)
+    estimated_delivery = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, db_constraint=False, related_name='+')
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, db_constraint=False, related_name='+')
+    courier = models.ForeignKey(CourierStaff, on_delete=models.SET_NULL, null=True, db_constraint=False, related_name='+')
+    notes = models.TextField(blank=True, null=True)
+    last_event_at = models.DateTimeField(null=True, blank=True)
+    last_event_location = models.CharField(max_length=100, blank=True)
+    event_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.tracking_number} - {self.status} (archived)"
+
+
+class ArchivedShipmentTracking(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    shipment = models.ForeignKey(ArchivedShipment, on_delete=models.CASCADE, related_name='tracking_updates')
+    status = models.CharField(max_length=20, choices=Shipment.STATUS_CHOICES)
+    updated_at = models.DateTimeField()
+    location = models.CharField(max_length=100, blank=True)
+
+
+class ArchivedPayment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    shipment = models.OneToOneField(ArchivedShipment, on_delete=models.CASCADE, related_name='payment')
+    payment_type = models.CharField(max_length=10, choices=Payment.PAYMENT_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=Payment.STATUS_CHOICES)
+    payment_date = models.DateTimeField(null=True, blank=True)
+
+
+class ArchivedNotification(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    shipment = models.ForeignKey(ArchivedShipment, on_delete=models.CASCADE, null=True, blank=True)
+    message = models.TextField()
+    sent_at = models.DateTimeField()
+    notification_type = models.CharField(max_length=20, choices=Notification.NOTIFICATION_CHOICES)
+    is_read = models.BooleanField(default=False)
+
+
+# ---------------------------
+# Gazetteer (offline geocoding)
+# ---------------------------
+# Known places loaded from a local file (see the load_gazetteer command).
+# `key` is the normalised name, e.g. "canal road, lahore" or "lahore", and is
+# matched against the trailing comma-separated parts of an address.
+class GazetteerEntry(models.Model):
+    key = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    def __str__(self):
+        return self.name
+
+
+# ---------------------------
+# Transit-time profiles (ETA tables)
+# ---------------------------
+# Histogram of observed pickup-to-delivery times per branch and service type,
+# maintained incrementally by the refresh_eta_tables command (see courier.eta).
+# branch is null for the network-wide profile of a service type.
+class TransitProfile(models.Model):
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, null=True, blank=True, related_name='transit_profiles')
+    service_type = models.CharField(max_length=20, choices=Shipment.SERVICE_CHOICES)
+    histogram = models.JSONField(default=dict)  # {bin index: count}, sparse
+    samples = models.PositiveIntegerField(default=0)
+    percentiles = models.JSONField(default=dict)  # {"p50": hours, ...}
+    watermarks = models.JSONField(default=dict)  # {shard alias: newest delivered event folded in}
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'service_type'], name='transit_profile_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.branch or 'All branches'} - {self.service_type}"
+
+
+# ---------------------------
+# Idempotency keys
+# ---------------------------
+# First response to a request sent with an Idempotency-Key header, replayed
+# for retries of the same request (see courier.idempotency). A row with a
+# null status is a request still being processed.
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # sha256 of method, path and body
+    status_code = models.PositiveSmallIntegerField(null=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    body = models.BinaryField(blank=True)  # zlib-compressed response content
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id})"
+
+
+# ---------------------------
+# Change feed
+# ---------------------------
+# Append-only log of shipment and tracking-event changes, written in the
+# same transaction as the change itself. The id is the change-feed cursor,
+# so it must never be reused (SQLite AUTOINCREMENT, sequences elsewhere).
+class ChangeLogEntry(models.Model):
+    ENTITY_CHOICES = (
+        ('shipment', 'Shipment'),
+        ('tracking', 'Tracking event'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    entity = models.CharField(max_length=10, choices=ENTITY_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.entity} {self.object_id}{' deleted' if self.deleted else ''}"
+
+
+# ---------------------------
+# Background jobs
+# ---------------------------
+# Long-running work (exports, bulk deletes) queued by the API and run by
+# courier.jobs outside the request, with progress the client can poll.
+class BackgroundJob(models.Model):
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='+')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    processed = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(null=True, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)  # heartbeat while running
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+# ---------------------------
+# Shard directory
+# ---------------------------
+# Tracking number -> shard of the shipment, kept on 'default' so tracking
+# lookups, which carry no branch, go straight to one shard. Only written
+# while more than one shard is configured (courier.sharding).
+class ShipmentDirectory(models.Model):
+    tracking_number = models.CharField(max_length=20, primary_key=True)
+    shipment_id = models.BigIntegerField()
+    shard = models.CharField(max_length=50)
+
+    def __str__(self):
+        return f"{self.tracking_number} -> {self.shard}"
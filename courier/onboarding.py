@@ -0,0 +1,208 @@
+# courier/onboarding.py
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+from . import caching, jobs
+from .models import BackgroundJob, Branch, CourierStaff, CustomUser
+
+IMPORT_ROLES = ('staff', 'manager', 'super_manager')
+DEFAULT_BATCH_SIZE = 1000
+# Larger files go through the import_users command instead of the API
+MAX_REQUEST_ROWS = 500
+# Below this many passwords a process pool costs more to start than it saves
+POOL_THRESHOLD = 16
+
+
+# ---------------------------
+# Input
+# ---------------------------
+def parse_rows(content, fmt):
+    """Rows (dicts) from CSV text with a header line, or a JSON list of objects."""
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if fmt == 'csv':
+        return [dict(row) for row in csv.DictReader(io.StringIO(content))]
+    if fmt == 'json':
+        rows = json.loads(content)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("JSON input must be a list of objects")
+        return rows
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+class ImportRowSerializer(serializers.Serializer):
+    # Field checks only; uniqueness is checked for all rows at once in
+    # validate_rows instead of two queries per row
+    username = serializers.CharField(max_length=150)
+    email = serializers.EmailField()
+    password = serializers.CharField()
+    role = serializers.ChoiceField(choices=IMPORT_ROLES)
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    branch = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate(self, attrs):
+        if attrs['role'] == 'staff' and not attrs['branch']:
+            raise serializers.ValidationError({'branch': "Courier staff need a branch (id or name)."})
+        return attrs
+
+
+# ---------------------------
+# Validation
+# ---------------------------
+def _branch_lookup(values):
+    """Branch id by the id or exact name given in the import file."""
+    ids = {int(v) for v in values if v.isdigit()}
+    names = {v for v in values if not v.isdigit()}
+    lookup = {str(branch_id): branch_id for branch_id in Branch.objects.filter(id__in=ids).values_list('id', flat=True)}
+    lookup.update(Branch.objects.filter(name__in=names).values_list('name', 'id'))
+    return lookup
+
+
+def validate_rows(rows):
+    """
+    Validate every row. Returns (valid, errors): valid is a list of
+    (row number, cleaned data) and errors a list of {'row', 'errors'},
+    with rows numbered from 1 as in the file.
+    """
+    cleaned, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        serializer = ImportRowSerializer(data=row)
+        if serializer.is_valid():
+            cleaned.append((number, dict(serializer.validated_data)))
+        else:
+            errors.append({'row': number, 'errors': serializer.errors})
+
+    usernames = {data['username'] for _, data in cleaned}
+    emails = {data['email'] for _, data in cleaned} | {data['email'].lower() for _, data in cleaned}
+    taken_usernames = set(CustomUser.objects.filter(username__in=usernames).values_list('username', flat=True))
+    taken_emails = {e.lower() for e in CustomUser.objects.filter(email__in=emails).values_list('email', flat=True)}
+    branches = _branch_lookup({data['branch'] for _, data in cleaned if data['branch']})
+
+    valid, seen_usernames, seen_emails = [], set(), set()
+    for number, data in cleaned:
+        row_errors = {}
+        email = data['email'].lower()
+        if data['username'] in taken_usernames or data['username'] in seen_usernames:
+            row_errors['username'] = ["A user with that username already exists."]
+        if email in taken_emails or email in seen_emails:
+            row_errors['email'] = ["A user with that email already exists."]
+        if data['branch'] and data['branch'] not in branches:
+            row_errors['branch'] = [f"Unknown branch '{data['branch']}'."]
+        seen_usernames.add(data['username'])
+        seen_emails.add(email)
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+        else:
+            data['branch_id'] = branches.get(data.pop('branch'))
+            valid.append((number, data))
+    errors.sort(key=lambda error: error['row'])
+    return valid, errors
+
+
+# ---------------------------
+# Password hashing
+# ---------------------------
+def hash_passwords(passwords, workers=None):
+    """
+    make_password for every password, spread over a process pool. Workers
+    are started by a fork server, not forked from the caller (which may be
+    a threaded web process), and run django.setup before hashing.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < POOL_THRESHOLD:
+        return [make_password(password) for password in passwords]
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context(method), initializer=django.setup,
+    ) as pool:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def hash_row_passwords(rows, workers=None):
+    """
+    Copies of `rows` with every password replaced by its hash, for rows
+    that are stored (in a job) before they are imported with hashed=True.
+    """
+    rows = [dict(row) if isinstance(row, dict) else row for row in rows]
+    hashed = [row for row in rows if isinstance(row, dict) and isinstance(row.get('password'), str)]
+    for row, password in zip(hashed, hash_passwords([row['password'] for row in hashed], workers=workers)):
+        row['password'] = password
+    return rows
+
+
+# ---------------------------
+# Import
+# ---------------------------
+def import_users(rows, partial=False, dry_run=False, workers=None, batch_size=DEFAULT_BATCH_SIZE, hashed=False):
+    """
+    Create users (and a CourierStaff profile in its branch for every staff
+    row) from parsed rows. All rows are validated first; unless `partial`,
+    nothing is created when any row has errors. With `hashed`, passwords
+    are already hashed (see hash_row_passwords). Returns a report with the
+    number of users created and the per-row errors.
+    """
+    valid, errors = validate_rows(rows)
+    report = {'rows': len(rows), 'created': 0, 'errors': errors}
+    if dry_run or not valid or (errors and not partial):
+        return report
+
+    hashes = [data['password'] for _, data in valid]
+    if not hashed:
+        hashes = hash_passwords(hashes, workers=workers)
+    users = [
+        CustomUser(
+            username=data['username'], email=data['email'], role=data['role'], password=password,
+            first_name=data['first_name'], last_name=data['last_name'],
+        )
+        for (_, data), password in zip(valid, hashes)
+    ]
+    try:
+        with transaction.atomic():
+            users = CustomUser.objects.bulk_create(users, batch_size=batch_size)
+            CourierStaff.objects.bulk_create(
+                [
+                    CourierStaff(user=user, branch_id=data['branch_id'])
+                    for user, (_, data) in zip(users, valid) if data['role'] == 'staff'
+                ],
+                batch_size=batch_size,
+            )
+            # bulk_create sends no post_save, so invalidate cached user lists here
+            caching.bump_version('users')
+    except IntegrityError:
+        # a username or email was taken between validation and insert
+        report['errors'].append({'row': None, 'errors': {'non_field_errors': [
+            "Another request created one of these users meanwhile; nothing was imported."
+        ]}})
+        return report
+
+    report['created'] = len(users)
+    return report
+
+
+# ---------------------------
+# Job
+# ---------------------------
+@jobs.register('import-users')
+def run_import(job, progress):
+    """
+    Import the rows posted to the API. Their passwords were hashed before
+    the job was saved, so no plain-text password is stored; the rows are
+    still cleared from the job once it ends.
+    """
+    rows = job.params['rows']
+    progress(0, total=len(rows))
+    try:
+        report = import_users(rows, partial=job.params.get('partial', False), hashed=True)
+    finally:
+        BackgroundJob.objects.filter(pk=job.pk).update(params={**job.params, 'rows': []})
+    progress(len(rows))
+    return report
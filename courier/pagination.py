@@ -0,0 +1,137 @@
+# courier/pagination.py
+
+import base64
+import datetime
+import json
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+# ---------------------------
+# Cursor encoding
+# ---------------------------
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder truncates datetimes to milliseconds, which would make
+    # keyset comparisons skip rows that differ only in microseconds.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    """Encode the sort-key values of the last row into an opaque cursor."""
+    raw = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Clamp a ?page_size= query parameter. Raises ValueError if not a number."""
+    if value in (None, ''):
+        return default
+    return max(1, min(int(value), MAX_PAGE_SIZE))
+
+
+# ---------------------------
+# Keyset pagination
+# ---------------------------
+def keyset_filter(ordering, values):
+    """
+    Q object selecting rows strictly after `values` in `ordering`, e.g. for
+    ('-sent_at', '-id'): sent_at < v0 OR (sent_at = v0 AND id < v1).
+    The last ordering field must be unique so pages never overlap.
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def keyset_paginate(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return (rows, next_cursor) for one page of `queryset` in `ordering`.
+    Unlike OFFSET pagination, every page is a single index range scan no
+    matter how deep the client has paged. Works on model and values() querysets.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor)))
+
+    try:
+        rows = list(queryset[:page_size + 1])
+    except ValidationError:
+        # cursor values that do not fit the ordering fields
+        raise ValueError("Invalid cursor")
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        names = [field.lstrip('-') for field in ordering]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor([last[name] for name in names])
+        else:
+            next_cursor = encode_cursor([getattr(last, name) for name in names])
+    return rows, next_cursor
+
+
+# ---------------------------
+# Estimated-count paginator
+# ---------------------------
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for very large tables. An unfiltered queryset's count comes
+    from planner statistics (PostgreSQL) or the highest primary key (SQLite)
+    instead of a full COUNT(*); a filtered count stops at `max_count` rows,
+    so deep result sets are truncated rather than scanned.
+    """
+    max_count = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        if not queryset.query.where:
+            estimate = _estimated_table_rows(queryset.model, queryset.db)
+            if estimate is not None:
+                return estimate
+        return queryset.order_by()[:self.max_count].count()
+
+
+def _estimated_table_rows(model, using):
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            # -1 / 0 until the table has been analyzed
+            return row[0] if row and row[0] > 0 else None
+        if connection.vendor == 'sqlite':
+            pk = model._meta.pk.column
+            cursor.execute(f'SELECT MAX("{pk}") FROM "{table}"')
+            return cursor.fetchone()[0] or 0
+    return None
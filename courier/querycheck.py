@@ -0,0 +1,152 @@
+# courier/querycheck.py
+
+import functools
+import logging
+import sys
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from rest_framework.fields import Field
+
+logger = logging.getLogger('courier.querycheck')
+
+# A query shape seen this many times in one request is reported as N+1
+DEFAULT_REPEAT_THRESHOLD = 3
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode (QUERY_BUDGET_STRICT) when a view goes over its budget."""
+
+
+def _serializer_origin():
+    """
+    'SerializerClass.field' of the innermost serializer field on the call
+    stack, i.e. the field whose evaluation issued the current query.
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        owner = frame.f_locals.get('self')
+        if isinstance(owner, Field) and owner.field_name and owner.parent is not None:
+            return f"{type(owner.parent).__name__}.{owner.field_name}"
+        frame = frame.f_back
+    return None
+
+
+class QueryInspector:
+    """
+    Context manager that watches every query on every connection and groups
+    them by SQL shape (the statement with placeholders, before parameters
+    are bound). A shape executed repeatedly with different parameters is
+    the signature of an N+1 relation load.
+    """
+
+    def __init__(self, repeat_threshold=DEFAULT_REPEAT_THRESHOLD):
+        self.repeat_threshold = repeat_threshold
+        self.count = 0
+        self.shapes = {}   # sql -> [count, distinct params, origin]
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        entry = self.shapes.get(sql)
+        if entry is None:
+            self.shapes[sql] = [1, {repr(params)}, None]
+        else:
+            entry[0] += 1
+            entry[1].add(repr(params))
+            # only pay for the stack walk once a shape actually repeats
+            if entry[2] is None:
+                entry[2] = _serializer_origin() or '<unknown>'
+        return execute(sql, params, many, context)
+
+    def repeated(self):
+        """[(sql, executions, origin)] for shapes that look like N+1 loads."""
+        return [
+            (sql, count, origin)
+            for sql, (count, params, origin) in self.shapes.items()
+            if count >= self.repeat_threshold and len(params) > 1
+        ]
+
+    def report(self, view_name):
+        lines = [f"{view_name}: {self.count} queries"]
+        for sql, count, origin in self.repeated():
+            lines.append(f"  N+1 x{count} from {origin}: {sql[:200]}")
+        return '\n'.join(lines)
+
+
+def inspection_enabled():
+    return settings.DEBUG or getattr(settings, 'QUERY_BUDGET_STRICT', False)
+
+
+# ---------------------------
+# Per-view budgets
+# ---------------------------
+def query_budget(max_queries, methods=None):
+    """
+    Class decorator for APIViews declaring the most queries one request may
+    run, optionally only for some HTTP methods. Over budget (or with an N+1
+    pattern) it logs a warning; with QUERY_BUDGET_STRICT it raises
+    QueryBudgetExceeded so tests fail. Only active under DEBUG or strict mode.
+
+        @query_budget(5)
+        class BranchShipmentsAPIView(APIView):
+            ...
+    """
+    def decorate(view_class):
+        dispatch = view_class.dispatch
+
+        @functools.wraps(dispatch)
+        def budgeted_dispatch(self, request, *args, **kwargs):
+            if not inspection_enabled() or (methods and request.method not in methods):
+                return dispatch(self, request, *args, **kwargs)
+
+            with QueryInspector() as inspector:
+                response = dispatch(self, request, *args, **kwargs)
+            view_name = f"{view_class.__name__} {request.method}"
+            over_budget = inspector.count > max_queries
+            if over_budget or inspector.repeated():
+                message = inspector.report(view_name)
+                if over_budget:
+                    message += f"\n  budget: {max_queries}"
+                if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+
+        view_class.dispatch = budgeted_dispatch
+        view_class.query_budget = max_queries
+        return view_class
+    return decorate
+
+
+# ---------------------------
+# Development middleware
+# ---------------------------
+class QueryInspectionMiddleware:
+    """
+    Log N+1 patterns for every request in development, naming the view and
+    the serializer field that issued them. A no-op unless DEBUG is on.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DEBUG:
+            return self.get_response(request)
+
+        with QueryInspector() as inspector:
+            response = self.get_response(request)
+        if inspector.repeated():
+            match = request.resolver_match
+            logger.warning(inspector.report(match.view_name if match else request.path))
+        return response
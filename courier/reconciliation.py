@@ -0,0 +1,172 @@
+# courier/reconciliation.py
+
+import csv
+import io
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from . import sharding
+from .models import Payment
+
+DEFAULT_BATCH_SIZE = 1000
+REQUIRED_COLUMNS = ('tracking_number', 'amount')
+# The API returns at most this many mismatch rows; the counts cover all of them
+MAX_REPORTED_MISMATCHES = 1000
+
+MISMATCH_KINDS = ('invalid', 'unknown', 'amount', 'already_paid', 'duplicate')
+
+
+# ---------------------------
+# Input
+# ---------------------------
+def iter_csv(fileobj):
+    """
+    Rows (dicts) of a reconciliation CSV, read line by line from a binary or
+    text file object so the file is never held in memory whole. Expected
+    columns: tracking_number, amount and optionally paid_at (ISO date or
+    datetime); others are ignored.
+    """
+    if not isinstance(fileobj, io.TextIOBase):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(fileobj)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    return reader
+
+
+def _parse_paid_at(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid paid_at '{value}'")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _clean(row):
+    """(tracking number, amount, paid_at) of one row; ValueError if malformed."""
+    tracking_number = (row.get('tracking_number') or '').strip()
+    if not tracking_number:
+        raise ValueError("Missing tracking_number")
+    try:
+        amount = Decimal((row.get('amount') or '').strip()).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount '{row.get('amount')}'")
+    return tracking_number, amount, _parse_paid_at((row.get('paid_at') or '').strip())
+
+
+# ---------------------------
+# Reconciliation
+# ---------------------------
+def _reconcile_batch(batch, dry_run, now, seen):
+    """
+    Match one batch of (row number, raw row). `seen` maps the tracking
+    numbers of earlier rows to their row number, across batches, and is
+    updated. Returns (paid count, mismatches).
+    """
+    mismatches = []
+    cleaned = {}
+    for number, row in batch:
+        try:
+            tracking_number, amount, paid_at = _clean(row)
+        except ValueError as exc:
+            mismatches.append({'row': number, 'kind': 'invalid', 'detail': str(exc)})
+            continue
+        if tracking_number in seen:
+            mismatches.append({'row': number, 'kind': 'duplicate', 'tracking_number': tracking_number,
+                               'detail': f"Also on row {seen[tracking_number]}"})
+            continue
+        seen[tracking_number] = number
+        cleaned[tracking_number] = (number, amount, paid_at)
+
+    payments = (
+        Payment.objects
+        .filter(shipment__tracking_number__in=list(cleaned))
+        .annotate(tracking_number=F('shipment__tracking_number'))
+        .only('id', 'amount', 'status', 'payment_date')
+    )
+    found = {payment.tracking_number: payment for payment in sharding.gather(payments)}
+
+    settled = []
+    for tracking_number, (number, amount, paid_at) in cleaned.items():
+        payment = found.get(tracking_number)
+        mismatch = {'row': number, 'tracking_number': tracking_number}
+        if payment is None:
+            mismatches.append({**mismatch, 'kind': 'unknown', 'detail': "No payment on record"})
+        elif payment.amount != amount:
+            mismatches.append({**mismatch, 'kind': 'amount',
+                               'detail': f"Recorded {payment.amount}, file {amount}"})
+        elif payment.status == 'paid':
+            mismatches.append({**mismatch, 'kind': 'already_paid',
+                               'detail': f"Paid on {payment.payment_date.isoformat() if payment.payment_date else 'unknown date'}"})
+        else:
+            settled.append((mismatch, payment, paid_at or now))
+
+    paid = len(settled)
+    if settled and not dry_run:
+        paid = 0
+        by_shard = {}
+        for entry in settled:
+            by_shard.setdefault(entry[1]._state.db, []).append(entry)
+        for shard, entries in by_shard.items():
+            with transaction.atomic(using=shard):
+                # the payments read above may have been settled since, by
+                # another run or the payment flow; only still-pending rows
+                # (locked until commit where the backend can) are written
+                pending = set(
+                    Payment.objects.using(shard).select_for_update()
+                    .filter(pk__in=[payment.pk for _, payment, _ in entries], status='pending')
+                    .values_list('pk', flat=True)
+                )
+                by_date = {}
+                for mismatch, payment, paid_at in entries:
+                    if payment.pk in pending:
+                        by_date.setdefault(paid_at, []).append(payment.pk)
+                    else:
+                        mismatches.append({**mismatch, 'kind': 'already_paid', 'detail': "Settled meanwhile"})
+                for paid_at, ids in by_date.items():
+                    paid += Payment.objects.using(shard).filter(pk__in=ids, status='pending').update(
+                        status='paid', payment_date=paid_at,
+                    )
+    mismatches.sort(key=lambda mismatch: mismatch['row'])
+    return paid, mismatches
+
+
+def reconcile_payments(rows, dry_run=False, batch_size=DEFAULT_BATCH_SIZE, on_mismatch=None, progress=None):
+    """
+    Mark the payments listed in `rows` (an iterable of dicts, e.g. from
+    iter_csv) as paid. Rows are consumed `batch_size` at a time: one IN
+    lookup, then per shard one locking read and one conditional UPDATE per
+    paid date, each batch committed on its own, so memory holds one batch
+    and the tracking numbers seen (to flag duplicates across batches). Rows
+    that do not match a pending payment of the same amount are passed to
+    `on_mismatch` and left alone.
+    Returns counts: rows, paid and mismatches per kind.
+    """
+    report = {'rows': 0, 'paid': 0, 'mismatches': dict.fromkeys(MISMATCH_KINDS, 0)}
+    now = timezone.now()
+    numbered = enumerate(rows, start=1)
+    seen = {}
+    while True:
+        batch = list(islice(numbered, batch_size))
+        if not batch:
+            return report
+        paid, mismatches = _reconcile_batch(batch, dry_run, now, seen)
+        report['rows'] += len(batch)
+        report['paid'] += paid
+        for mismatch in mismatches:
+            report['mismatches'][mismatch['kind']] += 1
+            if on_mismatch:
+                on_mismatch(mismatch)
+        if progress:
+            progress(report)
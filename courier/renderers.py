@@ -0,0 +1,72 @@
+# courier/renderers.py
+
+import decimal
+from rest_framework import renderers
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib json encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: the MessagePack format is simply not offered
+    msgpack = None
+
+# Types orjson would format differently from DRF (datetimes) or not at all
+# (Decimal, lazy strings, querysets...) are handed to DRF's own encoder, so
+# both renderers produce the same values as the stock JSONRenderer.
+_drf_default = JSONEncoder().default
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer backed by orjson when it is installed. Output matches the
+    stock renderer's compact form; indented output (the browsable API, or
+    an explicit indent in the Accept header) still goes through stdlib json.
+    """
+    available = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=_drf_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        # same escaping as the stock renderer, for JSON embedded in <script>
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def _msgpack_default(obj):
+    # Decimals stay exact strings ("12.50"), as serializers already emit them
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    return _drf_default(obj)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    application/msgpack: the same structure as the JSON responses in a
+    smaller binary encoding. Only offered when msgpack is installed.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    available = msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True, datetime=False)
+
+
+class AvailableRendererNegotiation(DefaultContentNegotiation):
+    """Content negotiation that skips renderers whose library is missing."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderers = [r for r in renderers if getattr(r, 'available', True)]
+        return super().select_renderer(request, renderers, format_suffix)
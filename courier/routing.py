@@ -0,0 +1,160 @@
+# courier/routing.py
+
+import csv
+import re
+from pathlib import Path
+import numpy as np
+from .models import GazetteerEntry
+
+DEFAULT_GAZETTEER = Path(__file__).resolve().parent / 'data' / 'gazetteer.csv'
+EARTH_RADIUS_KM = 6371.0
+MAX_TWO_OPT_ITERATIONS = 5000
+_SPACES = re.compile(r'\s+')
+
+
+# ---------------------------
+# Gazetteer loading
+# ---------------------------
+def load_gazetteer(path=DEFAULT_GAZETTEER, batch_size=5000):
+    """
+    Upsert places from a CSV file with name, latitude and longitude columns.
+    Returns the number of rows read.
+    """
+    loaded = 0
+    with open(path, newline='', encoding='utf-8') as handle:
+        batch = []
+        for row in csv.DictReader(handle):
+            batch.append(GazetteerEntry(
+                key=normalize_place(row['name']), name=row['name'].strip(),
+                latitude=float(row['latitude']), longitude=float(row['longitude']),
+            ))
+            if len(batch) >= batch_size:
+                loaded += upsert_places(batch)
+                batch = []
+        loaded += upsert_places(batch)
+    return loaded
+
+
+def upsert_places(entries):
+    """Insert GazetteerEntry rows, overwriting existing ones with the same key."""
+    GazetteerEntry.objects.bulk_create(
+        entries, update_conflicts=True, unique_fields=['key'],
+        update_fields=['name', 'latitude', 'longitude'],
+    )
+    return len(entries)
+
+
+# ---------------------------
+# Geocoding against the gazetteer
+# ---------------------------
+def normalize_place(text):
+    """Lower-case, single-spaced, comma-separated form used as gazetteer key."""
+    parts = (_SPACES.sub(' ', part).strip().lower() for part in text.split(','))
+    return ', '.join(part for part in parts if part)
+
+
+def candidate_keys(address):
+    """
+    Gazetteer keys an address may match, most specific first:
+    "House 4, Canal Road, Lahore" -> the whole address, "canal road, lahore", "lahore".
+    """
+    parts = normalize_place(address or '').split(', ')
+    return [', '.join(parts[i:]) for i in range(len(parts)) if parts[i]]
+
+
+def geocode(addresses):
+    """
+    (latitude, longitude) for each address, or None where no part of it is
+    in the gazetteer. One query for the whole batch.
+    """
+    candidates = [candidate_keys(address) for address in addresses]
+    keys = {key for keys in candidates for key in keys}
+    points = dict(
+        (key, (lat, lon)) for key, lat, lon in
+        GazetteerEntry.objects.filter(key__in=keys).values_list('key', 'latitude', 'longitude')
+    ) if keys else {}
+    return [next((points[key] for key in keys if key in points), None) for keys in candidates]
+
+
+# ---------------------------
+# Route heuristics
+# ---------------------------
+def distance_matrix(points):
+    """Great-circle distances in km between every pair of (lat, lon) points."""
+    lat, lon = np.radians(np.asarray(points, dtype=float)).T
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_neighbour(dist, start=0):
+    """Greedy tour: from `start`, always visit the closest unvisited node."""
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    route = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[route[-1]])
+        nxt = int(np.argmin(row))
+        route.append(nxt)
+        visited[nxt] = True
+    return np.array(route)
+
+
+def two_opt(dist, route, max_iterations=MAX_TWO_OPT_ITERATIONS):
+    """
+    Improve a path with fixed endpoints by segment reversal. Each iteration
+    scores every edge pair at once and applies the best improving move.
+    """
+    route = route.copy()
+    for _ in range(max_iterations):
+        a, b = route[:-1], route[1:]
+        edge = dist[a, b]
+        # gain of replacing edges (a_i, b_i) and (a_j, b_j) with (a_i, a_j) and (b_i, b_j)
+        delta = dist[a[:, None], a[None, :]] + dist[b[:, None], b[None, :]] - edge[:, None] - edge[None, :]
+        delta = np.triu(delta, 2)  # only non-adjacent pairs with j > i
+        i, j = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[i, j] >= -1e-9:
+            break
+        route[i + 1:j + 1] = route[i + 1:j + 1][::-1]
+    return route
+
+
+def order_stops(points, start=None):
+    """
+    Visiting order (indexes into `points`) for an open route beginning at
+    `start`, or anywhere when there is no start point.
+    """
+    if len(points) < 2:
+        return list(range(len(points)))
+
+    # node 0 is the start, the last node a free end at zero distance from
+    # everything so the path may finish at any stop
+    nodes = [start if start is not None else points[0]] + list(points)
+    n = len(nodes)
+    dist = np.zeros((n + 1, n + 1))
+    dist[:n, :n] = distance_matrix(nodes)
+    if start is None:
+        dist[0, :] = dist[:, 0] = 0.0
+
+    route = nearest_neighbour(dist[:n, :n])
+    route = two_opt(dist, np.append(route, n))
+    return [int(node) - 1 for node in route[1:-1]]
+
+
+def optimize_sequence(stops, start_address=None):
+    """
+    Order (id, address) stops into a delivery sequence of ids. Stops whose
+    address cannot be geocoded keep their relative order at the end.
+    """
+    stops = list(stops)
+    points = geocode([address for _, address in stops] + [start_address or ''])
+    start = points.pop()
+
+    located = [(stop_id, point) for (stop_id, _), point in zip(stops, points) if point is not None]
+    order = order_stops([point for _, point in located], start=start)
+    return (
+        [located[index][0] for index in order]
+        + [stop_id for (stop_id, _), point in zip(stops, points) if point is None]
+    )
@@ -0,0 +1,161 @@
+# courier/search.py
+
+import re
+from django.db import connection, connections
+from . import sharding
+
+# Shipment columns covered by the full-text index
+INDEXED_FIELDS = ('tracking_number', 'sender_name', 'sender_address', 'receiver_name', 'receiver_address')
+
+# SQLite: FTS5 virtual table keyed by shipment id (rowid), created by
+# migration 0008
+FTS_TABLE = 'courier_shipment_search'
+
+# PostgreSQL: GIN expression index; queries must repeat this expression verbatim
+PG_INDEX = 'courier_shipment_search_idx'
+PG_VECTOR = "to_tsvector('simple', " + " || ' ' || ".join(
+    f"coalesce({field}, '')" for field in INDEXED_FIELDS
+) + ")"
+
+_COLUMNS = ', '.join(INDEXED_FIELDS)
+_SELECTED = ', '.join(f"coalesce({field}, '')" for field in INDEXED_FIELDS)
+
+MAX_RESULTS = 1000
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def backend():
+    """'sqlite', 'postgresql' or None when the database has no search index."""
+    return connection.vendor if connection.vendor in ('sqlite', 'postgresql') else None
+
+
+# ---------------------------
+# Keeping the index in sync
+# ---------------------------
+def index_shipment(shipment):
+    """(Re)index one shipment. PostgreSQL maintains its expression index itself."""
+    if backend() != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [shipment.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, {_COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s)",
+            [shipment.pk] + [getattr(shipment, field) or '' for field in INDEXED_FIELDS],
+        )
+
+
+def unindex_shipments(shipment_ids):
+    """Drop rows for shipments that are deleted or moved out of the hot table."""
+    if backend() != 'sqlite' or not shipment_ids:
+        return
+    with connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(shipment_ids))
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", list(shipment_ids))
+
+
+def rebuild_index(batch_size=10000, progress=None):
+    """
+    Rebuild the index from courier_shipment on every shard, in primary-key
+    batches. Returns the number of shipments indexed.
+
+    The SQLite index lives on 'default' and covers every shard (shipment ids
+    are unique across shards): default's rows are copied entirely in SQL,
+    other shards' rows are read and inserted batch by batch. On PostgreSQL
+    each shard's expression index is rebuilt in place.
+    """
+    vendor = backend()
+    if vendor == 'postgresql':
+        indexed = 0
+        for alias in sharding.shards():
+            with connections[alias].cursor() as cursor:
+                cursor.execute(f"REINDEX INDEX {PG_INDEX}")
+                cursor.execute("SELECT COUNT(*) FROM courier_shipment")
+                indexed += cursor.fetchone()[0]
+        return indexed
+    if vendor != 'sqlite':
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    indexed = 0
+    for alias in sharding.shards():
+        copy = _copy_local_batch if alias == 'default' else _copy_shard_batch
+        last_id = 0
+        while True:
+            count, last_id = copy(alias, last_id, batch_size)
+            if not count:
+                break
+            indexed += count
+            if progress:
+                progress(indexed)
+    return indexed
+
+
+def _copy_local_batch(alias, last_id, batch_size):
+    # shipments on 'default', next to the index: one INSERT ... SELECT
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT MAX(id), COUNT(*) FROM (SELECT id FROM courier_shipment WHERE id > %s ORDER BY id LIMIT %s)",
+            [last_id, batch_size],
+        )
+        upper, count = cursor.fetchone()
+        if count:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, {_COLUMNS}) "
+                f"SELECT id, {_SELECTED} FROM courier_shipment WHERE id > %s AND id <= %s",
+                [last_id, upper],
+            )
+    return count, upper
+
+
+def _copy_shard_batch(alias, last_id, batch_size):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f"SELECT id, {_SELECTED} FROM courier_shipment WHERE id > %s ORDER BY id LIMIT %s",
+            [last_id, batch_size],
+        )
+        rows = cursor.fetchall()
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, {_COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s)", rows,
+            )
+    return len(rows), rows[-1][0] if rows else last_id
+
+
+# ---------------------------
+# Querying
+# ---------------------------
+def search_shipment_ids(query, offset=0, limit=50):
+    """
+    Shipment ids matching every word of `query` as a prefix, best match
+    first (bm25 on SQLite, ts_rank on PostgreSQL). The SQLite index on
+    'default' covers every shard; on PostgreSQL each shard is searched for
+    its best `offset + limit` matches and the results merged by rank.
+    """
+    tokens = _TOKEN.findall(query)
+    vendor = backend()
+    if not tokens or vendor is None:
+        return []
+    limit = max(0, min(limit, MAX_RESULTS - offset))
+
+    if vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}) LIMIT %s OFFSET %s",
+                [' '.join(f'"{token}"*' for token in tokens), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    matches = []
+    for alias in sharding.shards():
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, ts_rank({PG_VECTOR}, query) FROM courier_shipment, to_tsquery('simple', %s) query "
+                f"WHERE {PG_VECTOR} @@ query ORDER BY ts_rank({PG_VECTOR}, query) DESC, id LIMIT %s",
+                [' & '.join(f'{token}:*' for token in tokens), offset + limit],
+            )
+            matches.extend(cursor.fetchall())
+    matches.sort(key=lambda match: (-match[1], match[0]))
+    return [pk for pk, _ in matches[offset:offset + limit]]
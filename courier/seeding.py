@@ -0,0 +1,204 @@
+# courier/seeding.py
+
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from . import caching, changefeed, routing, search
+from .models import CustomUser, Branch, Shipment, CourierStaff, ShipmentTracking, Payment, GazetteerEntry
+
+DEFAULT_BATCH_SIZE = 5000
+SEED_PASSWORD = 'password123'
+
+CITIES = [
+    'Karachi', 'Lahore', 'Islamabad', 'Rawalpindi', 'Faisalabad', 'Multan',
+    'Peshawar', 'Quetta', 'Sialkot', 'Hyderabad', 'Gujranwala', 'Bahawalpur',
+]
+FIRST_NAMES = ['Ali', 'Ahmed', 'Sara', 'Ayesha', 'Usman', 'Fatima', 'Hassan', 'Zainab', 'Bilal', 'Hina']
+LAST_NAMES = ['Khan', 'Malik', 'Qureshi', 'Sheikh', 'Butt', 'Chaudhry', 'Raza', 'Siddiqui']
+STREETS = ['Main Boulevard', 'Mall Road', 'Jinnah Avenue', 'University Road', 'Canal Road', 'GT Road']
+PACKAGE_TYPES = ['document', 'parcel', 'box', 'fragile']
+
+# (status, weight) - roughly what a live system looks like
+STATUS_MIX = [
+    ('delivered', 70), ('out_for_delivery', 10), ('in_warehouse', 8),
+    ('pending', 7), ('cancelled', 5),
+]
+# status -> tracking path leading up to it
+STATUS_PATHS = {
+    'pending': ['pending'],
+    'in_warehouse': ['pending', 'in_warehouse'],
+    'out_for_delivery': ['pending', 'in_warehouse', 'out_for_delivery'],
+    'delivered': ['pending', 'in_warehouse', 'out_for_delivery', 'delivered'],
+    'cancelled': ['pending', 'cancelled'],
+}
+SERVICE_HOURS = {'same_day': 6, 'overnight': 24, 'economy': 72, 'international': 168}
+
+
+def _person(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _address(rng):
+    return f"House {rng.randint(1, 999)}, {rng.choice(STREETS)}, {rng.choice(CITIES)}"
+
+
+def seed_gazetteer(rng):
+    """
+    Load the bundled city list and place every seeded street within a few
+    km of its city centre, so seeded addresses geocode to distinct points.
+    Returns the number of places written.
+    """
+    loaded = routing.load_gazetteer()
+    cities = GazetteerEntry.objects.filter(key__in=[routing.normalize_place(city) for city in CITIES])
+    streets = []
+    for entry in cities.order_by('id'):
+        for street in STREETS:
+            name = f"{street}, {entry.name}"
+            streets.append(GazetteerEntry(
+                key=routing.normalize_place(name), name=name,
+                latitude=entry.latitude + rng.uniform(-0.05, 0.05),
+                longitude=entry.longitude + rng.uniform(-0.05, 0.05),
+            ))
+    return loaded + routing.upsert_places(streets)
+
+
+def _users(role, count, password, prefix):
+    tag = uuid.uuid4().hex[:6]
+    return [
+        CustomUser(
+            username=f"{prefix}{tag}{i}", email=f"{prefix}{tag}{i}@example.com",
+            role=role, password=password, first_name=prefix.title(),
+        )
+        for i in range(count)
+    ]
+
+
+# ---------------------------
+# Seeder
+# ---------------------------
+def seed(branches=10, couriers=50, customers=1000, shipments=10000, payment_ratio=0.8,
+         batch_size=DEFAULT_BATCH_SIZE, random_seed=0, progress=None):
+    """
+    Insert a synthetic but realistic data set with bulk_create, bypassing
+    model signals. Every shipment gets a tracking history consistent with
+    its status and `payment_ratio` of them get a Payment row.
+    Returns a dict of row counts created.
+    """
+    rng = random.Random(random_seed)
+    password = make_password(SEED_PASSWORD)
+    now = timezone.now()
+
+    with transaction.atomic():
+        staff = CustomUser.objects.bulk_create(
+            _users('admin', 1, password, 'admin')
+            + _users('super_manager', 1, password, 'hr')
+            + _users('manager', branches, password, 'manager')
+        )
+        managers = [u for u in staff if u.role == 'manager']
+        branch_rows = Branch.objects.bulk_create([
+            Branch(
+                name=f"{CITIES[i % len(CITIES)]} Branch {i + 1}", location=_address(rng),
+                manager=managers[i], contact_number=f"0300{i:07d}", opening_hours='9am-9pm',
+            )
+            for i in range(branches)
+        ])
+
+        courier_users = CustomUser.objects.bulk_create(_users('staff', couriers, password, 'courier'))
+        courier_rows = CourierStaff.objects.bulk_create([
+            CourierStaff(user=user, branch=branch_rows[i % branches], is_available=True)
+            for i, user in enumerate(courier_users)
+        ])
+        customer_ids = [u.pk for u in CustomUser.objects.bulk_create(
+            _users('customer', customers, password, 'customer'), batch_size=batch_size
+        )]
+
+    couriers_by_branch = {}
+    for courier in courier_rows:
+        couriers_by_branch.setdefault(courier.branch_id, []).append(courier.pk)
+
+    statuses = [s for s, _ in STATUS_MIX]
+    weights = [w for _, w in STATUS_MIX]
+    services = list(SERVICE_HOURS)
+    counts = {'shipments': 0, 'tracking': 0, 'payments': 0}
+
+    for start in range(0, shipments, batch_size):
+        size = min(batch_size, shipments - start)
+        batch = []
+        for _ in range(size):
+            branch = rng.choice(branch_rows)
+            status = rng.choices(statuses, weights)[0]
+            service = rng.choice(services)
+            created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+            hours = SERVICE_HOURS[service]
+            eta = created + timedelta(hours=hours)
+            delivered = created + timedelta(hours=max(rng.gauss(hours, hours / 4), 0.5))
+            has_courier = status in ('out_for_delivery', 'delivered') and couriers_by_branch.get(branch.pk)
+            batch.append(Shipment(
+                tracking_number=uuid.uuid4().hex[:12].upper(),
+                sender_name=_person(rng), sender_address=_address(rng),
+                receiver_name=_person(rng), receiver_address=_address(rng),
+                weight=Decimal(rng.randint(10, 5000)) / 100,
+                package_type=rng.choice(PACKAGE_TYPES), service_type=service, status=status,
+                pickup_date=created,
+                delivery_date=delivered if status == 'delivered' else None,
+                estimated_delivery=eta,
+                created_by_id=rng.choice(customer_ids), branch=branch,
+                courier_id=rng.choice(couriers_by_branch[branch.pk]) if has_courier else None,
+            ))
+
+        with transaction.atomic():
+            created_rows = Shipment.objects.bulk_create(batch)
+            tracking = []
+            recorded_at = []
+            payments = []
+            for shipment in created_rows:
+                path = STATUS_PATHS[shipment.status]
+                end = shipment.delivery_date or (shipment.pickup_date + timedelta(hours=len(path)))
+                step = (end - shipment.pickup_date) / max(len(path) - 1, 1)
+                for i, status in enumerate(path):
+                    tracking.append(ShipmentTracking(
+                        shipment=shipment, status=status, location=shipment.branch.name,
+                    ))
+                    recorded_at.append(shipment.pickup_date + step * i)
+                if rng.random() < payment_ratio:
+                    paid = shipment.status == 'delivered'
+                    payments.append(Payment(
+                        shipment=shipment, payment_type=rng.choice(['cod', 'online']),
+                        amount=Decimal(rng.randint(200, 5000)), status='paid' if paid else 'pending',
+                        payment_date=end if paid else None,
+                    ))
+            ShipmentTracking.objects.bulk_create(tracking)
+            # auto_now_add stamps the insert time; write the history's own times over it
+            for event, when in zip(tracking, recorded_at):
+                event.updated_at = when
+            ShipmentTracking.objects.bulk_update(tracking, ['updated_at'])
+            # bulk_create also skips the post_save hook keeping the latest-event columns
+            latest = {event.shipment_id: event for event in tracking}
+            for shipment in created_rows:
+                event = latest[shipment.pk]
+                shipment.last_event_at, shipment.last_event_location = event.updated_at, event.location
+                shipment.event_count = len(STATUS_PATHS[shipment.status])
+            Shipment.objects.bulk_update(created_rows, ['last_event_at', 'last_event_location', 'event_count'])
+            Payment.objects.bulk_create(payments)
+            changefeed.record_changes('shipment', [row.pk for row in created_rows])
+            changefeed.record_changes('tracking', [row.pk for row in tracking])
+
+        counts['shipments'] += len(created_rows)
+        counts['tracking'] += len(tracking)
+        counts['payments'] += len(payments)
+        if progress:
+            progress(counts)
+
+    # bulk_create bypasses the post_save hook that maintains the search index
+    search.rebuild_index()
+    # ...and the signals that invalidate cached branch and user lists
+    caching.bump_version('branches')
+    caching.bump_version('users')
+    counts['places'] = seed_gazetteer(random.Random(random_seed))
+
+    counts.update(branches=branches, couriers=couriers, customers=customers)
+    return counts
@@ -1,10 +1,43 @@
+import heapq
 from rest_framework import serializers
-from .models import CustomUser, Branch, Shipment, CourierStaff, ShipmentTracking, Payment
+from django.core.exceptions import ImproperlyConfigured
+from .models import (
+    CustomUser, Branch, Shipment, CourierStaff, ShipmentTracking, Payment, Notification, BackgroundJob,
+    ArchivedShipment, ArchivedShipmentTracking,
+)
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
+from django.urls import reverse
+from .metrics import timed_serialization
 
 User = get_user_model()
 
+
+# -------------------- Timed base classes --------------------
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class TimedModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer whose `.data`, many=True included, counts as serializer
+    time in PerformanceMiddleware's per-request timings.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = cls.__dict__.get('Meta')
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
 # -------------------- Safe JWT Login Serializer --------------------
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     # Use email as the login field
@@ -47,13 +80,13 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         
 
 # -------------------- User Serializers --------------------
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(TimedModelSerializer):
     class Meta:
         model = CustomUser
         fields = ['id', 'username', 'email', 'role', 'first_name', 'last_name']
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
 
     class Meta:
@@ -83,21 +116,22 @@ class ChangePasswordSerializer(serializers.Serializer):
 
 
 # -------------------- Branch Serializer --------------------
-class BranchSerializer(serializers.ModelSerializer):
+class BranchSerializer(TimedModelSerializer):
     class Meta:
         model = Branch
-        fields = '__all__'
+        # set only by delete_branch, which also queues the detach job
+        exclude = ['deleted_at']
 
 
 # -------------------- Shipment Tracking --------------------
-class ShipmentTrackingSerializer(serializers.ModelSerializer):
+class ShipmentTrackingSerializer(TimedModelSerializer):
     class Meta:
         model = ShipmentTracking
         fields = ['id', 'status', 'updated_at', 'location']
 
 
 # -------------------- Shipment Serializer --------------------
-class ShipmentSerializer(serializers.ModelSerializer):
+class ShipmentSerializer(TimedModelSerializer):
     created_by = CustomUserSerializer(read_only=True)
     branch = BranchSerializer(read_only=True)
     courier = serializers.SerializerMethodField()
@@ -130,11 +164,184 @@ class ShipmentSerializer(serializers.ModelSerializer):
         return None
 
 
+class ShipmentSummarySerializer(ShipmentSerializer):
+    """
+    List rows: the latest tracking event from the shipment's denormalized
+    columns instead of the whole history (see track-shipment for that).
+    """
+    class Meta(ShipmentSerializer.Meta):
+        fields = [field for field in ShipmentSerializer.Meta.fields if field != 'tracking_updates'] + [
+            'last_event_at', 'last_event_location', 'event_count',
+        ]
+
+
+# -------------------- Values-based list serializers --------------------
+# DRF fields whose to_representation returns a database value unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.CharField, serializers.EmailField, serializers.ChoiceField, serializers.IntegerField,
+    serializers.BooleanField, serializers.PrimaryKeyRelatedField,
+)
+
+
+class ValuesSerializer:
+    """
+    Read-only, many=True counterpart of `serializer_class` that renders
+    straight from values_list() tuples: no model instances, and no DRF field
+    call for columns passed through as read. The plan (columns to select,
+    how to convert and nest each) is compiled from serializer_class's fields
+    once per class. SerializerMethodFields have no column; declare their
+    output in `method_fields` as {key: values path or nested dict}, a
+    nested dict rendering as None when its 'id' is None.
+    """
+    serializer_class = None
+    method_fields = {}
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    @classmethod
+    def plan(cls):
+        if '_plan' not in cls.__dict__:
+            columns = []
+            nodes = cls._compile_fields(cls.serializer_class().fields, '', columns)
+            cls._plan = (nodes, tuple(columns))
+        return cls._plan
+
+    @classmethod
+    def _compile_fields(cls, fields, prefix, columns):
+        # node: (key, column index, converter or None, child nodes or None)
+        def column(path):
+            if path not in columns:
+                columns.append(path)
+            return columns.index(path)
+
+        nodes = []
+        for key, field in fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                if key not in cls.method_fields:
+                    raise ImproperlyConfigured(f"{cls.__name__}.method_fields has no entry for '{key}'")
+                nodes.append(cls._compile_spec(key, cls.method_fields[key], column))
+            elif field.source == '*' or '.' in field.source or isinstance(field, serializers.ListSerializer):
+                raise ImproperlyConfigured(f"{cls.__name__} cannot read '{key}' from values()")
+            elif isinstance(field, serializers.ModelSerializer):
+                path = f'{prefix}{field.source}__'
+                pk = field.Meta.model._meta.pk.name
+                nodes.append((key, column(path + pk), None, cls._compile_fields(field.fields, path, columns)))
+            else:
+                convert = None if type(field) in PASSTHROUGH_FIELDS else field.to_representation
+                nodes.append((key, column(prefix + field.source), convert, None))
+        return nodes
+
+    @classmethod
+    def _compile_spec(cls, key, spec, column):
+        if isinstance(spec, str):
+            return (key, column(spec), None, None)
+        children = [cls._compile_spec(child, child_spec, column) for child, child_spec in spec.items()]
+        return (key, column(spec['id']), None, children)
+
+    @property
+    def data(self):
+        nodes, columns = self.plan()
+        with timed_serialization():
+            return [_render(nodes, row) for row in self.queryset.values_list(*columns)]
+
+    @classmethod
+    def merged(cls, querysets, order):
+        """
+        Rendered rows of several querysets of the same model whose related
+        rows live in another database (shards), merged in `order` (a field
+        name, '-' for descending; nulls sort lowest as in SQLite). Each
+        queryset, already ordered by `order`, selects its own columns and
+        foreign keys only; each relation's columns are then read in one
+        query for all rows.
+        """
+        nodes, columns = cls.plan()
+        model = querysets[0].model
+        local = [column for column in columns if '__' not in column]
+        relations = {}
+        for column in columns:
+            if '__' in column:
+                name, path = column.split('__', 1)
+                relations.setdefault(name, []).append(path)
+        fields = {name: model._meta.get_field(name) for name in relations}
+        field = order.lstrip('-')
+        selected = local + [fields[name].attname for name in relations] + ([field] if field not in local else [])
+
+        position = selected.index(field)
+        rows = list(heapq.merge(
+            *[queryset.values_list(*selected) for queryset in querysets],
+            key=lambda row: (row[position] is not None, row[position]), reverse=order.startswith('-'),
+        ))
+
+        related = {}
+        for offset, (name, paths) in enumerate(relations.items(), start=len(local)):
+            ids = {row[offset] for row in rows} - {None}
+            queryset = fields[name].related_model._base_manager.filter(pk__in=ids)
+            related[name] = (offset, {values[0]: values[1:] for values in queryset.values_list('pk', *paths)})
+
+        def lookup(column):
+            if '__' not in column:
+                index = local.index(column)
+                return lambda row: row[index]
+            name, path = column.split('__', 1)
+            offset, by_id = related[name]
+            index = relations[name].index(path)
+            return lambda row: by_id[row[offset]][index] if row[offset] in by_id else None
+
+        getters = [lookup(column) for column in columns]
+        with timed_serialization():
+            return [_render(nodes, [get(row) for get in getters]) for row in rows]
+
+
+def _render(nodes, row):
+    data = {}
+    for key, index, convert, children in nodes:
+        value = row[index]
+        if children is not None:
+            data[key] = None if value is None else _render(children, row)
+        elif value is None or convert is None:
+            data[key] = value
+        else:
+            data[key] = convert(value)
+    return data
+
+
+class ShipmentSummaryRows(ValuesSerializer):
+    """ShipmentSummarySerializer output for the list endpoints, read from values()."""
+    serializer_class = ShipmentSummarySerializer
+    # ShipmentSerializer.get_courier
+    method_fields = {
+        'courier': {
+            'id': 'courier__id',
+            'user': {'id': 'courier__user__id', 'username': 'courier__user__username', 'email': 'courier__user__email'},
+            'branch': {'id': 'courier__branch__id', 'name': 'courier__branch__name'},
+            'is_available': 'courier__is_available',
+        },
+    }
+
+
+# -------------------- Archived Shipment Serializers --------------------
+class ArchivedShipmentTrackingSerializer(TimedModelSerializer):
+    class Meta:
+        model = ArchivedShipmentTracking
+        fields = ['id', 'status', 'updated_at', 'location']
+
+
+class ArchivedShipmentSerializer(ShipmentSerializer):
+    # Same representation as ShipmentSerializer, read from the archive tables
+    tracking_updates = ArchivedShipmentTrackingSerializer(many=True, read_only=True)
+
+    class Meta(ShipmentSerializer.Meta):
+        model = ArchivedShipment
+
+
 # -------------------- Courier Staff Serializer --------------------
-class CourierStaffSerializer(serializers.ModelSerializer):
+class CourierStaffSerializer(TimedModelSerializer):
     user = CustomUserSerializer(read_only=True)
     branch = BranchSerializer(read_only=True)
-    assigned_shipments = ShipmentSerializer(many=True, read_only=True)
+    assigned_shipments = ShipmentSerializer(source='shipments', many=True, read_only=True)
 
     class Meta:
         model = CourierStaff
@@ -142,7 +349,7 @@ class CourierStaffSerializer(serializers.ModelSerializer):
 
 
 # -------------------- Payment Serializer --------------------
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(TimedModelSerializer):
     shipment = ShipmentSerializer(read_only=True)
     shipment_id = serializers.PrimaryKeyRelatedField(
         queryset=Shipment.objects.all(), write_only=True, source='shipment'
@@ -151,3 +358,30 @@ class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = ['id', 'shipment', 'shipment_id', 'payment_type', 'amount', 'status', 'payment_date']
+
+
+# -------------------- Notification Serializer --------------------
+class NotificationSerializer(TimedModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ['id', 'shipment', 'message', 'notification_type', 'sent_at', 'is_read']
+
+
+# -------------------- Background Job Serializer --------------------
+class BackgroundJobSerializer(TimedModelSerializer):
+    params = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BackgroundJob
+        fields = ['id', 'kind', 'params', 'status', 'processed', 'total', 'result', 'error',
+                  'created_at', 'started_at', 'finished_at', 'download_url']
+
+    def get_params(self, job):
+        # the rows of a user import carry plain-text passwords
+        return {key: value for key, value in job.params.items() if key != 'rows'}
+
+    def get_download_url(self, job):
+        if job.kind != 'export' or job.status != 'done':
+            return None
+        return reverse('export-download', kwargs={'job_id': job.pk})
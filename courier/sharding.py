@@ -0,0 +1,208 @@
+# courier/sharding.py
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, models
+
+# Models stored on their branch's shard: a shipment and everything written
+# with it. Users, branches, couriers, notifications and the rest stay on
+# 'default'; rows on a shard refer to them by id only (no FK constraints).
+SHARDED_MODELS = frozenset({'shipment', 'shipmenttracking', 'payment', 'changelogentry'})
+
+# Shard n hands out ids from n * ID_SPAN, so a shipment's (or tracking
+# event's) id alone tells which shard holds it and ids stay unique overall
+ID_SPAN = 10 ** 12
+
+
+def shards():
+    """Database aliases holding shipments, 'default' first."""
+    return list(getattr(settings, 'SHARD_ALIASES', ['default']))
+
+
+def enabled():
+    return len(shards()) > 1
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'courier' and model._meta.model_name in SHARDED_MODELS
+
+
+# ---------------------------
+# Placement
+# ---------------------------
+def shard_for_branch(branch_id):
+    """
+    Shard for a branch's shipments: SHARD_MAP[branch_id] if pinned, else by
+    branch id modulo the shard count. Pin existing branches in SHARD_MAP
+    before adding a shard, as rows are not moved between shards. Shipments
+    without a branch live on 'default'.
+    """
+    aliases = shards()
+    if branch_id is None or len(aliases) == 1:
+        return 'default'
+    pinned = getattr(settings, 'SHARD_MAP', {}).get(branch_id)
+    return pinned or aliases[branch_id % len(aliases)]
+
+
+def shard_for_id(pk):
+    """Shard holding the sharded row with this id (see ID_SPAN)."""
+    aliases = shards()
+    index = int(pk) // ID_SPAN
+    return aliases[index] if 0 <= index < len(aliases) else 'default'
+
+
+def group_by_shard(ids):
+    """{alias: [ids]} for ids of sharded rows."""
+    groups = {}
+    for pk in ids:
+        groups.setdefault(shard_for_id(pk), []).append(pk)
+    return groups
+
+
+def scatter(queryset):
+    """The same queryset on every shard, for admin-wide reads to gather."""
+    return [queryset.using(alias) for alias in shards()]
+
+
+def gather(queryset, order=None):
+    """
+    Rows of `queryset` from every shard as one list, merged in `order`
+    (a field name, '-' for descending; nulls sort lowest as in SQLite).
+    With a single shard this is just list(queryset).
+    """
+    if not enabled():
+        return list(queryset)
+    rows = [row for shard in scatter(queryset) for row in shard]
+    if order:
+        field = order.lstrip('-')
+        rows.sort(key=lambda row: (getattr(row, field) is not None, getattr(row, field)),
+                  reverse=order.startswith('-'))
+    return rows
+
+
+# ---------------------------
+# Tracking-number directory
+# ---------------------------
+def register_tracking_number(shipment, using):
+    from .models import ShipmentDirectory
+    ShipmentDirectory.objects.update_or_create(
+        tracking_number=shipment.tracking_number,
+        defaults={'shipment_id': shipment.pk, 'shard': using},
+    )
+
+
+def shard_for_tracking_number(tracking_number):
+    """
+    Shard of the shipment with this tracking number, from the directory on
+    'default'. Numbers missing from it (e.g. bulk-loaded rows) are looked
+    up on each shard in turn; None if no shard has them.
+    """
+    if not enabled():
+        return 'default'
+    from .models import Shipment, ShipmentDirectory
+    entry = ShipmentDirectory.objects.filter(tracking_number=tracking_number).values_list('shard', flat=True).first()
+    if entry:
+        return entry
+    for alias in shards():
+        if Shipment.objects.using(alias).filter(tracking_number=tracking_number).exists():
+            return alias
+    return None
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    Manager queryset for sharded models. create() (and so get_or_create and
+    ModelSerializer.create) lets the router place the new row from the
+    instance, where Django would pick a database from the model alone.
+    """
+
+    def create(self, **kwargs):
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+
+# ---------------------------
+# Router
+# ---------------------------
+class ShardRouter:
+    """
+    Sends shipment-family rows to their shard. A row's shard comes from the
+    instance Django passes as a hint: a saved row stays where it is, a new
+    shipment goes to its branch's shard, and children follow their
+    shipment's id. Queries without such a hint go to 'default'; code
+    reading a shard says so with .using() (see scatter, shard_for_branch
+    and shard_for_id).
+    """
+
+    def _shard(self, hints):
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        name = instance._meta.model_name
+        # a new row's _state.db may already hold a guess Django made when a
+        # related object was assigned; only a saved row's is authoritative
+        if name in SHARDED_MODELS and instance._state.db and not instance._state.adding:
+            return instance._state.db
+        if name == 'shipment':
+            return shard_for_id(instance.pk) if instance.pk else shard_for_branch(instance.branch_id)
+        if name == 'branch':
+            return shard_for_branch(instance.pk)
+        if name == 'courierstaff':
+            return shard_for_branch(instance.branch_id)
+        if getattr(instance, 'shipment_id', None):
+            return shard_for_id(instance.shipment_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        if not is_sharded(model):
+            return 'default'
+        return self._shard(hints)
+
+    def db_for_write(self, model, **hints):
+        if not is_sharded(model):
+            # explicit, or Django would follow a sharded related instance
+            return 'default'
+        return self._shard(hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # cross-shard references are plain ids; see SHARDED_MODELS
+        return True
+
+
+# ---------------------------
+# Id ranges
+# ---------------------------
+def reserve_id_ranges(using='default', **kwargs):
+    """
+    post_migrate handler: start the id sequences of sharded tables on shard
+    n at n * ID_SPAN. 'default' (n = 0) is left alone.
+    """
+    aliases = shards()
+    if using not in aliases or aliases.index(using) == 0:
+        return
+    from django.apps import apps
+    start = aliases.index(using) * ID_SPAN
+    connection = connections[using]
+    tables = [model._meta.db_table for model in apps.get_app_config('courier').get_models() if is_sharded(model)]
+    with connection.cursor() as cursor:
+        for table in tables:
+            if connection.vendor == 'sqlite':
+                cursor.execute("DELETE FROM sqlite_sequence WHERE name = %s AND seq < %s", [table, start])
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                    [table, start, table],
+                )
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s) "
+                    f'WHERE (SELECT COALESCE(MAX(id), 0) FROM "{table}") < %s',
+                    [table, start, start],
+                )
+            else:
+                raise ImproperlyConfigured(
+                    f"Shard '{using}' uses {connection.vendor}; sharding reserves id ranges on SQLite "
+                    f"and PostgreSQL only, so every alias in SHARD_ALIASES must use one of them."
+                )
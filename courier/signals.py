@@ -1,9 +1,13 @@
 # courier/signals.py
 
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.db.models import F
 from django.dispatch import receiver
-from .models import Shipment, ShipmentTracking, CourierStaff
-from .helpers import assign_shipment_to_courier, calculate_eta, notify_customer
+from django.utils import timezone
+from .models import Branch, CourierStaff, CustomUser, Shipment, ShipmentTracking
+from .helpers import assign_shipment_to_courier, notify_customer
+from . import caching, changefeed, search, sharding
 
 
 # ---------------------------
@@ -12,51 +16,140 @@ from .helpers import assign_shipment_to_courier, calculate_eta, notify_customer
 @receiver(post_save, sender=Shipment)
 def shipment_automation(sender, instance, created, **kwargs):
     """
-    Handles all shipment-related automation:
+    Handles the automation for a new shipment:
     - Initial tracking creation
-    - Courier assignment
-    - Courier availability update
-    - ETA calculation
-    - Customer notifications
+    - Customer notification
+    - Courier assignment (with ETA and courier availability)
+
+    Later status changes go through helpers.transition_shipment, which
+    runs their side effects itself.
     """
-    # ----------------- On Creation -----------------
     if created:
-        ShipmentTracking.objects.create(
-            shipment=instance,
+        instance.tracking_updates.create(
             status=instance.status,
-            location=instance.branch.name if instance.branch else None
+            location=instance.branch.name if instance.branch else "N/A"
         )
-        assign_shipment_to_courier(instance)
-        calculate_eta(instance)
         notify_customer(
             instance,
             f"Your shipment {instance.tracking_number} has been created and is currently {instance.status}."
         )
+        assign_shipment_to_courier(instance)
+
+
+# ---------------------------
+# Latest tracking event
+# ---------------------------
+@receiver(post_save, sender=ShipmentTracking)
+def record_last_event(sender, instance, created, using, **kwargs):
+    """
+    Copy a new tracking event onto its shipment's last_event_* columns and
+    count it. Bulk inserts (seeding) bypass this and set the columns
+    themselves; backfill_last_events rebuilds them from the history.
+    """
+    if not created:
+        return
+    Shipment.objects.using(using).filter(pk=instance.shipment_id).update(
+        last_event_at=instance.updated_at, last_event_location=instance.location,
+        event_count=F('event_count') + 1,
+    )
+    if ShipmentTracking.shipment.is_cached(instance):
+        # the instance the caller holds (e.g. transition_shipment's) stays current
+        shipment = instance.shipment
+        shipment.last_event_at, shipment.last_event_location = instance.updated_at, instance.location
+        shipment.event_count += 1
+
+
+# ---------------------------
+# Shard directory
+# ---------------------------
+@receiver(post_save, sender=Shipment)
+def register_shard(sender, instance, created, using, **kwargs):
+    if created and sharding.enabled():
+        sharding.register_tracking_number(instance, using)
+
+
+# ---------------------------
+# Full-text search index
+# ---------------------------
+@receiver(post_save, sender=Shipment)
+def index_shipment_for_search(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep the shipment search index current. Saves limited to columns the
+    index does not cover (e.g. status changes) are skipped.
+    """
+    if update_fields is not None and not set(update_fields) & set(search.INDEXED_FIELDS):
+        return
+    search.index_shipment(instance)
+
 
-    # ----------------- On Status Update -----------------
-    else:
-        try:
-            old_shipment = Shipment.objects.get(pk=instance.pk)
-        except Shipment.DoesNotExist:
+@receiver(post_delete, sender=Shipment)
+def unindex_deleted_shipment(sender, instance, **kwargs):
+    search.unindex_shipments([instance.pk])
+
+
+# ---------------------------
+# Versioned response cache
+# ---------------------------
+def _invalidate(resource):
+    def handler(sender, update_fields=None, **kwargs):
+        # logins only touch last_login, which no cached list shows
+        if update_fields is not None and set(update_fields) <= {'last_login'}:
             return
+        caching.bump_version(resource)
+    return handler
+
+
+for _resource, _models in caching.RESOURCES.items():
+    _handler = _invalidate(_resource)
+    for _model in _models:
+        post_save.connect(_handler, sender=_model, weak=False, dispatch_uid=f'cache-{_resource}-{_model}-save')
+        post_delete.connect(_handler, sender=_model, weak=False, dispatch_uid=f'cache-{_resource}-{_model}-delete')
+
+
+# ---------------------------
+# Change feed
+# ---------------------------
+# Entries are written inside the saving transaction when the caller holds
+# one (API writes, admin, archiving); helpers.transition_shipment writes its
+# own, as queryset updates bypass these signals. Tracking events are only
+# ever deleted together with their shipment, whose tombstone covers them.
+@receiver(post_save, sender=Shipment)
+def log_shipment_change(sender, instance, **kwargs):
+    changefeed.record_changes('shipment', [instance.pk])
+
+
+@receiver(post_save, sender=ShipmentTracking)
+def log_tracking_event(sender, instance, created, **kwargs):
+    if created:
+        changefeed.record_changes('tracking', [instance.pk])
+
+
+@receiver(pre_delete, sender=Shipment)
+def log_shipment_delete(sender, instance, **kwargs):
+    changefeed.record_changes('shipment', [instance.pk], deleted=True)
+
+
+def _detach_shard_shipments(field, pk):
+    for alias in sharding.shards()[1:]:
+        with transaction.atomic(using=alias):
+            shipments = Shipment.objects.using(alias).filter(**{field: pk})
+            ids = list(shipments.values_list('id', flat=True))
+            shipments.update(**{field: None, 'updated_at': timezone.now()})
+            changefeed.record_changes('shipment', ids)
+
+
+def _log_detached_shipments(field):
+    # deleting a branch, courier or customer nulls the foreign key on their
+    # shipments. On 'default' Django does it with a single UPDATE inside the
+    # delete's transaction; other shards are outside the deletion collector,
+    # so their shipments are detached here once the delete has committed.
+    def handler(sender, instance, using, **kwargs):
+        changefeed.record_changes('shipment', Shipment.objects.filter(**{field: instance}).values_list('id', flat=True))
+        if sharding.enabled():
+            transaction.on_commit(lambda pk=instance.pk: _detach_shard_shipments(field, pk), using=using)
+    return handler
+
 
-        if old_shipment.status != instance.status:
-            ShipmentTracking.objects.create(
-                shipment=instance,
-                status=instance.status,
-                location=instance.branch.name if instance.branch else None
-            )
-
-            if instance.courier:
-                if instance.status in ['out_for_delivery', 'pending', 'in_warehouse']:
-                    instance.courier.is_available = False
-                else:  # delivered or cancelled
-                    instance.courier.is_available = True
-                instance.courier.save()
-
-            calculate_eta(instance)
-
-            notify_customer(
-                instance,
-                f"Your shipment {instance.tracking_number} status has been updated to {instance.status}."
-            )
+for _model, _field in ((Branch, 'branch'), (CourierStaff, 'courier'), (CustomUser, 'created_by')):
+    pre_delete.connect(_log_detached_shipments(_field), sender=_model, weak=False,
+                       dispatch_uid=f'changefeed-{_model.__name__}-delete')
@@ -1,3 +1,1254 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import os
+import tempfile
+import json
+import re
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+import numpy as np
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+from .analytics import SLAAccumulator, compute_sla_report
+from .archive import archivable_shipments, archive_batch, archive_shipments
+from .benchmarks import load_fixtures
+from .changefeed import purge_change_log
+from .eta import FALLBACK_HOURS, MIN_SAMPLES, refresh_profiles, transit_hours
+from .exports import clean_params as clean_export_params, export_path, export_rows
+from .helpers import (
+    backfill_last_events, build_courier_manifest, purge_notifications, transition_shipment, with_shipment_relations,
+)
+from .idempotency import request_fingerprint
+from .jobs import run_pending
+from .metrics import registry
+from .models import (
+    ArchivedNotification, ArchivedPayment, ArchivedShipment, ArchivedShipmentTracking, BackgroundJob, Branch, ChangeLogEntry, CourierStaff, CustomUser, IdempotencyKey, Notification, Payment, Rate,
+    Shipment, ShipmentTracking, TransitProfile,
+)
+from .onboarding import import_users, parse_rows
+from .querycheck import QueryBudgetExceeded, query_budget
+from .reconciliation import iter_csv, reconcile_payments
+from .renderers import FastJSONRenderer
+from .routing import distance_matrix, geocode, nearest_neighbour, order_stops, two_opt
+from . import jobs, search, sharding, views
+from .seeding import seed
+from .throttling import RoleTokenBucketThrottle, take_tokens
+from .serializers import ShipmentSerializer, ShipmentSummaryRows, ShipmentSummarySerializer
 
-# Create your tests here.
+
+# export jobs run by load_fixtures and the tests write here, not to the checkout
+_export_root = tempfile.TemporaryDirectory()
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, EXPORT_ROOT=_export_root.name)
+class CourierTestCase(TestCase):
+    """Over-budget views raise here, so N+1 regressions fail the suite."""
+
+
+@query_budget(100)
+class UnoptimizedShipmentsAPIView(APIView):
+    # ShipmentSerializer over a plain queryset: one relation load per row
+    def get(self, request):
+        return Response(ShipmentSerializer(Shipment.objects.all(), many=True).data)
+
+
+class QueryBudgetTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=2, couriers=4, customers=5, shipments=60)
+
+    def setUp(self):
+        self.fixtures = load_fixtures()
+
+    def get(self, role, name, **kwargs):
+        client = APIClient()
+        client.force_authenticate(self.fixtures[role])
+        return client.get(reverse(name, kwargs=kwargs or None))
+
+    def test_list_endpoints_stay_within_budget(self):
+        self.assertEqual(self.get('admin', 'all-shipments').status_code, 200)
+        self.assertEqual(self.get('customer', 'customer-shipments').status_code, 200)
+        self.assertEqual(self.get('staff', 'courier-shipments').status_code, 200)
+        branch_id = self.fixtures['branch'].id
+        self.assertEqual(self.get('manager', 'branch-shipments', branch_id=branch_id).status_code, 200)
+        client = APIClient()
+        client.force_authenticate(self.fixtures['customer'])
+        tracking_number = self.fixtures['customer_shipment'].tracking_number
+        self.assertEqual(
+            client.get(reverse('track-shipment'), {'tracking_number': tracking_number}).status_code, 200
+        )
+
+    def test_n_plus_one_is_reported_with_serializer_field(self):
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, self.fixtures['admin'])
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'N+1 x60 from ShipmentSerializer.'):
+            UnoptimizedShipmentsAPIView.as_view()(request)
+
+
+class AdminChangelistTests(CourierTestCase):
+    # changelists must not grow with table size: no per-row FK loads and
+    # no exact COUNT(*) over unfiltered tables
+    CHANGELIST_BUDGET = 6
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=2, couriers=4, customers=5, shipments=120)
+        cls.admin = load_fixtures()['admin']
+        cls.admin.is_staff = cls.admin.is_superuser = True
+        cls.admin.save()
+
+    def test_changelists_stay_within_query_budget(self):
+        self.client.force_login(self.admin)
+        for url in [
+            '/admin/courier/shipment/',
+            '/admin/courier/shipment/?q=khan&status=delivered',
+            '/admin/courier/courierstaff/',
+            '/admin/courier/payment/',
+            '/admin/courier/customuser/',
+        ]:
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+                self.assertLessEqual(len(queries), self.CHANGELIST_BUDGET)
+
+    def test_user_search_matches_name_prefixes(self):
+        self.client.force_login(self.admin)
+        prefix = self.admin.username[:3].upper()
+        response = self.client.get('/admin/courier/customuser/', {'q': prefix})
+        self.assertIn(self.admin, response.context['cl'].result_list)
+
+
+class ShipmentTransitionTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw', role='customer')
+        cls.branch = Branch.objects.create(name='Lahore', location='Lahore', contact_number='0')
+        staff = CustomUser.objects.create_user('rider', 'rider@example.com', 'pw', role='staff')
+        cls.courier = CourierStaff.objects.create(user=staff, branch=cls.branch)
+
+    def create_shipment(self):
+        # creation signal records tracking and assigns the branch courier
+        return Shipment.objects.create(
+            sender_name='A', sender_address='x', receiver_name='B', receiver_address='y',
+            weight='1.00', branch=self.branch, created_by=self.customer,
+        )
+
+    def test_new_shipment_is_assigned_once(self):
+        shipment = self.create_shipment()
+        self.assertEqual(shipment.courier, self.courier)
+        self.assertEqual(
+            list(shipment.tracking_updates.order_by('id').values_list('status', flat=True)),
+            ['pending', 'out_for_delivery'],
+        )
+        self.assertFalse(CourierStaff.objects.get(id=self.courier.id).is_available)
+
+    def test_stale_transition_is_rejected(self):
+        shipment = self.create_shipment()
+        stale = Shipment.objects.get(id=shipment.id)
+        self.assertTrue(transition_shipment(shipment, 'delivered'))
+        self.assertFalse(transition_shipment(stale, 'in_warehouse'))
+        self.assertEqual(Shipment.objects.get(id=shipment.id).status, 'delivered')
+        self.assertEqual(shipment.tracking_updates.count(), 3)
+        self.assertTrue(CourierStaff.objects.get(id=self.courier.id).is_available)
+
+    def test_cannot_cancel_out_for_delivery(self):
+        shipment = self.create_shipment()
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        response = client.post(reverse('cancel-shipment', kwargs={'shipment_id': shipment.id}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Shipment.objects.get(id=shipment.id).status, 'out_for_delivery')
+
+
+class RoutingTests(CourierTestCase):
+    def route_length(self, dist, route):
+        return dist[route[:-1], route[1:]].sum()
+
+    def test_two_opt_improves_nearest_neighbour_to_a_local_optimum(self):
+        rng = np.random.default_rng(7)
+        points = np.column_stack([31.4 + rng.random(200) * 0.3, 74.2 + rng.random(200) * 0.3])
+        order = order_stops(points.tolist(), start=(31.55, 74.35))
+        self.assertEqual(sorted(order), list(range(200)))
+
+        nodes = np.vstack([[31.55, 74.35], points])
+        dist = distance_matrix(nodes)
+        route = np.array([0] + [i + 1 for i in order])
+        self.assertLess(self.route_length(dist, route), self.route_length(dist, nearest_neighbour(dist)))
+        # converged before the iteration cap: no improving reversal is left
+        self.assertTrue(np.array_equal(two_opt(dist, route, max_iterations=1), route))
+
+    def test_manifest_sequence_follows_gazetteer(self):
+        seed(branches=1, couriers=1, customers=3, shipments=40)
+        courier = CourierStaff.objects.select_related('branch').get()
+        active = set(Shipment.objects.filter(courier=courier, status='out_for_delivery').values_list('id', flat=True))
+        manifest = build_courier_manifest(courier)
+        self.assertEqual(set(manifest['optimized_sequence']), active)
+        self.assertEqual(len(manifest['optimized_sequence']), len(active))
+        self.assertIsNotNone(geocode(['House 1, Canal Road, Lahore'])[0])
+
+
+class CourierAssignmentTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=1, couriers=3, customers=3, shipments=20)
+        cls.fixtures = load_fixtures()
+
+    def post(self, role, name, shipment, data):
+        client = APIClient()
+        client.force_authenticate(self.fixtures[role])
+        return client.post(reverse(name, kwargs={'shipment_id': shipment.pk}), data, format='json')
+
+    def test_reassignment_frees_the_previous_courier(self):
+        shipment = Shipment.objects.filter(status='out_for_delivery', courier__isnull=False).first()
+        previous = shipment.courier
+        CourierStaff.objects.filter(pk=previous.pk).update(is_available=False)
+        courier = CourierStaff.objects.filter(branch=shipment.branch).exclude(pk=previous.pk).first()
+
+        response = self.post('admin', 'assign-courier', shipment, {'courier_id': courier.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['courier']['id'], courier.pk)
+        previous.refresh_from_db()
+        courier.refresh_from_db()
+        self.assertEqual((previous.is_available, courier.is_available), (True, False))
+
+    def test_conflict_lists_moves_from_the_current_status(self):
+        shipment = Shipment.objects.filter(status='out_for_delivery').first()
+        real_update = views.update_shipment_status
+
+        def delivered_meanwhile(loaded, new_status):
+            # another request closes the shipment after this one loaded it
+            transition_shipment(Shipment.objects.get(pk=loaded.pk), 'delivered')
+            return real_update(loaded, new_status)
+
+        with mock.patch.object(views, 'update_shipment_status', delivered_meanwhile):
+            response = self.post('staff', 'update-shipment-status', shipment, {'status': 'in_warehouse'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['allowed'], [])
+
+
+    def test_assigned_shipments_is_the_courier_fk(self):
+        courier = self.fixtures['courier']
+        shipment = Shipment.objects.exclude(courier=courier).first()
+        courier.assigned_shipments.add(shipment)
+        shipment.refresh_from_db()
+        self.assertEqual(shipment.courier_id, courier.pk)
+        self.assertEqual(set(courier.assigned_shipments.all()), set(Shipment.objects.filter(courier=courier)))
+
+        courier.assigned_shipments.remove(shipment)
+        shipment.refresh_from_db()
+        self.assertIsNone(shipment.courier_id)
+
+
+class SingleAssignmentMigrationTests(TransactionTestCase):
+    """Migration 0010 folds the courier M2M into Shipment.courier."""
+    before = [('courier', '0009_shipment_updated_at')]
+    after = [('courier', '0010_single_courier_assignment')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_keeps_the_latest_m2m_row_unless_the_fk_is_set(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        CustomUser, Branch = apps.get_model('courier', 'CustomUser'), apps.get_model('courier', 'Branch')
+        CourierStaff, Shipment = apps.get_model('courier', 'CourierStaff'), apps.get_model('courier', 'Shipment')
+
+        users = [CustomUser.objects.create(username=f'u{i}', email=f'u{i}@example.com') for i in range(3)]
+        branch = Branch.objects.create(name='Main', location='Lahore', manager=users[0], contact_number='1')
+        first, second = (CourierStaff.objects.create(user=user, branch=branch) for user in users[1:])
+        orphaned, assigned, unassigned = (
+            Shipment.objects.create(
+                tracking_number=f'TRK{i}', sender_name='S', sender_address='A', receiver_name='R',
+                receiver_address='B', weight=1, service_type='economy', created_by=users[0], branch=branch,
+                courier=courier,
+            )
+            for i, courier in enumerate([None, first, None])
+        )
+        first.assigned_shipments.add(orphaned, assigned)
+        second.assigned_shipments.add(orphaned)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        Shipment = executor.loader.project_state(self.after).apps.get_model('courier', 'Shipment')
+        self.assertEqual(
+            dict(Shipment.objects.values_list('tracking_number', 'courier_id')),
+            {orphaned.tracking_number: second.pk, assigned.tracking_number: first.pk,
+             unassigned.tracking_number: None},
+        )
+
+
+class EtaTableTests(CourierTestCase):
+    @override_settings(ETA_SETTLE_SECONDS=0)
+    def test_refresh_is_incremental_and_feeds_lookup(self):
+        seed(branches=1, couriers=2, customers=3, shipments=200)
+        added = refresh_profiles()
+        self.assertEqual(added, ShipmentTracking.objects.filter(status='delivered').count())
+        self.assertEqual(refresh_profiles(), 0)
+
+        shipment = Shipment.objects.filter(status='out_for_delivery').first()
+        self.assertTrue(transition_shipment(shipment, 'delivered'))
+        self.assertEqual(refresh_profiles(), 1)
+
+        profile = TransitProfile.objects.get(branch=shipment.branch, service_type=shipment.service_type)
+        network = TransitProfile.objects.get(branch=None, service_type=shipment.service_type)
+        self.assertEqual(
+            sum(TransitProfile.objects.filter(branch=None).values_list('samples', flat=True)), added + 1
+        )
+        expected = profile.percentiles['p90'] if profile.samples >= MIN_SAMPLES else (
+            network.percentiles['p90'] if network.samples >= MIN_SAMPLES
+            else FALLBACK_HOURS[shipment.service_type]
+        )
+        self.assertEqual(transit_hours(shipment.branch_id, shipment.service_type), expected)
+
+    @override_settings(ETA_SETTLE_SECONDS=60)
+    def test_recent_deliveries_wait_until_they_settle(self):
+        seed(branches=1, couriers=2, customers=3, shipments=50)
+        with override_settings(ETA_SETTLE_SECONDS=0):
+            refresh_profiles()
+        first, second = Shipment.objects.filter(status='out_for_delivery').order_by('id')[:2]
+        for shipment in (first, second):
+            self.assertTrue(transition_shipment(shipment, 'delivered'))
+        delivered = ShipmentTracking.objects.filter(status='delivered')
+        delivered.filter(shipment=second).update(updated_at=timezone.now() - timedelta(minutes=2))
+        # the later, settled event waits behind the recent one below it
+        self.assertEqual(refresh_profiles(), 0)
+
+        delivered.filter(shipment=first).update(updated_at=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(refresh_profiles(), 2)
+
+
+class SLAReportTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=2, couriers=2, customers=3, shipments=20)
+        cls.fixtures = load_fixtures()
+
+    def test_soft_deleted_and_dangling_branches(self):
+        deleted = Branch.objects.order_by('-id').first()
+        Branch.objects.filter(pk=deleted.pk).update(deleted_at=timezone.now())
+        dangling = Shipment.objects.exclude(branch=deleted).first()
+        Shipment.objects.filter(pk=dangling.pk).update(branch_id=deleted.pk + 1000)
+
+        shipments = {}
+        for row in compute_sla_report():
+            shipments[row['branch_id']] = shipments.get(row['branch_id'], 0) + row['shipments']
+        self.assertEqual(shipments[deleted.pk], Shipment.objects.filter(branch=deleted).count())
+        self.assertEqual(shipments[None], Shipment.objects.filter(branch=None).count() + 1)
+        self.assertEqual(sum(shipments.values()), Shipment.objects.count())
+
+    def test_percentiles_and_lateness_buckets(self):
+        accumulator = SLAAccumulator([7], ['economy'])
+        # epoch hours; the last shipment is not delivered yet
+        delivered = np.array([0.2, 1.2, 2.2, 3.2, 10.2, 11.2, np.nan])
+        lateness = np.array([-30, -24, -0.5, 0, 6, 100, 0])
+        accumulator.add(
+            accumulator.group_index([7] * 7, ['economy'] * 7),
+            np.zeros(7), delivered, delivered - lateness,
+        )
+        [row] = accumulator.results()
+        self.assertEqual((row['branch_id'], row['shipments'], row['delivered']), (7, 7, 6))
+        self.assertEqual(row['transit_hours'], {'p50': 2.5, 'p90': 11.5, 'p95': 11.5, 'p99': 11.5})
+        # bucket edges are inclusive upper bounds: on time counts as early
+        self.assertEqual(row['on_time_rate'], round(4 / 6, 4))
+        self.assertEqual(row['lateness'], {
+            'early_24h_plus': 2, 'early_0_24h': 2, 'late_0_6h': 1,
+            'late_6_24h': 0, 'late_24_72h': 0, 'late_72h_plus': 1,
+        })
+
+    def test_filters_are_validated(self):
+        client = APIClient()
+        client.force_authenticate(self.fixtures['admin'])
+        url = reverse('sla-report')
+        self.assertEqual(client.get(url, {'branch_id': 'abc'}).status_code, 400)
+        self.assertEqual(client.get(url, {'service_type': 'teleport'}).status_code, 400)
+
+        branch = self.fixtures['branch']
+        response = client.get(url, {'branch_id': branch.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['branch_id'] for row in response.json()}, {branch.id})
+        self.assertEqual(sum(row['shipments'] for row in response.json()),
+                         Shipment.objects.filter(branch=branch).count())
+
+
+class ResponseCacheTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=2, couriers=2, customers=2, shipments=0)
+        cls.fixtures = load_fixtures()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.fixtures['admin'])
+
+    def test_hits_skip_queries_and_saves_invalidate(self):
+        url = reverse('list-branches')
+        first = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(first.content, second.content)
+
+        # list-staff and list-managers share the users version but not entries
+        self.assertNotEqual(self.client.get(reverse('list-staff')).content,
+                            self.client.get(reverse('list-managers')).content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Branch.objects.filter(id=self.fixtures['branch'].id).update(name='Renamed')
+            self.fixtures['branch'].refresh_from_db()
+            self.fixtures['branch'].save()
+        self.assertIn(b'Renamed', self.client.get(url).content)
+
+
+class NotificationTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=1, couriers=2, customers=3, shipments=0)
+        cls.user = CustomUser.objects.filter(role='admin').first()
+        cls.other = CustomUser.objects.exclude(pk=cls.user.pk).first()
+        now = timezone.now()
+        for user in (cls.user, cls.other):
+            Notification.objects.bulk_create(
+                Notification(user=user, message=f'm{i}', notification_type='email', is_read=i % 2 == 0)
+                for i in range(5)
+            )
+        # two share a timestamp so the id tie-breaker is exercised
+        for days, notification in zip([3, 2, 2, 1, 0], Notification.objects.filter(user=cls.user).order_by('id')):
+            Notification.objects.filter(pk=notification.pk).update(sent_at=now - timedelta(days=days))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_inbox_pages_by_cursor_newest_first(self):
+        expected = list(Notification.objects.filter(user=self.user).order_by('-sent_at', '-id')
+                        .values_list('id', flat=True))
+        seen, cursor = [], None
+        while True:
+            params = {'page_size': 2, **({'cursor': cursor} if cursor else {})}
+            body = self.client.get(reverse('notification-inbox'), params).json()
+            seen += [row['id'] for row in body['results']]
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, expected)
+        self.assertEqual(body['unread_count'], 2)
+
+        unread = self.client.get(reverse('notification-inbox'), {'unread': 'true'}).json()['results']
+        self.assertEqual(len(unread), 2)
+        self.assertEqual(self.client.get(reverse('notification-inbox'), {'cursor': 'junk'}).status_code, 400)
+
+    def test_mark_read_accepts_json_and_form_ids(self):
+        url = reverse('notification-mark-read')
+        first, second = Notification.objects.filter(user=self.user, is_read=False).values_list('id', flat=True)
+        other = Notification.objects.filter(user=self.other, is_read=False).values_list('id', flat=True)[0]
+
+        for ids in (['a'], [True], 'x', [1.5]):
+            self.assertEqual(self.client.post(url, {'ids': ids}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'all': 'false'}).status_code, 400)
+
+        response = self.client.post(url, {'ids': [first, other]}, format='json')
+        self.assertEqual(response.json(), {'updated': 1})
+        response = self.client.post(url, {'ids': [str(second)]})
+        self.assertEqual(response.json(), {'updated': 1})
+        self.assertFalse(Notification.objects.get(pk=other).is_read)
+        self.assertFalse(Notification.objects.filter(user=self.user, is_read=False).exists())
+
+    def test_purge_applies_both_retentions_in_batches(self):
+        # the user's notifications are 3, 2, 2, 1 and 0 days old; even ones are read
+        self.assertEqual(purge_notifications(older_than_days=30, read_older_than_days=1, batch_size=1), 2)
+        self.assertEqual(
+            sorted(Notification.objects.filter(user=self.user).values_list('message', flat=True)),
+            ['m1', 'm3', 'm4'],
+        )
+        self.assertEqual(purge_notifications(older_than_days=2), 1)
+        self.assertEqual(Notification.objects.filter(user=self.other).count(), 5)
+
+
+@override_settings(INTERNAL_IPS=['10.0.0.1'], PERF_METRICS_TOKEN=None)
+class PerformanceMetricsTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=1, couriers=2, customers=3, shipments=20)
+        cls.fixtures = load_fixtures()
+
+    def setUp(self):
+        registry.reset()
+
+    def get(self, role, remote_addr='203.0.113.9'):
+        client = APIClient(REMOTE_ADDR=remote_addr)
+        if role:
+            client.force_authenticate(self.fixtures[role])
+        return client.get(reverse('all-shipments'))
+
+    def test_server_timing_only_for_admins_and_internal_ips(self):
+        timing = self.get('admin')['Server-Timing']
+        phases = dict(re.findall(r'(\w+);dur=([\d.]+)', timing))
+        self.assertEqual(set(phases), {'db', 'serialize', 'render', 'app', 'total'})
+        self.assertGreater(float(phases['serialize']), 0)
+        self.assertFalse(self.get('customer').has_header('Server-Timing'))
+        self.assertFalse(self.get(None).has_header('Server-Timing'))
+        self.assertTrue(self.get(None, remote_addr='10.0.0.1').has_header('Server-Timing'))
+        with self.settings(PERF_SERVER_TIMING_PUBLIC=True):
+            self.assertTrue(self.get(None).has_header('Server-Timing'))
+
+    def test_metrics_endpoint_serves_histograms_to_scrapers_only(self):
+        self.get('admin')
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9').status_code, 403)
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('courier_request_phase_milliseconds_count{view="all-shipments",method="GET",phase="serialize"} 1', body)
+        self.assertIn('courier_request_queries_bucket{view="all-shipments",method="GET",le="+Inf"} 1', body)
+
+        with self.settings(PERF_METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 403)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+            self.assertEqual(response.status_code, 200)
+
+
+class RendererTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=1, couriers=2, customers=3, shipments=30)
+        cls.fixtures = load_fixtures()
+
+    def test_fast_json_matches_stock_renderer(self):
+        shipments = with_shipment_relations(Shipment.objects.all())
+        data = ShipmentSerializer(shipments, many=True).data
+        data[0]['raw'] = {'amount': Decimal('12.50'), 'at': timezone.now(), 'note': 'line\u2028break'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_large_lists_are_compressed(self):
+        client = APIClient()
+        client.force_authenticate(self.fixtures['admin'])
+        response = client.get(reverse('all-shipments'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            json.loads(gzip.decompress(response.content)),
+            json.loads(client.get(reverse('all-shipments')).content),
+        )
+
+    def test_compression_honours_q_values_and_skips_html(self):
+        client = APIClient()
+        client.force_authenticate(self.fixtures['admin'])
+        for header, encoding in [('gzip;q=0', None), ('identity, gzip;q=0.5', 'gzip'), ('*', 'gzip'),
+                                 ('br;q=0, identity', None)]:
+            response = client.get(reverse('all-shipments'), HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(response.get('Content-Encoding'), encoding, header)
+
+        response = self.client.get('/admin/login/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(response.content), 1024)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class SearchTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=1, couriers=1, customers=2, shipments=5)
+        cls.fixtures = load_fixtures()
+
+        def create(receiver_name):
+            return Shipment.objects.create(
+                sender_name='Sender', sender_address='Depot', receiver_name=receiver_name,
+                receiver_address='Harbour Road', weight='1.00', branch=cls.fixtures['branch'],
+                created_by=cls.fixtures['customer'],
+            )
+        cls.matches = [create(f'Zanzibar Traders {i}') for i in range(3)]
+        cls.other = create('Kampala Outfitters')
+
+    def search(self, role='admin', **params):
+        client = APIClient()
+        client.force_authenticate(self.fixtures[role])
+        return client.get(reverse('shipment-search'), params)
+
+    def test_every_word_matches_as_prefix_across_pages(self):
+        first = self.search(q='zanz harb', page_size=2).json()
+        self.assertEqual((len(first['results']), first['next_page']), (2, 2))
+        second = self.search(q='zanz harb', page_size=2, page=2).json()
+        self.assertEqual((len(second['results']), second['next_page']), (1, None))
+        self.assertEqual(
+            {row['id'] for row in first['results'] + second['results']}, {shipment.pk for shipment in self.matches}
+        )
+        self.assertEqual([row['id'] for row in self.search(q='kamp').json()['results']], [self.other.pk])
+
+        self.assertEqual(self.search(q=' ').status_code, 400)
+        self.assertEqual(self.search(q='zanz', page='x').status_code, 400)
+        self.assertEqual(self.search(role='customer', q='zanz').status_code, 403)
+
+    def test_index_follows_edits_and_rebuilds(self):
+        self.other.receiver_name = 'Mombasa Outfitters'
+        self.other.save()
+        self.assertEqual(search.search_shipment_ids('kampala'), [])
+        self.assertEqual(search.search_shipment_ids('momb outf'), [self.other.pk])
+
+        self.assertEqual(search.rebuild_index(batch_size=2), Shipment.objects.count())
+        self.assertEqual(search.search_shipment_ids('momb outf'), [self.other.pk])
+        self.assertEqual(len(search.search_shipment_ids('zanzibar')), 3)
+
+        deleted = self.matches[0].pk
+        self.matches[0].delete()
+        self.assertNotIn(deleted, search.search_shipment_ids('zanzibar'))
+
+
+class UserImportTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=1, couriers=1, customers=1, shipments=0)
+        cls.fixtures = load_fixtures()
+
+    def rows(self):
+        return parse_rows(
+            "username,email,password,role,branch\n"
+            f"rider1,rider1@example.com,secret-pass-1,staff,{self.fixtures['branch'].name}\n"
+            f"boss1,boss1@example.com,secret-pass-2,manager,\n"
+            f"rider2,{self.fixtures['manager'].email},secret-pass-3,staff,{self.fixtures['branch'].id}\n"
+            "rider3,rider3@example.com,secret-pass-4,staff,\n",
+            'csv',
+        )
+
+    def test_errors_are_reported_per_row_and_block_import(self):
+        report = import_users(self.rows())
+        self.assertEqual(report['created'], 0)
+        self.assertEqual([e['row'] for e in report['errors']], [3, 4])
+        self.assertIn('email', report['errors'][0]['errors'])
+        self.assertIn('branch', report['errors'][1]['errors'])
+        self.assertFalse(CustomUser.objects.filter(username='rider1').exists())
+
+    def test_partial_import_creates_users_and_profiles(self):
+        client = APIClient()
+        client.force_authenticate(self.fixtures['super_manager'])
+        self.assertEqual(client.post(reverse('import-users'), self.rows(), format='json').status_code, 400)
+        response = client.post(reverse('import-users') + '?partial=true', self.rows(), format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertNotIn('rows', response.data['params'])
+        stored = BackgroundJob.objects.get(pk=response.data['id']).params['rows']
+        self.assertNotIn('secret-pass-1', json.dumps(stored))
+        self.assertFalse(CustomUser.objects.filter(username='rider1').exists())
+
+        self.assertEqual(run_pending(), 1)
+        job = client.get(response['Location']).json()
+        self.assertEqual((job['status'], job['result']['created']), ('done', 2))
+        self.assertEqual(BackgroundJob.objects.get(pk=job['id']).params['rows'], [])
+        rider = CustomUser.objects.get(username='rider1')
+        self.assertTrue(rider.check_password('secret-pass-1'))
+        self.assertEqual(CourierStaff.objects.get(user=rider).branch, self.fixtures['branch'])
+        self.assertFalse(CourierStaff.objects.filter(user__username='boss1').exists())
+
+
+class IdempotencyTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=1, couriers=1, customers=2, shipments=10)
+        cls.fixtures = load_fixtures()
+
+    def post(self, data, key):
+        client = APIClient()
+        client.force_authenticate(self.fixtures['customer'])
+        return client.post(reverse('create-shipment'), data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retries_replay_without_side_effects(self):
+        data = {'sender_name': 'A', 'sender_address': 'x', 'receiver_name': 'B',
+                'receiver_address': 'y', 'weight': '2.00'}
+        first = self.post(data, 'retry-1')
+        shipments = Shipment.objects.count()
+        with CaptureQueriesContext(connection) as queries:
+            replay = self.post(data, 'retry-1')
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay.content, first.content)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(Shipment.objects.count(), shipments)
+        self.assertFalse([q for q in queries.captured_queries if 'courier_shipment' in q['sql']])
+
+        self.assertEqual(self.post(dict(data, weight='3.00'), 'retry-1').status_code, 422)
+
+    def test_in_progress_duplicate_gets_conflict(self):
+        IdempotencyKey.objects.create(
+            user=self.fixtures['customer'], key='busy', fingerprint=self.fingerprint(),
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+        self.assertEqual(self.post({'weight': '1.00'}, 'busy').status_code, 409)
+
+    def fingerprint(self):
+        request = APIRequestFactory().post(reverse('create-shipment'), {'weight': '1.00'}, format='json')
+        return request_fingerprint(APIView().initialize_request(request))
+
+
+@override_settings(THROTTLE_RATES={'default': {}, 'track-shipment': {'customer': '3/min'}})
+class ThrottleTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=1, couriers=1, customers=3, shipments=10)
+        cls.fixtures = load_fixtures()
+
+    def setUp(self):
+        cache.clear()
+        RoleTokenBucketThrottle._leases.clear()
+
+    def track(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(reverse('track-shipment'),
+                          {'tracking_number': self.fixtures['customer_shipment'].tracking_number})
+
+    def test_bucket_per_user_and_retry_after(self):
+        customer = self.fixtures['customer']
+        self.assertEqual([self.track(customer).status_code for _ in range(3)], [200] * 3)
+        response = self.track(customer)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+
+        other = CustomUser.objects.filter(role='customer').exclude(pk=customer.pk).first()
+        self.assertNotEqual(self.track(other).status_code, 429)
+        # a role without a rate on this scope is not limited
+        self.assertNotEqual(self.track(self.fixtures['admin']).status_code, 429)
+
+    def test_shared_bucket_grants_at_most_its_capacity(self):
+        now = time.time()
+        grants = [take_tokens('courier:throttle:test', 7, 20, 60.0, now=now)[0] for _ in range(4)]
+        self.assertEqual(grants, [7, 7, 6, 0])
+        granted, wait = take_tokens('courier:throttle:test', 1, 20, 60.0, now=now)
+        self.assertEqual(granted, 0)
+        self.assertTrue(0 < wait <= 60)
+        self.assertEqual(take_tokens('courier:throttle:test', 7, 20, 60.0, now=now + 60)[0], 7)
+
+    def test_slot_expiring_between_add_and_incr_is_added_again(self):
+        now = time.time()
+        take_tokens('courier:throttle:test', 1, 20, 60.0, now=now)
+        shared = mock.Mock(wraps=cache)
+
+        def expire_then_incr(key, delta=1):
+            # the slot's counter expires just before the first incr reaches it
+            if shared.incr.call_count == 1:
+                cache.delete(key)
+            return cache.incr(key, delta)
+
+        shared.incr.side_effect = expire_then_incr
+        with mock.patch('courier.throttling.cache', shared):
+            self.assertEqual(take_tokens('courier:throttle:test', 3, 20, 60.0, now=now), (3, 0.0))
+        self.assertEqual(shared.add.call_count, 2)
+
+    @override_settings(THROTTLE_RATES={'default': {}, 'track-shipment': {'customer': '120/min'}})
+    def test_unused_lease_tokens_go_back_to_the_bucket(self):
+        customer = self.fixtures['customer']
+        served = 0
+        for burst in (1, 5, 1, 12, 3):
+            self.assertEqual([self.track(customer).status_code for _ in range(burst)], [200] * burst)
+            served += burst
+            # the client pauses longer than a lease lives
+            for lease in RoleTokenBucketThrottle._leases.values():
+                lease.expires = 0
+        statuses = [self.track(customer).status_code for _ in range(120 - served + 1)]
+        self.assertEqual(statuses, [200] * (120 - served) + [429])
+
+
+class ChangeFeedTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=2, couriers=2, customers=5, shipments=30)
+        cls.fixtures = load_fixtures()
+
+    def changes(self, cursor=None, **params):
+        client = APIClient()
+        client.force_authenticate(self.fixtures['admin'])
+        if cursor:
+            params['cursor'] = cursor
+        return client.get(reverse('shipment-changes'), params)
+
+    def sync(self, cursor=None):
+        changes = []
+        while True:
+            body = self.changes(cursor, page_size=20).json()
+            changes += body['changes']
+            cursor = body['cursor']
+            if not body['has_more']:
+                return changes, cursor
+
+    def test_pages_upserts_and_tombstones_after_cursor(self):
+        changes, cursor = self.sync()
+        self.assertEqual(sum(change['type'] == 'shipment' for change in changes), 30)
+
+        shipment = Shipment.objects.filter(status='pending').first()
+        self.assertTrue(transition_shipment(shipment, 'cancelled'))
+        shipment.status = 'cancelled'
+        shipment.save()  # logged again, collapsed into one change
+        gone = Shipment.objects.exclude(pk=shipment.pk).first()
+        gone_id = gone.pk
+        gone.delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            body = self.changes(cursor).json()
+        self.assertLessEqual(len(queries), 3)
+        by_type = {}
+        for change in body['changes']:
+            by_type.setdefault(change['type'], []).append(change)
+        updated, tombstone = by_type['shipment']
+        self.assertEqual((updated['id'], updated['status']), (shipment.pk, 'cancelled'))
+        self.assertEqual(tombstone, {'type': 'shipment', 'id': gone_id, 'deleted': True})
+        self.assertEqual([e['shipment_id'] for e in by_type['tracking']], [shipment.pk])
+        self.assertFalse(self.changes(body['cursor']).json()['changes'])
+
+    def test_bad_and_expired_cursors(self):
+        self.assertEqual(self.changes('not-a-cursor').status_code, 400)
+        behind = self.changes(page_size=20).json()['cursor']
+        _, caught_up = self.sync()
+        purge_change_log(older_than_days=-1)
+        transition_shipment(Shipment.objects.filter(status='pending').first(), 'cancelled')
+        self.assertEqual(self.changes(behind).status_code, 410)
+        # nothing was lost for a client that had read everything
+        self.assertEqual(self.changes(caught_up).status_code, 200)
+
+
+class PaymentReconciliationTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=1, couriers=1, customers=5, shipments=40)
+        cls.fixtures = load_fixtures()
+
+    def test_marks_matching_payments_paid_and_reports_the_rest(self):
+        pending = list(Payment.objects.filter(status='pending').select_related('shipment')[:3])
+        paid = Payment.objects.filter(status='paid').select_related('shipment').first()
+        lines = [
+            'tracking_number,amount,paid_at',
+            f'{pending[0].shipment.tracking_number},{pending[0].amount},2026-10-01',
+            f'{pending[1].shipment.tracking_number},{pending[1].amount},',
+            f'{pending[2].shipment.tracking_number},{pending[2].amount + 1},',
+            f'{pending[0].shipment.tracking_number},{pending[0].amount},',
+            f'{paid.shipment.tracking_number},{paid.amount},',
+            'NOSUCHNUMBER,10.00,',
+            f'{pending[1].shipment.tracking_number},ten,',
+        ]
+        client = APIClient()
+        client.force_authenticate(self.fixtures['admin'])
+        upload = SimpleUploadedFile('cash-in.csv', '\n'.join(lines).encode())
+        response = client.post(reverse('reconcile-payments'), {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['rows'], body['paid']), (7, 2))
+        self.assertEqual(body['mismatches'], {'invalid': 1, 'unknown': 1, 'amount': 1, 'already_paid': 1, 'duplicate': 1})
+        self.assertEqual([m['row'] for m in body['mismatched_rows']], [3, 4, 5, 6, 7])
+        pending[0].refresh_from_db()
+        pending[1].refresh_from_db()
+        self.assertEqual((pending[0].status, pending[0].payment_date.date().isoformat()), ('paid', '2026-10-01'))
+        self.assertIsNotNone(pending[1].payment_date)
+        self.assertEqual(Payment.objects.get(pk=pending[2].pk).status, 'pending')
+
+    def test_queries_per_batch_not_per_row(self):
+        rows = [
+            {'tracking_number': number, 'amount': str(amount)}
+            for number, amount in Payment.objects.filter(status='pending')
+            .values_list('shipment__tracking_number', 'amount')[:6]
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            report = reconcile_payments(iter(rows), batch_size=3)
+        self.assertEqual(report['paid'], 6)
+        # per batch: one lookup, one locking read and one UPDATE (a single
+        # paid date), inside savepoint statements
+        self.assertEqual(len([q for q in queries if 'SAVEPOINT' not in q['sql']]), 6)
+        with self.assertRaises(ValueError):
+            iter_csv(io.BytesIO(b'tracking,total\n'))
+
+    def test_duplicates_across_batches_and_concurrent_settlement(self):
+        pending = list(Payment.objects.filter(status='pending').select_related('shipment')[:3])
+        rows = [
+            {'tracking_number': payment.shipment.tracking_number, 'amount': str(payment.amount)}
+            for payment in pending + pending[:1]
+        ]
+        settle = iter([pending[1]])
+
+        def settle_after_lookup(queryset):
+            # another run settles a payment between the lookup and the update
+            found = list(queryset)
+            for payment in settle:
+                Payment.objects.filter(pk=payment.pk).update(status='paid', payment_date=timezone.now())
+            return found
+
+        mismatches = []
+        with mock.patch('courier.sharding.gather', side_effect=settle_after_lookup):
+            report = reconcile_payments(iter(rows), batch_size=2, on_mismatch=mismatches.append)
+
+        self.assertEqual(report['paid'], 2)
+        self.assertEqual(
+            [(mismatch['row'], mismatch['kind']) for mismatch in mismatches],
+            [(2, 'already_paid'), (4, 'duplicate')],
+        )
+        self.assertEqual(Payment.objects.get(pk=pending[0].pk).status, 'paid')
+
+
+class ExportJobTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=1, couriers=1, customers=5, shipments=25)
+        cls.fixtures = load_fixtures()
+
+    def setUp(self):
+        export_root = tempfile.TemporaryDirectory()
+        self.addCleanup(export_root.cleanup)
+        override = override_settings(EXPORT_ROOT=export_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.fixtures['admin'])
+
+    def test_export_runs_in_background_and_downloads(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('create-export'), {'format': 'csv', 'status': 'delivered'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(callbacks), 1)  # handed to the worker thread on commit
+        job_url = response['Location']
+        self.assertEqual(self.client.get(job_url).json()['status'], 'queued')
+
+        self.assertEqual(run_pending(), 1)
+        job = self.client.get(job_url).json()
+        events = ShipmentTracking.objects.filter(shipment__status='delivered').count()
+        self.assertEqual((job['status'], job['processed'], job['total'], job['result']['rows']),
+                         ('done', events, events, events))
+
+        download = self.client.get(job['download_url'])
+        rows = list(csv.DictReader(io.StringIO(b''.join(download.streaming_content).decode())))
+        self.assertEqual(len(rows), events)
+        self.assertEqual({row['status'] for row in rows}, {'delivered'})
+
+    def test_sweep_requeues_lost_jobs_and_expires_files(self):
+        lost = BackgroundJob.objects.create(
+            kind='export', params={'format': 'csv', 'status': 'delivered'}, created_by=self.fixtures['admin'],
+            status='running',
+        )
+        BackgroundJob.objects.filter(pk=lost.pk).update(updated_at=timezone.now() - jobs.STALE_AFTER * 2)
+        # the first job a restarted web process queues also sweeps
+        with mock.patch.object(jobs, '_executor', mock.Mock()) as executor, \
+                mock.patch.object(jobs, '_last_sweep', None):
+            jobs._submit(lost.pk)
+        executor.submit.assert_any_call(jobs._sweep_in_thread)
+
+        self.assertEqual(run_pending(), 1)
+        job = self.client.get(reverse('job-detail', kwargs={'job_id': lost.pk})).json()
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(self.client.get(job['download_url']).status_code, 200)
+
+        path = export_path(lost)
+        old = time.time() - 25 * 3600
+        os.utime(path, (old, old))
+        self.assertEqual(jobs.sweep(), 0)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.client.get(job['download_url']).status_code, 410)
+
+    def test_pickup_date_filters(self):
+        day = timezone.localdate(Shipment.objects.order_by('pickup_date').values_list('pickup_date', flat=True)[12])
+        params = clean_export_params({'pickup_from': str(day), 'pickup_to': str(day + timedelta(days=60))})
+        exported = {row[0] for queryset in export_rows(params) for row in queryset}
+        self.assertEqual(exported, set(Shipment.objects.filter(
+            pickup_date__date__gte=day, pickup_date__date__lte=day + timedelta(days=60),
+        ).values_list('tracking_number', flat=True)))
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.post(reverse('create-export'), {'format': 'xlsx'}, format='json').status_code, 400)
+        self.assertEqual(
+            self.client.post(reverse('create-export'), {'pickup_from': '2026-13-01'}, format='json').status_code, 400
+        )
+        customer = APIClient()
+        customer.force_authenticate(self.fixtures['customer'])
+        self.assertEqual(customer.post(reverse('create-export'), {}, format='json').status_code, 403)
+
+
+class ShipmentSummaryTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=2, couriers=2, customers=5, shipments=20)
+        cls.fixtures = load_fixtures()
+
+    def assertLastEventsMatchHistory(self):
+        for shipment in Shipment.objects.prefetch_related('tracking_updates'):
+            events = sorted(shipment.tracking_updates.all(), key=lambda event: (event.updated_at, event.id))
+            self.assertEqual(
+                (shipment.last_event_at, shipment.last_event_location, shipment.event_count),
+                (events[-1].updated_at, events[-1].location, len(events)),
+            )
+
+    def test_last_event_columns_follow_tracking_writes_and_backfill(self):
+        self.assertLastEventsMatchHistory()  # seeded
+        shipment = Shipment.objects.filter(status='pending').first()
+        self.assertTrue(transition_shipment(shipment, 'cancelled', location='Depot'))
+        self.assertEqual((shipment.last_event_location, shipment.event_count),
+                         ('Depot', Shipment.objects.get(pk=shipment.pk).event_count))
+        self.assertLastEventsMatchHistory()
+
+        Shipment.objects.update(last_event_at=None, last_event_location='', event_count=0)
+        self.assertEqual(backfill_last_events(batch_size=7), 20)
+        self.assertLastEventsMatchHistory()
+
+    def test_seeded_history_is_backdated_without_touching_auto_now_add(self):
+        for shipment in Shipment.objects.prefetch_related('tracking_updates'):
+            first = min(shipment.tracking_updates.all(), key=lambda event: event.id)
+            self.assertEqual(first.updated_at, shipment.pickup_date)
+        self.assertTrue(ShipmentTracking._meta.get_field('updated_at').auto_now_add)
+
+        before = timezone.now()
+        shipment = Shipment.objects.filter(status='pending').first()
+        self.assertTrue(transition_shipment(shipment, 'cancelled'))
+        self.assertGreaterEqual(shipment.tracking_updates.latest('id').updated_at, before)
+
+    def test_values_rows_match_model_serializer(self):
+        Shipment.objects.filter(pk=Shipment.objects.order_by('id').first().pk).update(
+            branch=None, courier=None, created_by=None, delivery_date=None,
+        )
+        shipments = Shipment.objects.order_by('-pickup_date', 'id')
+        expected = ShipmentSummarySerializer(with_shipment_relations(shipments, history=False), many=True).data
+        with CaptureQueriesContext(connection) as queries:
+            rows = ShipmentSummaryRows(shipments).data
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(any(row['courier'] for row in rows) and any(row['branch'] is None for row in rows))
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(expected))
+
+    def test_lists_return_summaries_and_track_returns_history(self):
+        client = APIClient()
+        client.force_authenticate(self.fixtures['admin'])
+        row = client.get(reverse('all-shipments')).json()[0]
+        self.assertNotIn('tracking_updates', row)
+        shipment = Shipment.objects.get(pk=row['id'])
+        self.assertEqual((row['last_event_location'], row['event_count']),
+                         (shipment.last_event_location, shipment.event_count))
+
+        detail = client.get(reverse('track-shipment'), {'tracking_number': shipment.tracking_number}).json()
+        self.assertEqual(len(detail['tracking_updates']), shipment.event_count)
+
+
+class ArchiveTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=1, couriers=2, customers=3, shipments=30, payment_ratio=1.0)
+        cls.shipment = Shipment.objects.filter(status='delivered').order_by('id').first()
+        cls.tracking_ids = sorted(cls.shipment.tracking_updates.values_list('id', flat=True))
+        Notification.objects.create(
+            user=cls.shipment.created_by, shipment=cls.shipment, message='Delivered', notification_type='sms',
+        )
+        # nothing touched it for a year
+        old = timezone.now() - timedelta(days=365)
+        Shipment.objects.filter(pk=cls.shipment.pk).update(delivery_date=old)
+        ShipmentTracking.objects.filter(shipment=cls.shipment).update(updated_at=old)
+
+    def test_children_move_with_their_shipment(self):
+        self.assertTrue(archivable_shipments().filter(pk=self.shipment.pk).exists())
+        self.assertEqual(archive_batch([self.shipment.pk]), 1)
+
+        self.assertFalse(Shipment.objects.filter(pk=self.shipment.pk).exists())
+        for model in (ShipmentTracking, Payment, Notification):
+            self.assertFalse(model.objects.filter(shipment_id=self.shipment.pk).exists())
+        archived = ArchivedShipment.objects.get(pk=self.shipment.pk)
+        self.assertEqual(archived.tracking_number, self.shipment.tracking_number)
+        self.assertEqual(
+            sorted(ArchivedShipmentTracking.objects.filter(shipment=archived).values_list('id', flat=True)),
+            self.tracking_ids,
+        )
+        self.assertTrue(ArchivedPayment.objects.filter(shipment=archived).exists())
+        self.assertEqual(ArchivedNotification.objects.filter(shipment=archived).count(), 1)
+
+    def test_rerun_after_an_interrupted_copy_is_idempotent(self):
+        # an earlier run copied the shipment row but never deleted the original
+        fields = [f.attname for f in ArchivedShipment._meta.concrete_fields if f.name != 'archived_at']
+        ArchivedShipment.objects.create(**Shipment.objects.filter(pk=self.shipment.pk).values(*fields).get())
+        eligible = archivable_shipments().count()
+        archived, last_id = archive_shipments(batch_size=5)
+        self.assertEqual(archived, eligible)
+        self.assertFalse(archivable_shipments().exists())
+        self.assertEqual(ArchivedShipment.objects.filter(pk=self.shipment.pk).count(), 1)
+
+        counts = [model.objects.count() for model in (ArchivedShipment, ArchivedShipmentTracking, ArchivedPayment)]
+        self.assertEqual(archive_shipments(), (0, 0))
+        self.assertEqual(archive_batch([self.shipment.pk]), 1)
+        self.assertEqual(
+            [model.objects.count() for model in (ArchivedShipment, ArchivedShipmentTracking, ArchivedPayment)], counts,
+        )
+
+    def test_tracking_falls_back_to_the_archive(self):
+        archive_batch([self.shipment.pk])
+        client = APIClient()
+        url = reverse('track-shipment')
+
+        client.force_authenticate(self.shipment.created_by)
+        response = client.get(url, {'tracking_number': self.shipment.tracking_number})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], self.shipment.pk)
+        self.assertEqual(sorted(row['id'] for row in response.json()['tracking_updates']), self.tracking_ids)
+        self.assertEqual(client.get(url, {'tracking_number': 'TRK-NOPE'}).status_code, 404)
+
+        client.force_authenticate(
+            CustomUser.objects.filter(role='customer').exclude(pk=self.shipment.created_by_id).first()
+        )
+        response = client.get(url, {'tracking_number': self.shipment.tracking_number})
+        self.assertEqual(response.status_code, 403)
+
+
+class BranchDeletionTests(CourierTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(branches=2, couriers=4, customers=5, shipments=30)
+        cls.fixtures = load_fixtures()
+        cls.branch = cls.fixtures['branch']
+        Rate.objects.create(branch=cls.branch, service_type='economy', weight_from=0, weight_to=5, price=100)
+
+    def test_branch_is_hidden_then_detached_in_background(self):
+        client = APIClient()
+        client.force_authenticate(self.fixtures['admin'])
+        shipment_ids = set(Shipment.objects.filter(branch=self.branch).values_list('id', flat=True))
+        couriers = CourierStaff.objects.filter(branch=self.branch).count()
+
+        response = client.delete(reverse('delete-branch', kwargs={'branch_id': self.branch.id}))
+        self.assertEqual(response.status_code, 202)
+        self.assertNotIn(self.branch.id, [row['id'] for row in client.get(reverse('list-branches')).json()])
+        self.assertEqual(client.delete(reverse('delete-branch', kwargs={'branch_id': self.branch.id})).status_code, 404)
+        self.assertEqual(Shipment.objects.filter(branch=self.branch).count(), len(shipment_ids))
+
+        self.assertEqual(run_pending(), 1)
+        job = client.get(response['Location']).json()
+        total = len(shipment_ids) + couriers + 1
+        self.assertEqual((job['status'], job['processed'], job['total']), ('done', total, total))
+        self.assertFalse(Branch.all_objects.filter(pk=self.branch.pk).exists())
+        self.assertFalse(Rate.objects.exists())
+        self.assertEqual(CourierStaff.objects.filter(branch__isnull=True).count(), couriers)
+        self.assertEqual(set(Shipment.objects.filter(branch__isnull=True).values_list('id', flat=True)), shipment_ids)
+        self.assertTrue(ChangeLogEntry.objects.filter(entity='shipment', object_id__in=shipment_ids).exists())
+
+    def test_branch_cannot_be_hidden_through_update(self):
+        client = APIClient()
+        client.force_authenticate(self.fixtures['admin'])
+        response = client.put(
+            reverse('update-branch', kwargs={'branch_id': self.branch.id}), {'deleted_at': timezone.now()}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('deleted_at', response.json())
+        self.assertTrue(Branch.objects.filter(pk=self.branch.pk).exists())
+
+
+@override_settings(SHARD_ALIASES=['default', 'shard_1'], QUERY_BUDGET_STRICT=False)
+class ShardingTests(CourierTestCase):
+    databases = {'default', 'shard_1'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user('admin', 'admin@example.com', 'pw', role='admin')
+        cls.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw', role='customer')
+        # odd branch ids land on shard_1
+        cls.branches = {}
+        while len(cls.branches) < 2:
+            branch = Branch.objects.create(name='B', location='L', contact_number='0')
+            cls.branches.setdefault(sharding.shard_for_branch(branch.id), branch)
+
+    def setUp(self):
+        sharding.reserve_id_ranges(using='shard_1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_shipment(self, shard):
+        return Shipment.objects.create(
+            sender_name='A', sender_address='x', receiver_name='B', receiver_address='y',
+            weight='1.00', branch=self.branches[shard], created_by=self.customer,
+        )
+
+    def test_shipments_are_stored_on_their_branch_shard(self):
+        local, remote = self.create_shipment('default'), self.create_shipment('shard_1')
+        self.assertEqual((local._state.db, remote._state.db), ('default', 'shard_1'))
+        self.assertLess(local.pk, sharding.ID_SPAN)
+        self.assertGreaterEqual(remote.pk, sharding.ID_SPAN)
+        self.assertEqual(sharding.shard_for_id(remote.pk), 'shard_1')
+        self.assertFalse(Shipment.objects.filter(pk=remote.pk).exists())
+        # creation and the move to the warehouse (the branch has no couriers)
+        self.assertEqual(ShipmentTracking.objects.using('shard_1').filter(shipment_id=remote.pk).count(), 2)
+
+        self.assertTrue(transition_shipment(remote, 'cancelled'))
+        self.assertEqual(Shipment.objects.using('shard_1').get(pk=remote.pk).status, 'cancelled')
+        self.assertEqual(remote.tracking_updates.count(), 3)
+
+    def test_deleting_users_and_couriers_detaches_shipments_on_every_shard(self):
+        shipment = self.create_shipment('shard_1')
+        rider = CustomUser.objects.create_user('rider', 'rider@example.com', 'pw', role='staff')
+        courier = CourierStaff.objects.create(user=rider, branch=self.branches['shard_1'])
+        Shipment.objects.using('shard_1').filter(pk=shipment.pk).update(courier=courier)
+        logged = ChangeLogEntry.objects.using('shard_1').filter(entity='shipment', object_id=shipment.pk)
+        before = logged.count()
+
+        for user in (rider, self.customer):
+            with self.captureOnCommitCallbacks(execute=True):
+                user.delete()
+        self.assertEqual(
+            Shipment.objects.using('shard_1').values_list('courier_id', 'created_by_id').get(pk=shipment.pk),
+            (None, None),
+        )
+        self.assertEqual(logged.count(), before + 2)
+
+        manager = CustomUser.objects.create_user('manager', 'manager@example.com', 'pw', role='manager')
+        self.client.force_authenticate(manager)
+        response = self.client.post(reverse('update-shipment-status', kwargs={'shipment_id': shipment.pk}),
+                                    {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['created_by'])
+
+    def test_reads_find_shipments_on_any_shard(self):
+        local, remote = self.create_shipment('default'), self.create_shipment('shard_1')
+        response = self.client.get(reverse('track-shipment'), {'tracking_number': remote.tracking_number})
+        self.assertEqual(response.json()['id'], remote.pk)
+
+        branch = self.branches['shard_1']
+        response = self.client.get(reverse('branch-shipments', kwargs={'branch_id': branch.id}))
+        self.assertEqual([row['id'] for row in response.json()], [remote.pk])
+
+        response = self.client.get(reverse('all-shipments'))
+        self.assertEqual(sorted(row['id'] for row in response.json()), [local.pk, remote.pk])
+
+        response = self.client.get(reverse('shipment-changes'))
+        shipments = {change['id'] for change in response.json()['changes'] if change['type'] == 'shipment'}
+        self.assertEqual(shipments, {local.pk, remote.pk})
+
+    def test_search_index_rebuild_covers_every_shard(self):
+        local, remote = self.create_shipment('default'), self.create_shipment('shard_1')
+        self.assertEqual(search.rebuild_index(batch_size=1), 2)
+        for shipment in (local, remote):
+            self.assertEqual(search.search_shipment_ids(shipment.tracking_number), [shipment.pk])
+        response = self.client.get(reverse('shipment-search'), {'q': remote.tracking_number})
+        self.assertEqual([row['id'] for row in response.json()['results']], [remote.pk])
+
+    def test_shipment_lists_merge_values_rows_from_every_shard(self):
+        shipments = [self.create_shipment(shard) for shard in ('shard_1', 'default', 'shard_1')]
+        for days, shipment in enumerate(shipments):
+            Shipment.objects.using(shipment._state.db).filter(pk=shipment.pk).update(
+                pickup_date=timezone.now() + timedelta(days=days)
+            )
+        expected = [
+            ShipmentSummarySerializer(Shipment.objects.using(shipment._state.db).get(pk=shipment.pk)).data
+            for shipment in reversed(shipments)
+        ]
+        response = self.client.get(reverse('all-shipments'))
+        self.assertEqual(response.json(), json.loads(json.dumps(expected, cls=DjangoJSONEncoder)))
+
+    @override_settings(ETA_SETTLE_SECONDS=0)
+    def test_sla_report_and_eta_refresh_read_every_shard(self):
+        for shard in ('default', 'shard_1'):
+            shipment = self.create_shipment(shard)
+            self.assertTrue(transition_shipment(shipment, 'out_for_delivery'))
+            self.assertTrue(transition_shipment(shipment, 'delivered'))
+        report = {row['branch_id']: row for row in compute_sla_report()}
+        for branch in self.branches.values():
+            self.assertEqual(report[branch.id]['delivered'], 1)
+
+        self.assertEqual(refresh_profiles(), 2)
+        self.assertEqual(refresh_profiles(), 0)
+        profile = TransitProfile.objects.get(branch=None, service_type='economy')
+        self.assertEqual(profile.samples, 2)
+        self.assertGreaterEqual(profile.watermarks['shard_1'], sharding.ID_SPAN)
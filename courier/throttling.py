@@ -0,0 +1,179 @@
+# courier/throttling.py
+
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+# Most tokens a process takes from the shared bucket at once. Requests are
+# then admitted from the local lease without touching the cache. A lease
+# starts at one token and doubles each time one is used up before it
+# expires, so its size follows the rate the process actually sees.
+MAX_LEASE = 10
+# Unused leased tokens are handed back after this long, so a process that
+# goes quiet does not sit on another process's share of the rate
+LEASE_SECONDS = 1.0
+MAX_LOCAL_BUCKETS = 10000
+# The shared bucket counts tokens taken in this many slots of its period
+WINDOW_SLOTS = 10
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'120/min' -> (120, 60.0); None means unlimited."""
+    if rate is None:
+        return None
+    count, period = rate.split('/')
+    return int(count), float(_PERIODS[period[0]])
+
+
+def rate_for(scope, role):
+    """
+    Rate for a role on a view scope from THROTTLE_RATES, falling back to the
+    role's entry in the 'default' scope.
+    """
+    rates = getattr(settings, 'THROTTLE_RATES', {})
+    for name in (scope, 'default'):
+        if role in rates.get(name, {}):
+            return parse_rate(rates[name][role])
+    return None
+
+
+# ---------------------------
+# Shared bucket (cache)
+# ---------------------------
+def _slot(key, period, at):
+    width = period / WINDOW_SLOTS
+    return int(at // width), width
+
+
+def take_tokens(key, wanted, capacity, period, now=None):
+    """
+    Take up to `wanted` tokens from the shared bucket `key`, which allows
+    `capacity` tokens per rolling `period` seconds. Tokens are counted in
+    WINDOW_SLOTS cache counters; the current slot is raised with an atomic
+    add/incr before the rest of the window is read, and any excess is given
+    back with decr, so concurrent workers can never be granted more than
+    `capacity` between them. Returns (tokens granted, seconds until the
+    next token).
+    """
+    now = time.time() if now is None else now
+    current, width = _slot(key, period, now)
+    keys = [f'{key}:{slot}' for slot in range(current - WINDOW_SLOTS + 1, current + 1)]
+    while True:
+        if cache.add(keys[-1], wanted, int(period) + 1):
+            taken = wanted
+            break
+        try:
+            taken = cache.incr(keys[-1], wanted)
+            break
+        except ValueError:
+            # the slot expired between add and incr: add it again
+            continue
+    counts = cache.get_many(keys[:-1])
+    over = sum(counts.values()) + taken - capacity
+    granted = wanted - min(max(over, 0), wanted)
+    if granted < wanted:
+        cache.decr(keys[-1], wanted - granted)
+    if granted:
+        return granted, 0.0
+    # the oldest slot still holding tokens frees them when it leaves the window
+    oldest = next((i for i, k in enumerate(keys[:-1]) if counts.get(k)), WINDOW_SLOTS - 1)
+    return 0, (current + 1 + oldest) * width - now
+
+
+def return_tokens(key, tokens, period, taken_at):
+    """Give back `tokens` taken from bucket `key` at wall-clock time `taken_at`."""
+    current, _ = _slot(key, period, taken_at)
+    try:
+        cache.decr(f'{key}:{current}', tokens)
+    except ValueError:
+        # the slot has already left the window
+        pass
+
+
+# ---------------------------
+# DRF throttle
+# ---------------------------
+class _Lease:
+    __slots__ = ('tokens', 'size', 'taken_at', 'expires', 'period')
+
+    def __init__(self, tokens, size, taken_at, expires, period):
+        self.tokens = tokens
+        self.size = size
+        self.taken_at = taken_at
+        self.expires = expires
+        self.period = period
+
+
+class RoleTokenBucketThrottle(BaseThrottle):
+    """
+    Token-bucket throttle keyed by (view scope, role, user or client IP).
+    The rate comes from THROTTLE_RATES[scope][role]; the scope is the view's
+    `throttle_scope` attribute or its URL name. Buckets live in the default
+    cache so every worker shares them, but each process leases a few tokens
+    at a time and admits most requests from memory.
+    """
+    _leases = {}
+    _lock = threading.Lock()
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        if not getattr(settings, 'THROTTLE_ENABLED', True):
+            return True
+
+        user = request.user
+        role = getattr(user, 'role', None) if user and user.is_authenticated else 'anonymous'
+        match = request.resolver_match
+        scope = getattr(view, 'throttle_scope', None) or (match.url_name if match else None)
+        rate = rate_for(scope, role)
+        if rate is None:
+            return True
+        capacity, period = rate
+
+        ident = user.pk if user and user.is_authenticated else self.get_ident(request)
+        key = f'courier:throttle:{scope}:{role}:{ident}'
+        now = time.monotonic()
+        with self._lock:
+            lease = self._leases.pop(key, None)
+            if lease is not None and lease.tokens > 0 and lease.expires > now:
+                lease.tokens -= 1
+                self._leases[key] = lease
+                return True
+        size = 1
+        if lease is not None:
+            if lease.tokens:
+                # expired unused: hand the rest back and lease less next time
+                return_tokens(key, lease.tokens, lease.period, lease.taken_at)
+                size = max(1, lease.size // 2)
+            else:
+                size = lease.size * 2 if lease.expires > now else lease.size
+
+        taken_at = time.time()
+        wanted = min(size, MAX_LEASE, max(1, capacity // 10))
+        granted, wait = take_tokens(key, wanted, capacity, period, now=taken_at)
+        if not granted:
+            self.retry_after = wait
+            return False
+        expired = []
+        with self._lock:
+            if len(self._leases) >= MAX_LOCAL_BUCKETS:
+                expired = self._expire_leases(now)
+            self._leases[key] = _Lease(granted - 1, granted, taken_at, now + LEASE_SECONDS, period)
+        # unused tokens go back to the cache after the lock is released
+        for expired_key, lease in expired:
+            if lease.tokens:
+                return_tokens(expired_key, lease.tokens, lease.period, lease.taken_at)
+        return True
+
+    def _expire_leases(self, now):
+        """Drop expired leases (caller holds the lock) and return them as (key, lease)."""
+        expired = [(key, lease) for key, lease in self._leases.items() if lease.expires <= now]
+        for key, _ in expired:
+            del self._leases[key]
+        return expired
+
+    def wait(self):
+        return self.retry_after
@@ -4,28 +4,42 @@ from .views import (
     CreateShipmentAPIView,
     CustomerShipmentsAPIView,
     CourierShipmentsAPIView,
+    CourierManifestAPIView,
     UpdateShipmentStatusAPIView,
     TrackShipmentAPIView,
     CancelShipmentAPIView,
     AllShipmentsAPIView,
+    ShipmentChangesAPIView,
+    ReconcilePaymentsAPIView,
+    CreateExportAPIView,
+    ExportDownloadAPIView,
+    JobDetailAPIView,
+    ShipmentSearchAPIView,
     
     # User/Role APIs
     CreateUserAPIView,
     ListUsersAPIView,
     UserDetailAPIView,
     ChangePasswordAPIView,
+    NotificationInboxAPIView,
+    MarkNotificationsReadAPIView,
     BranchShipmentsAPIView,
     AssignCourierAPIView,
     ListStaffAPIView,
     ListManagersAPIView,
+    ImportUsersAPIView,
     
     # Branch APIs
     BranchListAPIView,
     CreateBranchAPIView,
     UpdateBranchAPIView,
     DeleteBranchAPIView,
+
+    # Analytics APIs
+    SLAReportAPIView,
     MyTokenObtainPairView,  # your custom view
 )
+from .metrics import metrics_view
 from rest_framework_simplejwt.views import TokenRefreshView  # only this comes from the library
 
 urlpatterns = [
@@ -40,6 +54,7 @@ urlpatterns = [
 
     # ---------------- Courier Shipment APIs ----------------
     path('courier/shipments/', CourierShipmentsAPIView.as_view(), name='courier-shipments'),
+    path('courier/manifest/', CourierManifestAPIView.as_view(), name='courier-manifest'),
     path('courier/shipments/<int:shipment_id>/update-status/', UpdateShipmentStatusAPIView.as_view(), name='update-shipment-status'),
 
     # ---------------- User / Role APIs ----------------
@@ -48,6 +63,10 @@ urlpatterns = [
     path('users/<int:user_id>/', UserDetailAPIView.as_view(), name='user-detail'),
     path('users/change-password/', ChangePasswordAPIView.as_view(), name='change-password'),
 
+    # ---------------- Notification APIs ----------------
+    path('notifications/', NotificationInboxAPIView.as_view(), name='notification-inbox'),
+    path('notifications/mark-read/', MarkNotificationsReadAPIView.as_view(), name='notification-mark-read'),
+
     # ---------------- Manager APIs ----------------
     path('manager/branch/<int:branch_id>/shipments/', BranchShipmentsAPIView.as_view(), name='branch-shipments'),
     path('manager/shipments/<int:shipment_id>/assign-courier/', AssignCourierAPIView.as_view(), name='assign-courier'),
@@ -55,6 +74,7 @@ urlpatterns = [
     # ---------------- Super Manager / HR APIs ----------------
     path('super-manager/staff/', ListStaffAPIView.as_view(), name='list-staff'),
     path('super-manager/managers/', ListManagersAPIView.as_view(), name='list-managers'),
+    path('super-manager/users/import/', ImportUsersAPIView.as_view(), name='import-users'),
 
     # ---------------- Admin Branch APIs ----------------
     path('admin/branches/', BranchListAPIView.as_view(), name='list-branches'),
@@ -64,4 +84,20 @@ urlpatterns = [
 
     # ---------------- Admin / Super Manager Shipments ----------------
     path('admin/shipments/', AllShipmentsAPIView.as_view(), name='all-shipments'),
+    path('admin/shipments/changes/', ShipmentChangesAPIView.as_view(), name='shipment-changes'),
+    path('admin/shipments/search/', ShipmentSearchAPIView.as_view(), name='shipment-search'),
+
+    # ---------------- Admin Payment APIs ----------------
+    path('admin/payments/reconcile/', ReconcilePaymentsAPIView.as_view(), name='reconcile-payments'),
+
+    # ---------------- Exports / Background jobs ----------------
+    path('admin/exports/', CreateExportAPIView.as_view(), name='create-export'),
+    path('admin/exports/<int:job_id>/download/', ExportDownloadAPIView.as_view(), name='export-download'),
+    path('jobs/<int:job_id>/', JobDetailAPIView.as_view(), name='job-detail'),
+
+    # ---------------- Analytics APIs ----------------
+    path('admin/analytics/sla/', SLAReportAPIView.as_view(), name='sla-report'),
+
+    # ---------------- Monitoring ----------------
+    path('metrics/', metrics_view, name='metrics'),
 ]
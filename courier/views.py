@@ -1,12 +1,34 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from .models import Shipment, CourierStaff, Branch, CustomUser
+from .models import Shipment, CourierStaff, Branch, CustomUser, Notification, ArchivedShipment, BackgroundJob
 from .serializers import (
     ShipmentSerializer, UserSerializer, ChangePasswordSerializer,
-    BranchSerializer, MyTokenObtainPairSerializer
+    BranchSerializer, MyTokenObtainPairSerializer, ArchivedShipmentSerializer,
+    NotificationSerializer, BackgroundJobSerializer,
 )
-from .helpers import assign_shipment_to_courier, update_shipment_status
+from .helpers import (
+    update_shipment_status, transition_shipment, with_shipment_relations, shipment_summaries,
+    build_courier_manifest, ACTIVE_STATUSES, TRANSITIONS,
+)
+from django.db import transaction
+from django.http import FileResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .analytics import compute_sla_report
+from .branches import delete_branch
+from .caching import cached_response
+from .changefeed import CursorExpired, read_changes
+from .exports import clean_params as clean_export_params, export_path
+from .jobs import enqueue
+from .idempotency import idempotent
+from .onboarding import MAX_REQUEST_ROWS, hash_row_passwords, import_users, parse_rows
+from .pagination import MAX_PAGE_SIZE, keyset_paginate, parse_page_size
+from .querycheck import query_budget
+from .reconciliation import MAX_REPORTED_MISMATCHES, iter_csv, reconcile_payments
+from .search import MAX_RESULTS, search_shipment_ids
+from .sharding import shard_for_branch, shard_for_id, shard_for_tracking_number
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import AllowAny
 
@@ -39,6 +61,7 @@ class CreateUserAPIView(APIView):
 # -------------------------
 # Get all users or filter by role
 # -------------------------
+@query_budget(3)
 class ListUsersAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -58,6 +81,7 @@ class ListUsersAPIView(APIView):
 # -------------------------
 # Retrieve, Update, Delete a single user
 # -------------------------
+@query_budget(3, methods=('GET',))
 class UserDetailAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -116,8 +140,60 @@ class ChangePasswordAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# -------------------------
+# Notification inbox
+# -------------------------
+@query_budget(4)
+class NotificationInboxAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        notifications = Notification.objects.filter(user=request.user)
+        if request.query_params.get('unread') in ['1', 'true']:
+            notifications = notifications.filter(is_read=False)
+
+        try:
+            page_size = parse_page_size(request.query_params.get('page_size'))
+            rows, next_cursor = keyset_paginate(
+                notifications, ('-sent_at', '-id'),
+                cursor=request.query_params.get('cursor'), page_size=page_size,
+            )
+        except ValueError:
+            return Response({'error': 'Invalid cursor or page size'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'results': NotificationSerializer(rows, many=True).data,
+            'next_cursor': next_cursor,
+            'unread_count': Notification.objects.filter(user=request.user, is_read=False).count(),
+        })
+
+
+class MarkNotificationsReadAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        notifications = Notification.objects.filter(user=request.user, is_read=False)
+        if hasattr(request.data, 'getlist'):  # QueryDict from form posts
+            ids = request.data.getlist('ids') or None
+        else:
+            ids = request.data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(
+                (isinstance(i, int) and not isinstance(i, bool)) or (isinstance(i, str) and i.isdigit())
+                for i in ids
+            ):
+                return Response({'error': 'ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+            notifications = notifications.filter(id__in=ids)
+        elif request.data.get('all') not in [True, '1', 'true']:
+            return Response({'error': 'Provide ids or all=true'}, status=status.HTTP_400_BAD_REQUEST)
+
+        updated = notifications.update(is_read=True)
+        return Response({'updated': updated})
+
+
 # ------------------ Customer APIs ------------------
 
+@idempotent()
 class CreateShipmentAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -127,12 +203,15 @@ class CreateShipmentAPIView(APIView):
 
         serializer = ShipmentSerializer(data=request.data)
         if serializer.is_valid():
-            shipment = serializer.save(created_by=request.user)
-            assign_shipment_to_courier(shipment)
+            # creation signal records tracking, assigns a courier and logs
+            # the change feed entries; all of it commits with the shipment
+            with transaction.atomic():
+                shipment = serializer.save(created_by=request.user)
             return Response(ShipmentSerializer(shipment).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@query_budget(3)
 class CustomerShipmentsAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -140,13 +219,14 @@ class CustomerShipmentsAPIView(APIView):
         if request.user.role != 'customer':
             return Response({'error': 'Only customers can view their shipments'}, status=status.HTTP_403_FORBIDDEN)
 
+        # a customer's shipments can be at any branch, so on any shard
         shipments = Shipment.objects.filter(created_by=request.user).order_by('-pickup_date')
-        serializer = ShipmentSerializer(shipments, many=True)
-        return Response(serializer.data)
+        return Response(shipment_summaries(shipments, order='-pickup_date'))
 
 
 # ------------------ Courier Staff APIs ------------------
 
+@query_budget(4)
 class CourierShipmentsAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -158,11 +238,36 @@ class CourierShipmentsAPIView(APIView):
         except CourierStaff.DoesNotExist:
             return Response({'error': 'Courier profile not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        shipments = courier.assigned_shipments.all().order_by('-pickup_date')
-        serializer = ShipmentSerializer(shipments, many=True)
-        return Response(serializer.data)
+        shipments = Shipment.objects.filter(courier=courier).order_by('-pickup_date')
+        return Response(shipment_summaries(shipments, using=shard_for_branch(courier.branch_id)))
+
+
+@query_budget(5)
+class CourierManifestAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        if request.user.role != 'staff':
+            return Response({'error': 'Only courier staff can access this'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            courier = CourierStaff.objects.select_related('branch').get(user=request.user)
+        except CourierStaff.DoesNotExist:
+            return Response({'error': 'Courier profile not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response({'error': 'Invalid since timestamp'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # taken before the read so changes made during it are picked up next sync
+        synced_at = timezone.now()
+        manifest = build_courier_manifest(courier, since=since)
+        manifest['synced_at'] = synced_at
+        return Response(manifest)
 
 
+@idempotent()
 class UpdateShipmentStatusAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -171,7 +276,7 @@ class UpdateShipmentStatusAPIView(APIView):
             return Response({'error': 'You do not have permission to update shipment status'}, status=status.HTTP_403_FORBIDDEN)
 
         try:
-            shipment = Shipment.objects.get(id=shipment_id)
+            shipment = Shipment.objects.using(shard_for_id(shipment_id)).get(id=shipment_id)
         except Shipment.DoesNotExist:
             return Response({'error': 'Shipment not found'}, status=status.HTTP_404_NOT_FOUND)
         
@@ -179,7 +284,15 @@ class UpdateShipmentStatusAPIView(APIView):
         if new_status not in [s[0] for s in Shipment.STATUS_CHOICES]:
             return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
         
-        update_shipment_status(shipment, new_status)
+        if not update_shipment_status(shipment, new_status):
+            # the status loaded above may be what a concurrent request just changed
+            current = Shipment.objects.using(shipment._state.db).filter(pk=shipment.pk).values_list(
+                'status', flat=True
+            ).first()
+            return Response(
+                {'error': f'Cannot move shipment to {new_status}', 'allowed': list(TRANSITIONS.get(current, ()))},
+                status=status.HTTP_409_CONFLICT
+            )
         return Response(ShipmentSerializer(shipment).data)
 
 
@@ -187,6 +300,7 @@ class UpdateShipmentStatusAPIView(APIView):
 # -------------------------
 # Manager APIs: Branch Shipments & Assign Courier
 # -------------------------
+@query_budget(4)
 class BranchShipmentsAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -200,12 +314,11 @@ class BranchShipmentsAPIView(APIView):
             return Response({'error': 'Branch not found'}, status=status.HTTP_404_NOT_FOUND)
 
         # Manager can only see their own branch
-        if request.user.role == 'manager' and branch.manager != request.user:
+        if request.user.role == 'manager' and branch.manager_id != request.user.id:
             return Response({'error': 'You can only view your own branch shipments'}, status=status.HTTP_403_FORBIDDEN)
 
         shipments = Shipment.objects.filter(branch=branch).order_by('-pickup_date')
-        serializer = ShipmentSerializer(shipments, many=True)
-        return Response(serializer.data)
+        return Response(shipment_summaries(shipments, using=shard_for_branch(branch.id)))
 
 
 class AssignCourierAPIView(APIView):
@@ -217,7 +330,7 @@ class AssignCourierAPIView(APIView):
 
         courier_id = request.data.get('courier_id')
         try:
-            shipment = Shipment.objects.get(id=shipment_id)
+            shipment = Shipment.objects.using(shard_for_id(shipment_id)).get(id=shipment_id)
         except Shipment.DoesNotExist:
             return Response({'error': 'Shipment not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -226,10 +339,20 @@ class AssignCourierAPIView(APIView):
         except CourierStaff.DoesNotExist:
             return Response({'error': 'Courier not found in this branch'}, status=status.HTTP_404_NOT_FOUND)
 
-        shipment.courier = courier
-        shipment.status = 'out_for_delivery'
-        shipment.save()
-        courier.assigned_shipments.add(shipment)
+        previous_courier_id = shipment.courier_id
+        with transaction.atomic():
+            # only if the courier read above still holds it, as that is the one freed
+            assigned = transition_shipment(
+                shipment, 'out_for_delivery', allowed_from=ACTIVE_STATUSES, match={'courier_id': previous_courier_id},
+                message=f"Your shipment {shipment.tracking_number} has been assigned to courier {courier.user.username} and is out for delivery.",
+                courier=courier,
+            )
+            if assigned and previous_courier_id not in (None, courier.pk):
+                CourierStaff.objects.filter(pk=previous_courier_id).update(is_available=True)
+        if not assigned:
+            return Response(
+                {'error': 'Shipment is already closed or was reassigned meanwhile'}, status=status.HTTP_409_CONFLICT
+            )
 
         return Response(ShipmentSerializer(shipment).data)
 
@@ -237,6 +360,7 @@ class AssignCourierAPIView(APIView):
 # -------------------------
 # Super Manager / HR APIs: Staff & Manager Management
 # -------------------------
+@query_budget(3)
 class ListStaffAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -244,11 +368,13 @@ class ListStaffAPIView(APIView):
         if request.user.role not in ['super_manager', 'admin']:
             return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
 
-        staff = CustomUser.objects.filter(role='staff')
-        serializer = UserSerializer(staff, many=True)
-        return Response(serializer.data)
+        return cached_response(
+            request, 'users',
+            lambda: UserSerializer(CustomUser.objects.filter(role='staff'), many=True).data,
+        )
 
 
+@query_budget(3)
 class ListManagersAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -256,14 +382,55 @@ class ListManagersAPIView(APIView):
         if request.user.role not in ['super_manager', 'admin']:
             return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
 
-        managers = CustomUser.objects.filter(role='manager')
-        serializer = UserSerializer(managers, many=True)
-        return Response(serializer.data)
+        return cached_response(
+            request, 'users',
+            lambda: UserSerializer(CustomUser.objects.filter(role='manager'), many=True).data,
+        )
+
+
+class ImportUsersAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        if request.user.role not in ['super_manager', 'admin']:
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        try:
+            if upload is not None:
+                fmt = 'json' if upload.name.lower().endswith('.json') else 'csv'
+                rows = parse_rows(upload.read(), fmt)
+            elif isinstance(request.data, list):
+                rows = request.data
+            else:
+                return Response({'error': 'Upload a CSV or JSON file, or post a JSON list'}, status=status.HTTP_400_BAD_REQUEST)
+        except (ValueError, UnicodeDecodeError) as exc:
+            return Response({'error': f'Could not read file: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > MAX_REQUEST_ROWS:
+            return Response(
+                {'error': f'At most {MAX_REQUEST_ROWS} rows per request; use the import_users command for larger files'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # validation is answered now and the insert left to a job; passwords
+        # are hashed first (on a process pool) so the job never stores them
+        partial = request.query_params.get('partial') == 'true'
+        report = import_users(rows, partial=partial, dry_run=True)
+        if request.query_params.get('dry_run') == 'true':
+            return Response(report)
+        if report['errors'] and (not partial or len(report['errors']) == len(rows)):
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+
+        job = enqueue('import-users', user=request.user, rows=hash_row_passwords(rows), partial=partial)
+        response = Response(BackgroundJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        response['Location'] = reverse('job-detail', kwargs={'job_id': job.pk})
+        return response
 
 
 # -------------------------
 # Admin APIs: All Branches & Users
 # -------------------------
+@query_budget(3)
 class BranchListAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -271,12 +438,14 @@ class BranchListAPIView(APIView):
         if request.user.role != 'admin':
             return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
 
-        branches = Branch.objects.all()
-        serializer = BranchSerializer(branches, many=True)
-        return Response(serializer.data)
+        return cached_response(
+            request, 'branches',
+            lambda: BranchSerializer(Branch.objects.all(), many=True).data,
+        )
 
 
 
+@query_budget(5)
 class TrackShipmentAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -285,19 +454,62 @@ class TrackShipmentAPIView(APIView):
         if not tracking_number:
             return Response({'error': 'Tracking number is required'}, status=status.HTTP_400_BAD_REQUEST)
 
+        serializer_class = ShipmentSerializer
+        shard = shard_for_tracking_number(tracking_number)
         try:
-            shipment = Shipment.objects.get(tracking_number=tracking_number)
+            if shard is None:
+                raise Shipment.DoesNotExist
+            shipment = with_shipment_relations(Shipment.objects.using(shard)).get(tracking_number=tracking_number)
         except Shipment.DoesNotExist:
-            return Response({'error': 'Shipment not found'}, status=status.HTTP_404_NOT_FOUND)
+            # Old delivered/cancelled shipments live in the archive tables
+            try:
+                shipment = with_shipment_relations(ArchivedShipment.objects.all()).get(tracking_number=tracking_number)
+                serializer_class = ArchivedShipmentSerializer
+            except ArchivedShipment.DoesNotExist:
+                return Response({'error': 'Shipment not found'}, status=status.HTTP_404_NOT_FOUND)
 
         # Only allow customer to track their own shipment, or staff/admin
-        if request.user.role == 'customer' and shipment.created_by != request.user:
+        if request.user.role == 'customer' and shipment.created_by_id != request.user.id:
             return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
 
-        serializer = ShipmentSerializer(shipment)
+        serializer = serializer_class(shipment)
         return Response(serializer.data)
 
 
+@query_budget(4)
+class ShipmentSearchAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        if request.user.role not in ['admin', 'super_manager']:
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Search query is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = parse_page_size(request.query_params.get('page_size'))
+        except ValueError:
+            return Response({'error': 'Invalid page or page size'}, status=status.HTTP_400_BAD_REQUEST)
+
+        offset = (page - 1) * page_size
+        if offset >= MAX_RESULTS:
+            return Response({'error': 'Refine your search to see more results'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # one extra id tells us whether another page exists
+        ids = search_shipment_ids(query, offset=offset, limit=page_size + 1)
+        has_next = len(ids) > page_size
+        ids = ids[:page_size]
+        by_id = {row['id']: row for row in shipment_summaries(Shipment.objects.filter(id__in=ids))}
+
+        return Response({
+            'results': [by_id[i] for i in ids if i in by_id],
+            'page': page,
+            'next_page': page + 1 if has_next else None,
+        })
+
+
 class CancelShipmentAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -306,15 +518,13 @@ class CancelShipmentAPIView(APIView):
             return Response({'error': 'Only customers can cancel shipments'}, status=status.HTTP_403_FORBIDDEN)
 
         try:
-            shipment = Shipment.objects.get(id=shipment_id, created_by=request.user)
+            shipment = Shipment.objects.using(shard_for_id(shipment_id)).get(id=shipment_id, created_by=request.user)
         except Shipment.DoesNotExist:
             return Response({'error': 'Shipment not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        if shipment.status in ['picked_up', 'out_for_delivery', 'delivered']:
+        # only allowed while the shipment is still pending or in the warehouse
+        if not transition_shipment(shipment, 'cancelled'):
             return Response({'error': 'Cannot cancel shipment at this stage'}, status=status.HTTP_400_BAD_REQUEST)
-
-        shipment.status = 'cancelled'
-        shipment.save()
         return Response({'message': 'Shipment cancelled successfully'}, status=status.HTTP_200_OK)
 
 
@@ -363,10 +573,14 @@ class DeleteBranchAPIView(APIView):
         except Branch.DoesNotExist:
             return Response({'error': 'Branch not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        branch.delete()
-        return Response({'message': 'Branch deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
+        # hidden now; shipments, couriers and rates are detached by a job
+        job = delete_branch(branch, user=request.user)
+        response = Response(BackgroundJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        response['Location'] = reverse('job-detail', kwargs={'job_id': job.pk})
+        return response
 
 
+@query_budget(3)
 class AllShipmentsAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -378,7 +592,7 @@ class AllShipmentsAPIView(APIView):
         branch_filter = request.query_params.get('branch_id')
         courier_filter = request.query_params.get('courier_id')
 
-        shipments = Shipment.objects.all()
+        shipments = Shipment.objects.order_by('-pickup_date')
 
         if status_filter:
             shipments = shipments.filter(status=status_filter)
@@ -387,5 +601,141 @@ class AllShipmentsAPIView(APIView):
         if courier_filter:
             shipments = shipments.filter(courier_id=courier_filter)
 
-        serializer = ShipmentSerializer(shipments, many=True)
-        return Response(serializer.data)
+        # one branch lives on one shard
+        shard = shard_for_branch(int(branch_filter)) if branch_filter and branch_filter.isdigit() else None
+        return Response(shipment_summaries(shipments, order='-pickup_date', using=shard))
+
+
+@query_budget(5)
+class ShipmentChangesAPIView(APIView):
+    """
+    Delta sync for systems that mirror shipments: the shipments and tracking
+    events changed after ?cursor=, plus tombstones for deleted ones. Keep
+    calling with the returned cursor while has_more is true.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        if request.user.role not in ['admin', 'super_manager']:
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            page_size = parse_page_size(request.query_params.get('page_size'), default=MAX_PAGE_SIZE)
+            changes, cursor, has_more = read_changes(request.query_params.get('cursor'), limit=page_size)
+        except ValueError:
+            return Response({'error': 'Invalid cursor or page size'}, status=status.HTTP_400_BAD_REQUEST)
+        except CursorExpired:
+            return Response({'error': 'Cursor is older than the change log; resync all shipments'},
+                            status=status.HTTP_410_GONE)
+
+        return Response({'changes': changes, 'cursor': cursor, 'has_more': has_more})
+
+
+# -------------------------
+# Payment reconciliation
+# -------------------------
+class ReconcilePaymentsAPIView(APIView):
+    """
+    Upload a provider or COD cash-in CSV (tracking_number, amount, optional
+    paid_at) to mark the matching pending payments paid. The file is read in
+    batches as it streams from the upload; ?dry_run=true only matches.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        if request.user.role not in ['admin', 'super_manager']:
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Upload the reconciliation CSV as "file"'}, status=status.HTTP_400_BAD_REQUEST)
+
+        mismatches = []
+
+        def on_mismatch(mismatch):
+            if len(mismatches) < MAX_REPORTED_MISMATCHES:
+                mismatches.append(mismatch)
+
+        try:
+            report = reconcile_payments(
+                iter_csv(upload.file), dry_run=request.query_params.get('dry_run') == 'true',
+                on_mismatch=on_mismatch,
+            )
+        except (ValueError, UnicodeDecodeError) as exc:
+            return Response({'error': f'Could not read file: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+        report['mismatched_rows'] = mismatches
+        return Response(report)
+
+
+# -------------------------
+# Exports and background jobs
+# -------------------------
+class CreateExportAPIView(APIView):
+    """
+    Queue an export of shipments with their payment and tracking events
+    (format: csv, or parquet/arrow when pyarrow is installed; optional
+    status, branch_id, pickup_from, pickup_to). Poll the returned job
+    and download the file once it is done.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        if request.user.role not in ['admin', 'super_manager']:
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            params = clean_export_params(request.data)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        job = enqueue('export', user=request.user, **params)
+        response = Response(BackgroundJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        response['Location'] = reverse('job-detail', kwargs={'job_id': job.pk})
+        return response
+
+
+class JobDetailAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = BackgroundJob.objects.filter(pk=job_id).first()
+        if job is None or (job.created_by_id != request.user.pk and request.user.role != 'admin'):
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(BackgroundJobSerializer(job).data)
+
+
+class ExportDownloadAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = BackgroundJob.objects.filter(pk=job_id, kind='export').first()
+        if job is None or (job.created_by_id != request.user.pk and request.user.role != 'admin'):
+            return Response({'error': 'Export not found'}, status=status.HTTP_404_NOT_FOUND)
+        if job.status != 'done':
+            return Response({'error': f'Export is {job.status}'}, status=status.HTTP_409_CONFLICT)
+        try:
+            fh = open(export_path(job), 'rb')
+        except FileNotFoundError:
+            return Response({'error': 'Export file no longer exists'}, status=status.HTTP_410_GONE)
+        return FileResponse(fh, as_attachment=True, filename=f"shipments-{job.pk}.{job.params['format']}")
+
+
+# -------------------------
+# Analytics APIs
+# -------------------------
+class SLAReportAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        if request.user.role not in ['admin', 'super_manager']:
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        service_type = request.query_params.get('service_type')
+        if service_type and service_type not in [s[0] for s in Shipment.SERVICE_CHOICES]:
+            return Response({'error': 'Invalid service type'}, status=status.HTTP_400_BAD_REQUEST)
+
+        branch_id = request.query_params.get('branch_id')
+        if branch_id and not branch_id.isdigit():
+            return Response({'error': 'Invalid branch id'}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = compute_sla_report(branch_id=branch_id, service_type=service_type)
+        return Response(report)
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +45,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'courier.middleware.PerformanceMiddleware',
+    'courier.middleware.CompressionMiddleware',
+    'courier.querycheck.QueryInspectionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +89,20 @@ DATABASES = {
     }
 }
 
+# Branch sharding (courier.sharding): shipments, their tracking, payments
+# and change log live on the shard of their branch. COURIER_SHARDS=3 adds
+# SQLite shards shard_1 and shard_2 next to db.sqlite3; migrate each with
+# `manage.py migrate --database shard_N`. SHARD_MAP pins branch ids to an
+# alias; other branches are spread by id.
+# `manage.py test` always declares shard_1 (an in-memory test database) for
+# the sharding tests, which put it in SHARD_ALIASES themselves.
+SHARD_ALIASES = ['default'] + [f'shard_{n}' for n in range(1, int(os.environ.get('COURIER_SHARDS', '1')))]
+SHARD_MAP = {}
+_TEST_SHARDS = {'shard_1'} if sys.argv[1:2] == ['test'] else set()
+for _alias in sorted({*SHARD_ALIASES[1:], *_TEST_SHARDS}):
+    DATABASES[_alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / f'{_alias}.sqlite3'}
+DATABASE_ROUTERS = ['courier.sharding.ShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -125,12 +144,58 @@ STATIC_URL = 'static/'
 AUTH_USER_MODEL = 'courier.CustomUser'
 # Default primary key field type
 
+# Versioned response cache (courier.caching). Use a shared backend such as
+# Redis or Memcached when running more than one worker process, otherwise
+# invalidations only reach the process that made the change.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # orjson-backed JSON by default; MessagePack for clients sending
+    # Accept: application/msgpack (both only when the library is installed)
+    'DEFAULT_RENDERER_CLASSES': (
+        'courier.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'courier.renderers.MessagePackRenderer',
+    ),
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'courier.renderers.AvailableRendererNegotiation',
+    'DEFAULT_THROTTLE_CLASSES': (
+        'courier.throttling.RoleTokenBucketThrottle',
+    ),
 }
 
+# Token-bucket rates per view scope (URL name or the view's throttle_scope)
+# and role, as "requests/period"; a role missing from a scope uses its
+# 'default' rate, and None means unlimited. Over the limit the API answers
+# 429 with Retry-After. Buckets are shared through CACHES.
+THROTTLE_ENABLED = True
+THROTTLE_RATES = {
+    'default': {
+        'anonymous': '30/min',
+        'customer': '120/min',
+        'staff': '300/min',
+        'manager': '600/min',
+        'super_manager': '600/min',
+        'admin': '600/min',
+    },
+    # polled by tracking widgets and partner integrations
+    'track-shipment': {'customer': '60/min'},
+    # full table dumps; use the change feed for syncing
+    'all-shipments': {'admin': '30/min', 'super_manager': '30/min'},
+}
+
+# How long a response stored under an Idempotency-Key is replayed (courier.idempotency)
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
+# Responses smaller than this are sent uncompressed (courier.middleware.CompressionMiddleware)
+RESPONSE_COMPRESSION_MIN_BYTES = 1024
+
 
 # settings.py
 CORS_ALLOWED_ORIGINS = [
@@ -139,3 +204,38 @@ CORS_ALLOWED_ORIGINS = [
 
 # or allow all origins during dev (not recommended for production)
 # CORS_ALLOW_ALL_ORIGINS = True
+
+# Per-request timing (Server-Timing header) and the /api/metrics/ endpoint.
+# Without PERF_METRICS_TOKEN only INTERNAL_IPS may scrape (anyone under DEBUG).
+# Server-Timing goes to INTERNAL_IPS and admins unless made public.
+PERF_METRICS_ENABLED = True
+PERF_METRICS_TOKEN = None
+PERF_SERVER_TIMING_PUBLIC = False
+INTERNAL_IPS = ['127.0.0.1']
+
+# Query budgets declared with courier.querycheck.query_budget raise instead of
+# logging when exceeded. The test suite turns this on (courier.tests) so N+1
+# regressions fail tests.
+QUERY_BUDGET_STRICT = False
+
+# Change feed (courier.changefeed). Entries older than the retention are
+# purged by the purge_change_log command; clients with an older cursor get
+# 410 and resync in full. SQLite commits ids in order; with a concurrent
+# database set the settle delay above the longest write transaction.
+CHANGE_FEED_RETENTION_DAYS = 30
+CHANGE_FEED_SETTLE_SECONDS = 0
+
+# ETA tables (courier.eta). Each refresh stops at the first delivery recorded
+# in the last ETA_SETTLE_SECONDS, so none commits behind its watermark; keep
+# it above the longest write transaction (0 reads everything committed).
+ETA_SETTLE_SECONDS = 60
+
+# Background jobs (courier.jobs). By default they run on a worker thread of
+# the web process; set JOBS_IN_PROCESS = False to leave them to a separate
+# `manage.py run_jobs` worker. Finished exports are written to EXPORT_ROOT,
+# which is not served directly (downloads go through the API), and deleted
+# after EXPORT_RETENTION_HOURS.
+JOBS_IN_PROCESS = True
+JOBS_WORKERS = 1
+EXPORT_ROOT = BASE_DIR / 'exports'
+EXPORT_RETENTION_HOURS = 24